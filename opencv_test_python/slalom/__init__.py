@@ -0,0 +1,62 @@
+"""
+Cone/obstacle detection and path planning for the slalom car, importable without side effects.
+
+Nothing is loaded up front: every name below imports its submodule on first access, so a planner-only worker never
+pays for OpenCV and no module opens windows or configures logging.
+"""
+import importlib
+
+_EXPORTS = {
+    "Rectangle": "geometry",
+    "GridRectangle": "grid",
+    "Grid": "grid",
+    "Pathfinding": "planner",
+    "CostMap": "costs",
+    "cost_map": "costs",
+    "ClusterGraph": "hierarchical",
+    "HierarchicalPathfinding": "hierarchical",
+    "JumpPointPathfinding": "jump_point",
+    "KinematicPathfinding": "kinematic",
+    "ThetaStarPathfinding": "any_angle",
+    "QuadTree": "quadtree",
+    "AnytimePathfinding": "anytime",
+    "FlowField": "flow_field",
+    "FlowFieldPathfinding": "flow_field",
+    "flow_field": "flow_field",
+    "QuadtreePathfinding": "quadtree",
+    "LegCache": "leg_cache",
+    "LegPool": "parallel_legs",
+    "FrameScheduler": "scheduler",
+    "Calibration": "calibration",
+    "HSVCalibrator": "hsv_calibration",
+    "ResultsPublisher": "results_server",
+    "FrameResult": "detector",
+    "Pipeline": "detector",
+    "Profiler": "instrumentation",
+    "StatsWriter": "instrumentation",
+    "NULL_PROFILER": "instrumentation",
+    "MJPEGStream": "mjpeg_stream",
+    "FrameCache": "frame_cache",
+    "StageCache": "stage_cache",
+    "Snapshot": "snapshot",
+    "SnapshotWriter": "snapshot",
+    "RunRecorder": "recording",
+    "RunReader": "recording",
+    "FrameBus": "frame_bus",
+    "BusCapture": "frame_bus",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module("." + module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,141 @@
+"""
+Any-angle planning (Lazy Theta*) on the occupancy array.
+
+A node may take any earlier node it can see as its parent, so legs come back as a handful of corner points joined
+by straight segments instead of a staircase of cells. Lazy Theta* assumes the grandparent is visible when a
+neighbour is pushed and only checks the line of sight once the node is expanded, about one check per expansion.
+
+Steps cost their euclidean length in pixels plus the cell layer of costs.cost_map() for the cell they end in, so
+AVOID cells are passable at their graded penalty. Segments only see through cells that cost nothing, anything dearer
+is crossed cell by cell and paid for. Headings are free: the turn table does not apply to a path that no longer
+follows the 8 grid directions.
+"""
+import copy
+import heapq
+import logging
+from math import atan2, degrees, hypot
+
+import numpy as np
+
+from .costs import INFINITY, cost_map
+from .grid import GridRectangle
+from .instrumentation import NULL_PROFILER
+from .planner import Pathfinding
+
+log = logging.getLogger(__name__)
+
+STEPS = ((0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1))
+
+
+def line_of_sight(clear, a, b):
+    """
+    :param clear: bool array [y, x]
+    :param a: (x, y) cell
+    :param b: (x, y) cell
+    :return: True when every cell the segment between the two cell centres touches is clear, the two end cells aside
+    """
+    steps = 2 * max(abs(b[0] - a[0]), abs(b[1] - a[1])) + 1
+    t = np.linspace(0.0, 1.0, steps)
+    xs = np.rint(a[0] + t * (b[0] - a[0])).astype(np.intp)
+    ys = np.rint(a[1] + t * (b[1] - a[1])).astype(np.intp)
+    inner = ~(((xs == a[0]) & (ys == a[1])) | ((xs == b[0]) & (ys == b[1])))
+    return bool(clear[ys[inner], xs[inner]].all())
+
+
+def heading(a, b):
+    """
+    :return: the GridRectangle heading closest to the direction from cell a to cell b
+    """
+    # image y grows downwards, N is 0 and the headings go clockwise in 45° steps
+    angle = degrees(atan2(b[0] - a[0], a[1] - b[1])) % 360
+    return GridRectangle.N + 10 * (int(round(angle / 45)) % 8)
+
+
+class ThetaStarPathfinding(Pathfinding):
+    """
+    Pathfinding returning each leg as a short polyline of corner cells
+    """
+
+    def __init__(self, grid, waypoints, profiler=NULL_PROFILER, cache=None):
+        super().__init__(grid, waypoints, profiler, cache)
+        costs = cost_map(grid)
+        self.costs = costs.cells
+        self.clear = np.array(costs.cells).reshape(grid.columns, grid.rows) == 0
+
+    def distance(self, a, b):
+        return self.grid.grid_size * hypot(a[0] - b[0], a[1] - b[1])
+
+    def neighbors(self, cell):
+        x, y = cell
+        for dx, dy in STEPS:
+            nx, ny = x + dx, y + dy
+            if 0 <= ny < self.grid.columns and 0 <= nx < self.grid.rows and \
+                    self.costs[ny * self.grid.rows + nx] != INFINITY:
+                yield nx, ny
+
+    def search(self, start, goal):
+        log.info("Finding any-angle path from {} to {}".format(start, goal))
+        start_cell, goal_cell = start.coordinates, goal.coordinates
+        cost_so_far = {start_cell: 0}
+        parent = {start_cell: start_cell}
+        closed = set()
+        frontier = [(0, start_cell)]
+        pushes = 1
+        expanded = 0
+        sight_checks = 0
+        current = start_cell
+
+        while frontier:
+            _, current = heapq.heappop(frontier)
+            if current in closed:
+                continue
+            # the lazy part: the parent was assumed visible when current got pushed
+            if parent[current] != current:
+                sight_checks += 1
+                if not line_of_sight(self.clear, parent[current], current):
+                    entered = self.costs[current[1] * self.grid.rows + current[0]]
+                    candidates = [(cost_so_far[n] + self.distance(n, current) + entered, n)
+                                  for n in self.neighbors(current) if n in closed]
+                    cost_so_far[current], parent[current] = min(candidates)
+            if current == goal_cell:
+                break
+            closed.add(current)
+            expanded += 1
+
+            origin = parent[current]
+            for next in self.neighbors(current):
+                if next in closed:
+                    continue
+                entered = self.costs[next[1] * self.grid.rows + next[0]]
+                new_cost = cost_so_far[origin] + self.distance(origin, next) + entered
+                if next not in cost_so_far or new_cost < cost_so_far[next]:
+                    cost_so_far[next] = new_cost
+                    parent[next] = origin
+                    heapq.heappush(frontier, (new_cost + self.distance(next, goal_cell), next))
+                    pushes += 1
+
+        self.profiler.count("nodes_expanded", expanded)
+        self.profiler.count("heap_pushes", pushes)
+        self.profiler.count("sight_checks", sight_checks)
+        return self.polyline(parent, cost_so_far, current, start)
+
+    def joins(self, finish, step):
+        # headings are free
+        return True
+
+    def polyline(self, parent, cost_so_far, finish, start):
+        """
+        :return: search()'s (came_from, cost, finish), came_from only holds the corners of the leg
+        """
+        corners = [finish]
+        while parent[corners[-1]] != corners[-1]:
+            corners.append(parent[corners[-1]])
+        corners.reverse()
+        came_from = {start: None}
+        previous = start
+        for a, (x, y) in zip(corners, corners[1:]):
+            rect = copy.copy(self.grid.grid[y][x])
+            rect.direction = heading(a, (x, y))
+            came_from[rect] = previous
+            previous = rect
+        return came_from, {previous: cost_so_far[finish]}, previous
@@ -0,0 +1,223 @@
+"""
+Anytime planning (ARA*) against a per-frame deadline.
+
+ARA* runs weighted A* with the heuristic inflated by epsilon, which finds a path fast that costs at most epsilon
+times the optimum, then lowers epsilon step by step and repairs the search instead of starting over: states whose cost
+dropped after they were expanded wait in INCONS and go back into OPEN for the next, less inflated, round. Each round
+stops as soon as nothing in OPEN can beat the path it has.
+
+The planner is handed a deadline for the whole frame; every leg gets an equal share of what is left of it when it
+starts. The first, most inflated, round always runs until it has a path, later ones stop when time is up. The leg
+returns the best path found so far, and the search itself is kept in the planner cache: while the next frame plans the
+same leg on a grid with the same costs, the search picks up where it stopped and keeps improving the path frame after
+frame until epsilon reaches 1.
+
+Every finish rect carries .suboptimality, the proven bound on path cost / optimal cost, the smaller of epsilon and
+the path cost over the lowest g + h still in OPEN or INCONS. A leg whose goal cannot be reached comes back as far as
+its search got, bound INFINITY. Legs with a bound above 1 are not put into the leg cache.
+
+States and costs are those of Pathfinding.search, (cell, heading) on costs.cost_map().
+"""
+import heapq
+import logging
+import time
+from math import hypot
+
+from .costs import HEADINGS, INFINITY, START_TURN, cost_map, heading_index
+from .instrumentation import NULL_PROFILER
+from .planner import Pathfinding
+
+log = logging.getLogger(__name__)
+
+INITIAL_EPSILON = 3.0
+EPSILON_STEP = 0.5
+CHECK_EVERY = 64  # expansions between looks at the clock
+
+
+class AnytimeSearch:
+    """
+    ARA* state of one leg, kept between frames
+    """
+
+    def __init__(self, costs, grid_size, start_state, goal):
+        self.costs = costs
+        self.grid_size = grid_size
+        self.goal = goal
+        self.epsilon = INITIAL_EPSILON
+        self.g = {start_state: 0}
+        self.came_from = {start_state: None}
+        self.open = {start_state}
+        self.closed = set()
+        self.incons = set()
+        self.heap = []
+        self.pushes = 0
+        self.best = None  # goal state of the best path so far
+        self.bound = INFINITY
+        self.done = False
+        self._rebuild_heap()
+
+    def h(self, state):
+        return self.grid_size * hypot(self.goal[0] - state[0], self.goal[1] - state[1])
+
+    def key(self, state):
+        return self.g[state] + self.epsilon * self.h(state)
+
+    def _rebuild_heap(self):
+        self.heap = []
+        for state in self.open:
+            self.heap.append((self.key(state), self.pushes, state))
+            self.pushes += 1
+        heapq.heapify(self.heap)
+
+    def best_cost(self):
+        return INFINITY if self.best is None else self.g[self.best]
+
+    def successors(self, state):
+        costs = self.costs
+        x, y, h = state
+        rows, columns = costs.rows, costs.columns
+        for nh, turn in ([(k, START_TURN) for k in range(len(HEADINGS))] if h is None else costs.successors[h]):
+            dx, dy = HEADINGS[nh]
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < rows and 0 <= ny < columns:
+                cost = costs.steps[nh] + costs.cells[ny * rows + nx] + turn
+                if cost != INFINITY:
+                    yield (nx, ny, nh), cost
+
+    def improve(self, deadline):
+        """
+        One ARA* round at the current epsilon
+        :return: False when the deadline hit before the round was over, it is not looked at before there is a path
+        """
+        expanded = 0
+        while self.heap:
+            key, _, state = self.heap[0]
+            if state not in self.open or key != self.key(state):
+                heapq.heappop(self.heap)
+                continue
+            if key >= self.best_cost():
+                break
+            heapq.heappop(self.heap)
+            self.open.discard(state)
+            self.closed.add(state)
+            expanded += 1
+            if expanded % CHECK_EVERY == 0 and self.best is not None and time.perf_counter() > deadline:
+                self.expanded += expanded
+                return False
+            g = self.g[state]
+            for next, cost in self.successors(state):
+                new_cost = g + cost
+                if new_cost < self.g.get(next, INFINITY):
+                    self.g[next] = new_cost
+                    self.came_from[next] = state
+                    if next[:2] == self.goal and new_cost < self.best_cost():
+                        self.best = next
+                    if next in self.closed:
+                        self.incons.add(next)
+                    else:
+                        self.open.add(next)
+                        heapq.heappush(self.heap, (self.key(next), self.pushes, next))
+                        self.pushes += 1
+        self.expanded += expanded
+        return True
+
+    def lower_bound(self):
+        """
+        :return: lowest g + h over OPEN and INCONS, nothing cheaper than that can reach the goal
+        """
+        return min((self.g[s] + self.h(s) for s in self.open | self.incons), default=INFINITY)
+
+    def run(self, deadline):
+        """
+        Improve until epsilon reaches 1 or the deadline hits
+        :return: expansions of this call
+        """
+        self.expanded = 0
+        while not self.done:
+            finished = self.improve(deadline)
+            best = self.best_cost()
+            if best != INFINITY:
+                # a finished round proves epsilon, the earlier bounds still hold since best only went down
+                lower = self.lower_bound()
+                self.bound = min(self.bound, best / lower if lower < best else 1.0)
+                if finished:
+                    self.bound = min(self.bound, self.epsilon)
+            if not finished:
+                break
+            if self.epsilon <= 1.0:
+                self.done = True
+                break
+            # next round: less inflation, the inconsistent states get another go
+            self.epsilon = max(1.0, self.epsilon - EPSILON_STEP)
+            self.open |= self.incons
+            self.incons = set()
+            self.closed = set()
+            self._rebuild_heap()
+            if time.perf_counter() > deadline:
+                break
+        return self.expanded
+
+    def path(self):
+        """
+        :return: states from the start to the best goal state, or to the state closest to the goal when there is none
+        """
+        state = self.best
+        if state is None:
+            state = min(self.g, key=self.h)
+        states = []
+        while state is not None:
+            states.append(state)
+            state = self.came_from[state]
+        states.reverse()
+        return states
+
+
+class AnytimePathfinding(Pathfinding):
+    """
+    Pathfinding that returns the best path it has by the deadline and keeps improving it over the next frames
+    """
+
+    def __init__(self, grid, waypoints, profiler=NULL_PROFILER, cache=None, deadline=None):
+        """
+        :param deadline: seconds all legs of this frame may take together, None runs every leg to epsilon 1
+        """
+        super().__init__(grid, waypoints, profiler, cache)
+        self.deadline = None if deadline is None else time.perf_counter() + deadline
+        self.legs_left = max(len(waypoints) - 1, 1)
+        # a search can only be resumed on the same costs: the same grid at the same version, or a grid of the next
+        # frame that holds the same codes and costs
+        cached = self.cache.get("anytime")
+        costs = (grid.x, grid.y, grid.grid_size, grid.rows, grid.columns, bytes(grid.cells), tuple(grid.cost_layers),
+                 grid.turn_costs)
+        if cached is not None and (cached[0] is grid and cached[1] == grid.version or cached[2] == costs):
+            self.searches = cached[3]
+        else:
+            self.searches = {}
+        # searches not asked for in this frame are dropped
+        self.used = {}
+        self.cache["anytime"] = (grid, grid.version, costs, self.used)
+
+    def search(self, start, goal):
+        log.info("Finding anytime path from {} to {}".format(start, goal))
+        start_state = start.coordinates + (heading_index(start.direction),)
+        key = (start_state, goal.coordinates)
+        search = self.searches.get(key)
+        if search is None:
+            search = AnytimeSearch(cost_map(self.grid), self.grid.grid_size, start_state, goal.coordinates)
+        self.used[key] = search
+
+        if self.deadline is None:
+            leg_deadline = INFINITY
+        else:
+            now = time.perf_counter()
+            leg_deadline = now + max(self.deadline - now, 0) / self.legs_left
+        self.legs_left = max(self.legs_left - 1, 1)
+        pushes = search.pushes
+        self.profiler.count("nodes_expanded", search.run(leg_deadline))
+        self.profiler.count("heap_pushes", search.pushes - pushes)
+
+        states = search.path()
+        came_from, finish = self.chain([state[:2] for state in states], start)
+        finish.suboptimality = search.bound if search.best is not None else INFINITY
+        log.debug("epsilon {} bound {}".format(search.epsilon, finish.suboptimality))
+        return came_from, {finish: search.g[states[-1]]}, finish
@@ -0,0 +1,245 @@
+import numpy as np
+import json
+import logging
+import sys
+
+from .detector import Pipeline
+from .instrumentation import Profiler
+from .planner import Pathfinding
+from .synthetic_arena import course_capacity, generate_arena
+
+log = logging.getLogger(__name__)
+
+
+def full_course(resolution, cone_size, spacing=1.0):
+    """
+    :return: generate_arena keyword arguments for as many gates as fit the frame at that cone size
+    """
+    per_row, rows = course_capacity(resolution, cone_size, spacing)
+    return dict(n_gates=per_row * rows, resolution=resolution, cone_size=cone_size, spacing=spacing)
+
+
+RESOLUTIONS = ((640, 480), (960, 720), (1280, 960), (1920, 1440))
+# fixed cone size for the resolution sweep: the course fills the frame, so the grid grows with the pixel count
+# instead of the cones growing with the image
+SWEEP_CONE_SIZE = 16
+
+# (name, varied parameter, list of generate_arena keyword arguments)
+SWEEPS = {
+    "gates": ("gates", [dict(n_gates=n, resolution=(1280, 960)) for n in (2, 4, 8, 16, 24)]),
+    "resolution": ("pixels", [full_course(r, SWEEP_CONE_SIZE) for r in RESOLUTIONS]),
+    # above ~10 the speckles pass the noise filter as cones and the pairing invents gates all over the floor
+    "noise": ("noise", [dict(n_gates=4, resolution=(640, 480), noise=n) for n in (0, 2, 5, 10)]),
+}
+
+# scenes every planner is run over by compare_planners
+PLANNER_SCENES = [dict(n_gates=n, resolution=(640, 480), n_obstacles=o) for n, o in ((3, 0), (4, 1), (5, 2), (6, 3))]
+
+# small cones spread over a large frame: a grid of about 580x500 cells with 19 long legs, the case the hierarchical
+# planner is meant for. Every frame of the run is shifted by a few pixels like a shaking camera, so the grid bounds
+# move between frames the way they do live
+LARGE_SCENE = full_course((2000, 2000), 8, spacing=6)
+LARGE_PLANNERS = ("hpa", "astar")
+
+TIMED = ["total"] + [stage for stage in Pipeline.STAGES if stage != "draw"]
+
+
+def run_scene(scene, repeats=5, seed=0):
+    """
+    Generate one arena and push it through the headless pipeline repeats times
+    :param scene: generate_arena keyword arguments
+    :return: dict with the scene description, median stage times in ms, counters and detection quality
+    """
+    img, truth = generate_arena(seed=seed, **scene)
+    profiler = Profiler(Pipeline.STAGES, Pipeline.COUNTERS, window=repeats)
+    pipeline = Pipeline(profiler)
+    pipeline.planner_cache.pop("legs")  # the repeats would only time the leg cache
+    result = None
+    for _ in range(repeats):
+        profiler.frame_start()
+        result = pipeline.process(img)
+        profiler.frame_end()
+
+    row = {
+        "gates": len(truth.gates),
+        "pixels": img.shape[0] * img.shape[1],
+        "resolution": "{}x{}".format(img.shape[1], img.shape[0]),
+        "noise": scene.get("noise", 0),
+        "cone_size": truth.cone_size,
+        "cells": result.grid.rows * result.grid.columns if result.grid else 0,
+        "cones_found": len(result.cones),
+        "cones_truth": len(truth.cones),
+        "gates_found": len(result.pairs),
+        "legs": max(len(result.waypoints) - 1, 0),
+        "failed_legs": failed_legs(result),
+    }
+    for stage in TIMED:
+        row[stage + "_ms"] = float(profiler.percentiles(stage + "_ms", 50))
+    for counter in Pipeline.COUNTERS:
+        row[counter] = int(profiler.percentiles(counter, 50))
+    return row
+
+
+def failed_legs(result):
+    """
+    :return: number of legs of a FrameResult whose search gave up before reaching the next waypoint
+    """
+    if not result.paths or result.paths == (None, None):
+        return 0
+    failed = 0
+    for (came_from, finish), waypoint in zip(result.paths, result.waypoints[1:]):
+        if finish.coordinates != result.grid.get_index_from_position(waypoint.x, waypoint.y):
+            failed += 1
+    return failed
+
+
+def path_length(paths):
+    """
+    :return: (length in px, number of corners) over all legs of FrameResult.paths
+    """
+    length, corners = 0.0, 0
+    if paths and paths != (None, None):
+        for came_from, finish in paths:
+            rects = Pathfinding.reconstruct(came_from, finish)
+            length += sum(a.distance(b) for a, b in zip(rects, rects[1:]))
+            corners += len(rects)
+    return length, corners
+
+
+def compare_planners(scenes, repeats=3):
+    """
+    Run every Pipeline.PLANNERS mode over the same scenes
+    :return: one row per planner with the summed path length, corners and the median astar time per scene
+    """
+    rows = []
+    frames = [generate_arena(seed=i, **scene)[0] for i, scene in enumerate(scenes)]
+    for planner in Pipeline.PLANNERS:
+        profiler = Profiler(Pipeline.STAGES, Pipeline.COUNTERS, window=repeats)
+        pipeline = Pipeline(profiler)
+        pipeline.planner_cache.pop("legs")  # the repeats would only time the leg cache
+        pipeline.planner = planner
+        row = {"planner": planner, "length": 0.0, "corners": 0, "astar_ms": 0.0, "nodes_expanded": 0}
+        for frame in frames:
+            result = None
+            for _ in range(repeats):
+                profiler.frame_start()
+                result = pipeline.process(frame)
+                profiler.frame_end()
+            length, corners = path_length(result.paths)
+            row["length"] += length
+            row["corners"] += corners
+            row["astar_ms"] += float(profiler.percentiles("astar_ms", 50))
+            row["nodes_expanded"] += int(profiler.percentiles("nodes_expanded", 50))
+        rows.append(row)
+    return rows
+
+
+def print_planners(rows):
+    print("\n== planners ==")
+    print("{:>8} {:>10} {:>8} {:>10} {:>10}".format("planner", "length", "corners", "astar_ms", "expanded"))
+    for row in rows:
+        print("{:>8} {:>10.0f} {:>8} {:>10.2f} {:>10}".format(row["planner"], row["length"], row["corners"],
+                                                             row["astar_ms"], row["nodes_expanded"]))
+
+
+def run_large_scene(planners=LARGE_PLANNERS, frames=4, seed=0):
+    """
+    Drive the real Pipeline over consecutive frames of LARGE_SCENE, once per planner
+    :return: one row per planner and frame with the grid size, stage times in ms and the planner counters
+    """
+    img = generate_arena(seed=seed, **LARGE_SCENE)[0]
+    rows = []
+    for planner in planners:
+        profiler = Profiler(Pipeline.STAGES, Pipeline.COUNTERS, window=frames)
+        pipeline = Pipeline(profiler)
+        pipeline.planner = planner
+        for i in range(frames):
+            frame = np.roll(img, (3 * i, 2 * i), axis=(0, 1))
+            profiler.frame_start()
+            result = pipeline.process(frame)
+            record = profiler.frame_end()
+            row = {"planner": planner, "frame": i, "legs": max(len(result.waypoints) - 1, 0),
+                   "failed_legs": failed_legs(result),
+                   "grid": "{}x{}".format(result.grid.rows, result.grid.columns) if result.grid else "-"}
+            for stage in TIMED:
+                row[stage + "_ms"] = record.get(stage + "_ms", 0.0)
+            for counter in ("nodes_expanded", "clusters_rebuilt"):
+                row[counter] = record.get(counter, 0)
+            rows.append(row)
+    return rows
+
+
+def print_large_scene(rows):
+    print("\n== large scene ==")
+    print("{:>8} {:>5} {:>8}".format("planner", "frame", "grid") + "".join("{:>13}".format(s) for s in TIMED) +
+          "{:>10} {:>9} {:>7}".format("expanded", "clusters", "failed"))
+    for row in rows:
+        print("{:>8} {:>5} {:>8}".format(row["planner"], row["frame"], row["grid"]) +
+              "".join("{:>13.2f}".format(row[stage + "_ms"]) for stage in TIMED) +
+              "{:>10} {:>9} {:>3}/{:<3}".format(row["nodes_expanded"], row["clusters_rebuilt"], row["failed_legs"],
+                                                row["legs"]))
+
+
+def scaling_exponent(xs, ys):
+    """
+    Slope of log(y) over log(x): 1 means linear, 2 quadratic, ...
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    valid = (xs > 0) & (ys > 0)
+    if valid.sum() < 2:
+        return float("nan")
+    return float(np.polyfit(np.log(xs[valid]), np.log(ys[valid]), 1)[0])
+
+
+def run_sweep(name, repeats=5):
+    variable, scenes = SWEEPS[name]
+    rows = [run_scene(scene, repeats) for scene in scenes]
+    exponents = {}
+    for stage in TIMED:
+        exponents[stage] = scaling_exponent([row[variable] for row in rows], [row[stage + "_ms"] for row in rows])
+    return rows, exponents
+
+
+def print_sweep(name, rows, exponents):
+    variable = SWEEPS[name][0]
+    print("\n== {} sweep ==".format(name))
+    header = "{:>10} {:>6} {:>6} {:>7}".format("resolution", "gates", "noise", "cells") + \
+             "".join("{:>13}".format(stage) for stage in TIMED) + \
+             "{:>10} {:>7} {:>7}".format("expanded", "cones", "failed")
+    print(header)
+    for row in rows:
+        print("{:>10} {:>6} {:>6} {:>7}".format(row["resolution"], row["gates"], row["noise"], row["cells"]) +
+              "".join("{:>13.2f}".format(row[stage + "_ms"]) for stage in TIMED) +
+              "{:>10} {:>3}/{:<3} {:>3}/{:<3}".format(row["nodes_expanded"], row["cones_found"], row["cones_truth"],
+                                                      row["failed_legs"], row["legs"]))
+    print("{:>32}".format("scaling exponent vs {}".format(variable)) +
+          "".join("{:>13.2f}".format(exponents[stage]) for stage in TIMED))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    # the planner logs every leg on INFO
+    logging.getLogger("slalom").setLevel(logging.WARNING)
+    if len(sys.argv) > 1 and sys.argv[1] not in list(SWEEPS) + ["all", "planners", "large"]:
+        print("Usage: python -m slalom.benchmark [gates|resolution|noise|planners|large|all] [repeats] "
+              "[ResultJsonPath]")
+        exit()
+    sweeps = list(SWEEPS) if len(sys.argv) <= 1 or sys.argv[1] == "all" else [sys.argv[1]]
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    results = {}
+    if "planners" in sweeps:
+        sweeps.remove("planners")
+        results["planners"] = compare_planners(PLANNER_SCENES, repeats)
+        print_planners(results["planners"])
+    if "large" in sweeps:
+        sweeps.remove("large")
+        results["large"] = run_large_scene(frames=repeats)
+        print_large_scene(results["large"])
+    for sweep in sweeps:
+        rows, exponents = run_sweep(sweep, repeats)
+        print_sweep(sweep, rows, exponents)
+        results[sweep] = {"rows": rows, "scaling": exponents}
+    if len(sys.argv) > 3:
+        with open(sys.argv[3], "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,204 @@
+"""
+Camera calibration: lens undistortion and a ground-plane homography folded into one cached cv2.remap.
+
+The camera looks at the arena at an angle, so a cone far away covers fewer pixels than one close by, and the grid cell
+size had to be guessed from the cones seen in every frame. A Calibration maps the frame onto a top-down view of the
+floor at a fixed mm_per_pixel instead, sizes there are real sizes and the planning grid can be the same every frame.
+
+It is computed once:
+
+- calibrate_lens() finds the camera matrix and distortion coefficients from chessboard images, without them the lens
+  is taken as distortion free
+- Calibration.from_ground_points() fits the homography from the undistorted image to the floor through four or more
+  points whose position on the floor is known in mm, e.g. the corners of the arena
+
+For every pixel of the top-down image the source pixel is found by going back through the homography and then forward
+through the lens model (cv2.projectPoints). Both maps are built once and converted to the fixed-point CV_16SC2 form
+cv2.remap reads fastest, warp() is then a single remap per frame. save() stores the calibration with its maps, load()
+reads them back without building them again.
+
+python -m slalom.calibration calibration.json out.npz computes one from a description like:
+
+    {"image_size": [640, 480], "mm_per_pixel": 2.0, "margin_mm": 50,
+     "image_points": [[102, 80], ...], "ground_points_mm": [[0, 0], ...],
+     "chessboard": {"images": "calibration/*.jpg", "pattern": [9, 6], "square_mm": 25}}
+
+where "chessboard" is optional.
+"""
+import glob
+import json
+import logging
+import sys
+from math import ceil
+
+import cv2
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+def calibrate_lens(images, pattern=(9, 6), square_mm=25.0):
+    """
+    :param images: BGR or grayscale images of a chessboard, the more angles the better
+    :param pattern: inner corners per row and column
+    :param square_mm: side of one square
+    :return: (camera matrix, distortion coefficients, RMS reprojection error in pixels)
+    """
+    board = np.zeros((pattern[0] * pattern[1], 3), np.float32)
+    board[:, :2] = np.mgrid[0:pattern[0], 0:pattern[1]].T.reshape(-1, 2) * square_mm
+    object_points, image_points = [], []
+    size = None
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+    for image in images:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        size = gray.shape[::-1]
+        found, corners = cv2.findChessboardCorners(gray, pattern)
+        if not found:
+            continue
+        object_points.append(board)
+        image_points.append(cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), criteria))
+    if not object_points:
+        raise ValueError("No chessboard with {} inner corners found".format(pattern))
+    log.info("Chessboard found in {} images".format(len(object_points)))
+    rms, camera_matrix, dist_coeffs, _, _ = cv2.calibrateCamera(object_points, image_points, size, None, None)
+    return camera_matrix, dist_coeffs.ravel(), rms
+
+
+def default_camera_matrix(image_size):
+    """
+    :return: pinhole camera matrix with the principal point in the middle, all a distortion free lens needs
+    """
+    width, height = image_size
+    focal = float(max(width, height))
+    return np.array([[focal, 0, width / 2.0], [0, focal, height / 2.0], [0, 0, 1]])
+
+
+class Calibration:
+    """
+    Frame to top-down floor view, see the module docstring
+    """
+
+    def __init__(self, camera_matrix, dist_coeffs, homography, image_size, output_size, mm_per_pixel, origin_mm=(0, 0),
+                 maps=None):
+        """
+        :param homography: undistorted frame pixels to top-down pixels
+        :param image_size: (width, height) of the camera frames
+        :param output_size: (width, height) of the top-down image
+        :param mm_per_pixel: floor mm per top-down pixel
+        :param origin_mm: floor position of the top-down pixel (0, 0)
+        :param maps: the fixed-point remap maps when they are known already
+        """
+        self.camera_matrix = np.asarray(camera_matrix, dtype=np.float64)
+        self.dist_coeffs = np.asarray(dist_coeffs, dtype=np.float64).ravel()
+        self.homography = np.asarray(homography, dtype=np.float64)
+        self.image_size = tuple(int(v) for v in image_size)
+        self.output_size = tuple(int(v) for v in output_size)
+        self.mm_per_pixel = float(mm_per_pixel)
+        self.origin_mm = tuple(float(v) for v in origin_mm)
+        self._maps = maps
+
+    @classmethod
+    def from_ground_points(cls, image_points, ground_points_mm, image_size, mm_per_pixel=2.0, margin_mm=0,
+                           camera_matrix=None, dist_coeffs=None):
+        """
+        :param image_points: (x, y) frame pixels of four or more marks on the floor
+        :param ground_points_mm: (x, y) floor positions of the same marks in mm
+        :param margin_mm: floor shown around the marks
+        :param camera_matrix: from calibrate_lens(), None for a distortion free lens
+        """
+        if camera_matrix is None:
+            camera_matrix = default_camera_matrix(image_size)
+        if dist_coeffs is None:
+            dist_coeffs = np.zeros(5)
+        image_points = np.asarray(image_points, dtype=np.float64).reshape(-1, 1, 2)
+        ground = np.asarray(ground_points_mm, dtype=np.float64).reshape(-1, 2)
+        if len(ground) < 4 or len(ground) != len(image_points):
+            raise ValueError("Need four or more image and ground point pairs, got {} and {}".format(
+                len(image_points), len(ground)))
+        undistorted = cv2.undistortPoints(image_points, camera_matrix, dist_coeffs, P=camera_matrix).reshape(-1, 2)
+        origin = ground.min(axis=0) - margin_mm
+        extent = ground.max(axis=0) + margin_mm - origin
+        homography, _ = cv2.findHomography(undistorted, (ground - origin) / mm_per_pixel)
+        if homography is None:
+            raise ValueError("Ground points are degenerate, no homography fits them")
+        output_size = (int(ceil(extent[0] / mm_per_pixel)), int(ceil(extent[1] / mm_per_pixel)))
+        return cls(camera_matrix, dist_coeffs, homography, image_size, output_size, mm_per_pixel, origin)
+
+    def _build_maps(self):
+        width, height = self.output_size
+        u, v = np.meshgrid(np.arange(width, dtype=np.float64), np.arange(height, dtype=np.float64))
+        top_down = np.stack([u.ravel(), v.ravel(), np.ones(u.size)])
+        # back through the homography to undistorted frame pixels, then to normalized camera coordinates
+        undistorted = np.linalg.inv(self.homography).dot(top_down)
+        normalized = np.linalg.inv(self.camera_matrix).dot(undistorted / undistorted[2])
+        rays = normalized.T.reshape(-1, 1, 3)
+        # forward through the lens model to where the frame actually has that point
+        source, _ = cv2.projectPoints(rays, np.zeros(3), np.zeros(3), self.camera_matrix, self.dist_coeffs)
+        source = source.reshape(height, width, 2).astype(np.float32)
+        return cv2.convertMaps(source[..., 0], source[..., 1], cv2.CV_16SC2)
+
+    def maps(self):
+        """
+        :return: (map1, map2) for cv2.remap, fixed-point, built on first use
+        """
+        if self._maps is None:
+            self._maps = self._build_maps()
+        return self._maps
+
+    def warp(self, image):
+        """
+        :return: top-down view of a camera frame, pixels off the frame are black
+        """
+        map1, map2 = self.maps()
+        return cv2.remap(image, map1, map2, cv2.INTER_LINEAR)
+
+    def cell_pixels(self, cell_mm):
+        """
+        :return: top-down pixels of a grid cell cell_mm wide, at least 1
+        """
+        return max(1, int(round(cell_mm / self.mm_per_pixel)))
+
+    def to_floor(self, x, y):
+        """
+        :return: floor position in mm of a top-down pixel
+        """
+        return self.origin_mm[0] + x * self.mm_per_pixel, self.origin_mm[1] + y * self.mm_per_pixel
+
+    def save(self, path):
+        map1, map2 = self.maps()
+        np.savez(path, camera_matrix=self.camera_matrix, dist_coeffs=self.dist_coeffs, homography=self.homography,
+                 image_size=self.image_size, output_size=self.output_size, mm_per_pixel=self.mm_per_pixel,
+                 origin_mm=self.origin_mm, map1=map1, map2=map2)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["camera_matrix"], data["dist_coeffs"], data["homography"], data["image_size"],
+                       data["output_size"], float(data["mm_per_pixel"]), data["origin_mm"],
+                       (data["map1"], data["map2"]))
+
+
+def main(description_path, out_path):
+    with open(description_path) as f:
+        description = json.load(f)
+    camera_matrix = dist_coeffs = None
+    chessboard = description.get("chessboard")
+    if chessboard:
+        images = [cv2.imread(path) for path in sorted(glob.glob(chessboard["images"]))]
+        camera_matrix, dist_coeffs, rms = calibrate_lens(images, tuple(chessboard.get("pattern", (9, 6))),
+                                                         chessboard.get("square_mm", 25.0))
+        print("lens calibrated, RMS reprojection error {:.3f} px".format(rms))
+    calibration = Calibration.from_ground_points(
+        description["image_points"], description["ground_points_mm"], description["image_size"],
+        description.get("mm_per_pixel", 2.0), description.get("margin_mm", 0), camera_matrix, dist_coeffs)
+    calibration.save(out_path)
+    print("top-down image {}x{} px at {} mm/px written to {}".format(
+        calibration.output_size[0], calibration.output_size[1], calibration.mm_per_pixel, out_path))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 3:
+        print("Usage: python -m slalom.calibration <calibration.json> <out.npz>")
+        sys.exit(1)
+    main(sys.argv[1], sys.argv[2])
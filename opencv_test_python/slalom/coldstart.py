@@ -0,0 +1,59 @@
+import json
+import subprocess
+import sys
+import time
+
+# what a worker has to import before it can start working
+SCENARIOS = [
+    ("interpreter", "pass"),
+    ("package", "import slalom"),
+    ("planner", "from slalom import Grid, Pathfinding; Grid(0, 0, 100, 100, 10)"),
+    ("run reader", "from slalom import RunReader"),
+    ("detector", "from slalom import Pipeline; Pipeline()"),
+    ("frame bus", "from slalom import FrameBus"),
+    ("replay", "from slalom.snapshot import replay"),
+]
+
+# importing any of these means the worker pays for something it should not need
+UNWANTED = {
+    "planner": ["cv2", "numpy"],
+    "package": ["cv2", "numpy"],
+    "run reader": ["cv2"],
+    "frame bus": ["cv2"],
+    "replay": ["cv2"],
+}
+
+
+def measure(statement, runs=5, cwd=None):
+    """
+    Median wall time of a fresh interpreter running statement, plus the modules it ended up loading
+    """
+    code = "{}\nimport sys, json\nprint(json.dumps(sorted(sys.modules)))".format(statement)
+    times = []
+    modules = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", code], cwd=cwd, check=True, stdout=subprocess.PIPE)
+        times.append(time.perf_counter() - start)
+        modules = json.loads(out.stdout.decode().splitlines()[-1])
+    times.sort()
+    return times[len(times) // 2], modules
+
+
+def main(runs=5):
+    print("{:<12} {:>10} {:>10}  {}".format("scenario", "ms", "+ms", "unwanted modules"))
+    baseline = None
+    ok = True
+    for name, statement in SCENARIOS:
+        seconds, modules = measure(statement, runs)
+        if baseline is None:
+            baseline = seconds
+        unwanted = [m for m in UNWANTED.get(name, []) if m in modules]
+        ok = ok and not unwanted
+        print("{:<12} {:>10.1f} {:>10.1f}  {}".format(name, seconds * 1000, (seconds - baseline) * 1000,
+                                                      ", ".join(unwanted) or "-"))
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main(int(sys.argv[1]) if len(sys.argv) > 1 else 5) else 1)
@@ -0,0 +1,145 @@
+"""
+Array cost model of the grid planners.
+
+Grid.cost() used to be called for every edge of a search and looked at attributes of GridRectangle copies. The same
+model is compiled here once per grid into flat lists the searches index directly:
+
+* the cell layer, the cost of entering every cell at y * rows + x. Cones and obstacles are INFINITY. AVOID cells are
+  passable at a graded penalty, AVOID_PENALTY right next to the obstacle falling off over AVOID_RADIUS cells, instead
+  of being as blocked as the obstacle itself
+* the turn table, the cost of changing heading by 0..4 steps of 45°. Changes priced INFINITY are not allowed, the
+  default only allows ±45° per step like Grid.neighbors(directional=True) did
+* the step lengths in pixels, straight and diagonal steps no longer cost the same
+
+Extra layers, lists with one cost per cell like the cell layer, are added onto it when the map is built, so they cost
+nothing per edge. Pure Python on purpose: planner-only workers do not load numpy.
+"""
+import logging
+from math import sqrt
+
+from .grid import GridRectangle
+
+log = logging.getLogger(__name__)
+
+INFINITY = float("inf")
+
+# headings in the order of GridRectangle.N ... NW, one step of each as (dx, dy)
+HEADINGS = ((0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1))
+TURN_COST = 100
+# change of heading by 0, 45, 90, 135 and 180 degrees
+TURN_COSTS = (0, TURN_COST, INFINITY, INFINITY, INFINITY)
+# the first step of a leg that starts without a heading counts as a turn, like Grid.cost() charged it
+START_TURN = TURN_COST
+
+AVOID_PENALTY = 300
+AVOID_RADIUS = 3  # cells, how far add_obstacle() marks AVOID around obstacles
+
+# occupied code -> 1 for the codes with a cost, 0 for FREE and WAYPOINT
+_COSTED = bytes(int(code in (GridRectangle.CONE, GridRectangle.OBSTACLE, GridRectangle.AVOID)) for code in range(256))
+
+
+def heading_index(direction):
+    """
+    :param direction: GridRectangle.N ... NW or None
+    :return: index into HEADINGS, None for None
+    """
+    if direction is None:
+        return None
+    return (direction - GridRectangle.N) // 10
+
+
+def heading_change(a, b):
+    """
+    :return: steps of 45° between two heading indices, 0..4
+    """
+    change = abs(a - b) % 8
+    return min(change, 8 - change)
+
+
+def cell_costs(occupied, rows, columns):
+    """
+    :param occupied: occupied codes, y * rows + x, e.g. Grid.cells
+    :return: list of entry costs, y * rows + x
+    """
+    costs = [0.0] * (rows * columns)
+    frontier = []
+    avoid_cost = AVOID_PENALTY / AVOID_RADIUS
+    # most cells are FREE, bytes.find() skips them in C instead of a loop over every code
+    costed = bytes(occupied).translate(_COSTED)
+    i = costed.find(1)
+    while i >= 0:
+        if occupied[i] == GridRectangle.AVOID:
+            # AVOID cells the walk below does not reach get the smallest penalty
+            costs[i] = avoid_cost
+        else:
+            costs[i] = INFINITY
+            frontier.append(i)
+        i = costed.find(1, i + 1)
+
+    # breadth first out of the obstacles through the AVOID cells, the penalty falls off with the distance
+    seen = set(frontier)
+    for distance in range(1, AVOID_RADIUS + 1):
+        penalty = AVOID_PENALTY * (AVOID_RADIUS + 1 - distance) / AVOID_RADIUS
+        ring = []
+        for i in frontier:
+            y, x = divmod(i, rows)
+            for dx, dy in HEADINGS:
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < rows and 0 <= ny < columns:
+                    n = ny * rows + nx
+                    if n not in seen and occupied[n] == GridRectangle.AVOID:
+                        seen.add(n)
+                        costs[n] = penalty
+                        ring.append(n)
+        frontier = ring
+    return costs
+
+
+class CostMap:
+    """
+    Cell layer, turn table and step lengths of one grid version, see cost_map()
+    """
+
+    def __init__(self, grid, layers=(), turn_costs=TURN_COSTS):
+        """
+        :param grid: Grid to compile
+        :param layers: extra per cell costs, each a sequence indexed y * rows + x
+        :param turn_costs: cost of a change of heading by 0..4 steps of 45°
+        """
+        self.rows = grid.rows
+        self.columns = grid.columns
+        self.version = grid.version
+        self.cells = cell_costs(grid.cells, grid.rows, grid.columns)
+        for layer in layers:
+            if len(layer) != len(self.cells):
+                raise ValueError("Cost layer has {} cells, the grid {}".format(len(layer), len(self.cells)))
+            self.cells = [a + b for a, b in zip(self.cells, layer)]
+        self.turns = tuple(turn_costs)
+        # what the layers add, for caches of results that depend on more than the occupancy, see leg_cache
+        self.layers_key = hash(tuple(hash(tuple(layer)) for layer in layers))
+        # heading -> [(heading, turn cost), ...] allowed for the next step, going straight first
+        changes = [c for c in (0, -1, 1, -2, 2, -3, 3, 4) if self.turns[abs(c)] != INFINITY]
+        self.successors = [[((h + c) % 8, self.turns[abs(c)]) for c in changes] for h in range(8)]
+        self.steps = [grid.grid_size * (sqrt(2) if dx and dy else 1) for dx, dy in HEADINGS]
+        self.flow_fields = {}  # goal cells -> FlowField on this map, see flow_field.flow_field()
+
+    def cost(self, x, y):
+        """
+        :return: cost of entering the cell, INFINITY when it is blocked or off the grid
+        """
+        if 0 <= x < self.rows and 0 <= y < self.columns:
+            return self.cells[y * self.rows + x]
+        return INFINITY
+
+    def passable(self, x, y):
+        return self.cost(x, y) != INFINITY
+
+
+def cost_map(grid):
+    """
+    :return: the CostMap of the grid as it is now, built once per Grid.version
+    """
+    costs = grid.cost_cache
+    if costs is None or costs.version != grid.version:
+        costs = grid.cost_cache = CostMap(grid, grid.cost_layers, grid.turn_costs or TURN_COSTS)
+    return costs
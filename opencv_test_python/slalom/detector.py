@@ -0,0 +1,435 @@
+import cv2
+import numpy as np
+import logging
+import time
+
+from .geometry import Rectangle
+from .grid import Grid
+from .instrumentation import NULL_PROFILER
+from .leg_cache import LegCache
+from .measurements import CONE_WIDTH
+from .parallel_legs import LegPool
+from .planners import PLANNERS, create_planner
+from .stage_cache import (decode_contours, decode_paths, decode_pairs, decode_rects, encode_contours, encode_grid,
+                          encode_pairs, encode_paths, encode_rects, fill_grid)
+
+log = logging.getLogger(__name__)
+
+
+class FrameResult:
+    """
+    Everything the pipeline found in one frame
+    """
+
+    def __init__(self, output, cones, obstacles, pairs, waypoints, grid, paths, image=None, degradation_level=0):
+        self.output = output  # thresholded image
+        self.image = image  # the image everything was found in, the top-down view with a calibration
+        self.cones = cones
+        self.obstacles = obstacles
+        self.pairs = pairs
+        self.waypoints = waypoints
+        self.grid = grid
+        self.paths = paths
+        self.degradation_level = degradation_level  # see scheduler.LEVELS, 0 without a FrameScheduler
+
+
+class Pipeline:
+    """
+    Detection and planning stages of CV without any GUI, parameters default to the trackbar defaults
+    """
+
+    STAGES = ("remap", "hsv", "morphology", "contours", "detect", "pairing", "grid", "add_obstacle", "astar", "draw")
+    COUNTERS = ("contours", "cones", "obstacles", "cells_checked", "cells_rasterized", "nodes_expanded",
+                "heap_pushes", "clusters_rebuilt", "sight_checks", "leg_cache_hits", "leg_cache_misses",
+                "leg_cache_saved_ms", "legs_replanned", "quadtree_leaves")
+    # cell size basis in full resolution pixels when a frame has no cones
+    DEFAULT_CONE_SIZE = 15
+    # planner names, in the order of the Planner trackbar, see planners.create_planner
+    PLANNERS = PLANNERS
+
+    def __init__(self, profiler=NULL_PROFILER):
+        self.hMin, self.sMin, self.vMin = 0, 81, 95
+        self.hMax, self.sMax, self.vMax = 179, 255, 255
+        self.dilSize = self.eroSize = 0
+        self.dist_min, self.dist_max = 4, 7
+        self.min_size = 5
+        self.scale = 1.0  # frames arrive downscaled by this, e.g. MJPEGStream(scale=...), min_size is full resolution
+        # the frame is shrunk to this before thresholding, contours are scaled back to frame pixels and come out about
+        # 1 / detection_scale - 1 pixels smaller
+        self.detection_scale = 1.0
+        # calibration.Calibration, detection and planning then run on its top-down view with a grid of fixed geometry
+        self.calibration = None
+        self.draw_grid = False
+        self.pathfinding = True
+        self.planner = "astar"
+        # state planners keep between frames, "legs" reuses legs whose cells did not change, see leg_cache
+        self.planner_cache = {"legs": LegCache()}
+        self.cell_mm = CONE_WIDTH / 2.0  # grid cell size in mm, measured from the cones every frame
+        # callables grid -> one extra cost per cell (y * rows + x), added to every frame's grid, see Grid.add_cost_layer
+        self.cost_layers = []
+        # seconds the anytime planner may spend on all legs of a frame, None lets it run every leg to the optimum
+        self.planning_deadline = None
+        # perf_counter() time the frame should be done by, see scheduler.FrameScheduler.apply(), planning_deadline is
+        # then set to what is left of it when planning starts
+        self.frame_deadline = None
+        # plan only the first max_legs legs, None plans them all
+        self.max_legs = None
+        # skip planning and hand back the paths of the last planned frame, see scheduler.FrameScheduler
+        self.reuse_path = False
+        # scheduler.LEVELS index the last FrameScheduler.apply() set the pipeline up for, handed on in every FrameResult
+        self.degradation_level = 0
+        self.last_paths = None
+        # 0 plans the legs one after another, more plans them in a LegPool of that many processes
+        self.leg_workers = 0
+        self.leg_pool = None
+        self.grid = None
+        self.calibrated_grid = None  # kept between frames and cleared, only used with a calibration
+        # stage_cache.StageCache, stages whose frame and upstream parameters were seen before are read from it
+        self.stage_cache = None
+        # snapshot.SnapshotWriter, the planning problem of every frame is written to it before the planner runs
+        self.snapshots = None
+        self.profiler = profiler
+
+    def create_planner(self, waypoints):
+        """
+        :return: planner for the current grid, picked by self.planner
+        """
+        return create_planner(self.planner, self.grid, waypoints, self.profiler, self.planner_cache, self.cell_mm,
+                              self.planning_deadline)
+
+    def detect_cones_and_obstacles(self, contours):
+        cones = []
+        obstacles = []
+        for cnt in contours:
+            rect = cv2.minAreaRect(cnt)
+            size = rect[1]  # size
+            # arbitrary minimal size to remove noise
+            min_size = self.min_size * self.scale
+            if size[0] > min_size and size[1] > min_size:
+                # box = cv2.boxPoints(rect)
+                # box = np.int0(box)
+                # if height and width are about the same, it's likely a cone
+                top_left_x = rect[0][0]
+                top_left_y = rect[0][1]
+                rectangle = Rectangle(top_left_x, top_left_y, rect[1][0], rect[1][1], rotation=rect[2], contour=cnt)
+                if size[0] - 5 * self.scale < size[1] < size[0] + 5 * self.scale:
+                    cones.append(rectangle)
+                else:
+                    # otherwise it's just an obstacle
+                    obstacles.append(rectangle)
+        return cones, obstacles
+
+    # check if distance makes cones a valid gate
+    def is_valid_gate_distance(self, cone_1, cone_2, min, max):
+        """
+        Expects rects
+        :param MIN: 
+        :param MAX: 
+        :param cone_1: 
+        :param cone_2: 
+        :return: 
+        """
+        dist = cone_1.distance(cone_2)
+        return min <= dist <= max
+
+    def get_cone_pairs(self, cones, min, max):
+        used_cones = []
+        pairs = []
+        for cone in cones:
+            if cone not in used_cones:
+                best_cone = None
+                best_dist = None
+                for second_cone in cones:
+                    # if they are a valid pair or a better pair than the previously found pair
+                    if cone is not second_cone and second_cone not in used_cones:
+                        if (best_cone is None and self.is_valid_gate_distance(cone, second_cone, min, max)) or \
+                                (best_cone is not None and cone.distance(second_cone) < best_dist):
+                            best_cone = second_cone
+                            best_dist = cone.distance(second_cone)
+                if best_cone is not None:
+                    # we have to draw a line here!
+                    used_cones.append(cone)
+                    used_cones.append(best_cone)
+                    pairs.append((cone, best_cone))
+        return pairs
+
+    def get_gate_waypoints(self, cones):
+        waypoints = []
+        for pair in cones:
+            vector = (pair[1].x - pair[0].x, pair[1].y - pair[0].y)
+            half_vector = (vector[0] / 2, vector[1] / 2)
+            x = pair[0].x + half_vector[0]
+            y = pair[0].y + half_vector[1]
+            waypoint = Rectangle(x-1, y-1, 2, 2)
+            waypoints.append(waypoint)
+        return waypoints
+
+    def sort_contours(self, cnts, method="left-to-right"):
+        # initialize the reverse flag and sort index
+        reverse = False
+        i = 0
+
+        # handle if we need to sort in reverse
+        if method == "right-to-left" or method == "bottom-to-top":
+            reverse = True
+
+        # handle if we are sorting against the y-coordinate rather than
+        # the x-coordinate of the bounding box
+        if method == "top-to-bottom" or method == "bottom-to-top":
+            i = 1
+
+        # construct the list of bounding boxes and sort them from top to
+        # bottom
+        boundingBoxes = [cv2.boundingRect(c.contour) for c in cnts]
+        (cnts, boundingBoxes) = zip(*sorted(zip(cnts, boundingBoxes),
+                                            key=lambda b: b[1][i], reverse=reverse))
+
+        # return the list of sorted contours and bounding boxes
+        return cnts, boundingBoxes
+
+    def pair_cones(self, cones):
+        """
+        :return: (gates as cone pairs, waypoints in driving order, average cone size in px)
+        """
+        # calculate average poller size
+        average_cone_size = 0
+        if len(cones) > 0:
+            for cone in cones:
+                average_cone_size += (cone.width + cone.height) / 2
+            average_cone_size = average_cone_size / len(cones)
+        else:
+            # no cone to measure, the grid still needs a cell size
+            average_cone_size = self.DEFAULT_CONE_SIZE * self.scale
+
+        MAX_POLLER_DIST = self.dist_max*average_cone_size
+        MIN_POLLER_DIST = self.dist_min*average_cone_size
+
+        # compare every unused cone with every other unused cone for gates
+        pairs = self.get_cone_pairs(cones, MIN_POLLER_DIST, MAX_POLLER_DIST)
+        waypoints = self.get_gate_waypoints(pairs)
+
+        # sort waypoints
+        if len(waypoints) > 1:
+            sorted_waypoints = [waypoints[1]]
+            while len(sorted_waypoints) < len(waypoints):
+                closest_waypoint = None
+                for waypoint in waypoints:
+                    if waypoint not in sorted_waypoints:
+                        if not closest_waypoint:
+                            closest_waypoint = waypoint
+                        if sorted_waypoints[-1].distance(waypoint) < sorted_waypoints[-1].distance(closest_waypoint):
+                            closest_waypoint = waypoint
+                sorted_waypoints.append(closest_waypoint)
+            waypoints = sorted_waypoints
+        return pairs, waypoints, average_cone_size
+
+    def get_calibrated_grid(self, image):
+        """
+        :return: calibrated_grid cleared for the next frame, built again only when the view or cell size changed
+        """
+        height, width = image.shape[:2]
+        grid_size = self.calibration.cell_pixels(CONE_WIDTH / 2.0)
+        grid = self.calibrated_grid
+        if grid is None or (grid.width, grid.height, grid.grid_size) != (width, height, grid_size):
+            grid = self.calibrated_grid = Grid(0, 0, width, height, grid_size, profiler=self.profiler)
+        else:
+            grid.clear()
+            grid.profiler = self.profiler
+        self.cell_mm = grid_size * self.calibration.mm_per_pixel
+        return grid
+
+    def threshold(self, img):
+        """
+        hsv, morphology and contours stages
+        :return: (thresholded image, contours in frame pixels)
+        """
+        profiler = self.profiler
+
+        # Set minimum and max HSV values to display
+        lower = np.array([self.hMin, self.sMin, self.vMin])
+        upper = np.array([self.hMax, self.sMax, self.vMax])
+
+        # Create HSV Image and threshold into a range.
+        with profiler.stage("hsv"):
+            if self.detection_scale < 1.0:
+                img = cv2.resize(img, None, fx=self.detection_scale, fy=self.detection_scale,
+                                 interpolation=cv2.INTER_AREA)
+            hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+            mask = cv2.inRange(hsv, lower, upper)
+            output = cv2.bitwise_and(img, img, mask=mask)
+
+        with profiler.stage("morphology"):
+            if self.eroSize > 0:
+                ero_kernel = np.ones((self.eroSize, self.eroSize), np.uint8)
+                output = cv2.erode(output, ero_kernel, iterations=1)
+            if self.dilSize > 0:
+                dil_kernel = np.ones((self.dilSize, self.dilSize), np.uint8)
+                output = cv2.dilate(output, dil_kernel, iterations=1)
+
+        with profiler.stage("contours"):
+            h, s, v = cv2.split(output)
+            # OpenCV 3 returns (image, contours, hierarchy), OpenCV 2 and 4 only (contours, hierarchy)
+            contours = cv2.findContours(v, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)[-2]
+            if self.detection_scale < 1.0:
+                contours = [np.round(cnt / self.detection_scale).astype(np.int32) for cnt in contours]
+        return output, contours
+
+    def build_grid(self, image, cones, obstacles, waypoints, average_cone_size):
+        """
+        grid and add_obstacle stages
+        :param image: the image the objects were found in
+        :return: Grid with everything added
+        """
+        profiler = self.profiler
+        with profiler.stage("grid"):
+            if self.calibration is not None:
+                # top-down pixels have a fixed size in mm, the grid covers the whole view and stays
+                grid = self.get_calibrated_grid(image)
+            else:
+                objects = cones + obstacles
+                # the course spans the cones left to right, without two of them fall back to everything detected
+                contours, boxes = self.sort_contours(cones if len(cones) > 1 else objects)
+                box_left = boxes[0]
+                box_right = boxes[len(boxes) - 1]
+                contours, boxes = self.sort_contours(objects, "top-to-bottom")
+                box_top = boxes[0]
+                box_bottom = boxes[len(boxes) - 1]
+
+                left = box_left[0]
+                right = box_right[0] + box_right[2]
+                top = box_top[1]
+                bottom = box_bottom[1] + box_bottom[3]
+
+                grid = Grid(left, top, right-left, bottom-top, max(1, int(average_cone_size / 2)), profiler=profiler)
+                # the cones are the only thing of known size in the image
+                self.cell_mm = CONE_WIDTH * grid.grid_size / average_cone_size
+
+        with profiler.stage("add_obstacle"):
+            for cone in cones:
+                grid.add_cone(cone)
+
+            for obstacle in obstacles:
+                grid.add_obstacle(obstacle)
+
+            for waypoint in waypoints:
+                grid.add_waypoint(waypoint)
+
+            for layer in self.cost_layers:
+                grid.add_cost_layer(layer(grid))
+        return grid
+
+    def restore_grid(self, image, entry):
+        """
+        :param entry: the stage_cache grid entry of the frame
+        :return: the Grid build_grid() gave for it
+        """
+        with self.profiler.stage("grid"):
+            if self.calibration is not None:
+                grid = self.get_calibrated_grid(image)
+            else:
+                x, y, width, height, grid_size, spacing = entry["geometry"].tolist()
+                grid = Grid(x, y, width, height, grid_size, spacing, profiler=self.profiler)
+            fill_grid(grid, entry["cells"])
+        self.cell_mm = float(entry["cell_mm"])
+        return grid
+
+    def plan(self, waypoints):
+        """
+        astar stage
+        :param waypoints: the ones to plan through, max_legs already applied
+        :return: what the planner's test_path() returns
+        """
+        with self.profiler.stage("astar"):
+            pf = self.create_planner(waypoints)
+            if self.leg_workers:
+                if self.leg_pool is None:
+                    self.leg_pool = LegPool(self.leg_workers)
+                return self.leg_pool.test_path(pf)
+            return pf.test_path()
+
+    def process(self, img):
+        """
+        Run all detection and planning stages on a BGR image, taking what stage_cache has for it from there
+        :param img: input frame, not modified
+        :return: FrameResult
+        """
+        profiler = self.profiler
+        cache = self.stage_cache
+        keys = cache.keys(self, img) if cache is not None else {}
+
+        if self.calibration is not None:
+            with profiler.stage("remap"):
+                img = self.calibration.warp(img)
+        image = img
+
+        entry = cache.get("threshold", keys) if cache is not None else None
+        if entry is None:
+            output, contours = self.threshold(image)
+            if cache is not None:
+                cache.put("threshold", keys, dict(encode_contours(contours), output=output))
+        else:
+            output, contours = entry["output"], decode_contours(entry)
+        profiler.count("contours", len(contours))
+
+        entry = cache.get("detect", keys) if cache is not None else None
+        if entry is None:
+            with profiler.stage("detect"):
+                cones, obstacles = self.detect_cones_and_obstacles(contours)
+            if cache is not None:
+                cache.put("detect", keys, {"cones": encode_rects(cones, contours),
+                                           "obstacles": encode_rects(obstacles, contours)})
+        else:
+            cones, obstacles = decode_rects(entry["cones"], contours), decode_rects(entry["obstacles"], contours)
+        profiler.count("cones", len(cones))
+        profiler.count("obstacles", len(obstacles))
+
+        entry = cache.get("pairing", keys) if cache is not None else None
+        if entry is None:
+            with profiler.stage("pairing"):
+                pairs, waypoints, average_cone_size = self.pair_cones(cones)
+            if cache is not None:
+                cache.put("pairing", keys, {"pairs": encode_pairs(pairs, cones), "waypoints": encode_rects(waypoints),
+                                            "average_cone_size": np.float64(average_cone_size)})
+        else:
+            pairs, waypoints = decode_pairs(entry["pairs"], cones), decode_rects(entry["waypoints"])
+            average_cone_size = float(entry["average_cone_size"])
+
+        # create grid
+        if (len(cones) > 1 or len(obstacles) > 1) and (self.draw_grid or self.pathfinding):
+            entry = cache.get("grid", keys) if cache is not None else None
+            if entry is None:
+                self.grid = self.build_grid(image, cones, obstacles, waypoints, average_cone_size)
+                if cache is not None:
+                    cache.put("grid", keys, encode_grid(self.grid, self.cell_mm))
+            else:
+                self.grid = self.restore_grid(image, entry)
+        else:
+            self.grid = None
+
+        paths = None
+        if self.grid and self.pathfinding and self.reuse_path and self.last_paths is not None:
+            paths = self.last_paths
+        elif self.grid and self.pathfinding:
+            legs = waypoints if self.max_legs is None else waypoints[:self.max_legs + 1]
+            if self.frame_deadline is not None:
+                self.planning_deadline = max(self.frame_deadline - time.perf_counter(), 0.0)
+            if self.snapshots is not None:
+                self.snapshots.write(self, legs)
+            entry = cache.get("plan", keys) if cache is not None else None
+            if entry is None:
+                paths = self.plan(legs)
+                if cache is not None:
+                    cache.put("plan", keys, encode_paths(paths))
+            else:
+                paths = decode_paths(entry, self.grid)
+            self.last_paths = paths
+
+        return FrameResult(output, cones, obstacles, pairs, waypoints, self.grid, paths, image, self.degradation_level)
+
+    def close(self):
+        """
+        Stop the leg workers, if any were started
+        """
+        if self.leg_pool is not None:
+            self.leg_pool.close()
+            self.leg_pool = None
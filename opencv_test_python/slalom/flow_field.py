@@ -0,0 +1,121 @@
+"""
+Goal flow fields: one Dijkstra per goal, then any number of starts follow it without searching.
+
+The integration field holds, for every cell, the cost of the cheapest way from that cell to the goal under the cost
+map of costs.cost_map(): step lengths plus the cost of every cell entered. It comes out of one Dijkstra run backwards
+from the goal cells, all of them sources at cost 0, so a gate can be given as several cells. The direction field
+stores, for every cell, the heading of its first step along that way, so following it from any start is a walk of
+path length steps.
+
+Fields are kept on the CostMap they were computed from, which is rebuilt whenever Grid.version moves, so a field is
+reused until the grid changes and dropped with it.
+
+A field has no notion of the heading a car arrives with: the turn table is not applied, paths only minimise length
+and cell costs. That is what makes one field serve every start.
+"""
+import heapq
+import logging
+
+from .costs import HEADINGS, INFINITY, cost_map
+from .planner import Pathfinding
+
+log = logging.getLogger(__name__)
+
+NO_DIRECTION = -1
+
+
+class FlowField:
+    """
+    Integration and direction field of one goal on one CostMap
+    """
+
+    def __init__(self, costs, goals):
+        """
+        :param costs: CostMap to integrate over
+        :param goals: (x, y) cells the field leads to
+        """
+        rows, columns, cells, steps = costs.rows, costs.columns, costs.cells, costs.steps
+        self.rows = rows
+        self.goals = goals
+        integration = [INFINITY] * (rows * columns)
+        directions = [NO_DIRECTION] * (rows * columns)
+        frontier = []
+        for x, y in goals:
+            integration[y * rows + x] = 0
+            frontier.append((0, y * rows + x))
+        heapq.heapify(frontier)
+        # stepping from n onto i along heading h costs steps[h] + cells[i], so seen from i, n lies against h
+        reverse = [((-dx, -dy), h) for h, (dx, dy) in enumerate(HEADINGS)]
+        settled = 0
+        while frontier:
+            cost, i = heapq.heappop(frontier)
+            if cost > integration[i]:
+                continue
+            settled += 1
+            y, x = divmod(i, rows)
+            entered = cells[i]
+            for (dx, dy), heading in reverse:
+                nx, ny = x + dx, y + dy
+                if not (0 <= nx < rows and 0 <= ny < columns):
+                    continue
+                n = ny * rows + nx
+                if cells[n] == INFINITY:
+                    continue
+                new_cost = cost + steps[heading] + entered
+                if new_cost < integration[n]:
+                    integration[n] = new_cost
+                    directions[n] = heading
+                    heapq.heappush(frontier, (new_cost, n))
+        self.integration = integration
+        self.directions = directions
+        self.settled = settled
+
+    def cost(self, x, y):
+        return self.integration[y * self.rows + x]
+
+    def follow(self, x, y):
+        """
+        :return: cells from (x, y) to the goal along the direction field, just [(x, y)] when it cannot be reached
+        """
+        cells = [(x, y)]
+        directions, rows = self.directions, self.rows
+        heading = directions[y * rows + x]
+        while heading != NO_DIRECTION:
+            dx, dy = HEADINGS[heading]
+            x, y = x + dx, y + dy
+            cells.append((x, y))
+            heading = directions[y * rows + x]
+        return cells
+
+
+def flow_field(grid, goals):
+    """
+    :param goals: (x, y) cells
+    :return: the FlowField of goals on the grid as it is now, computed once per goal and Grid.version
+    """
+    costs = cost_map(grid)
+    key = tuple(sorted(goals))
+    field = costs.flow_fields.get(key)
+    if field is None:
+        field = costs.flow_fields[key] = FlowField(costs, key)
+    return field
+
+
+class FlowFieldPathfinding(Pathfinding):
+    """
+    Pathfinding that follows the flow field of each leg's goal, the field is computed on the first leg to a goal
+    """
+
+    def search(self, start, goal):
+        log.info("Following the flow field from {} to {}".format(start, goal))
+        computed = (goal.coordinates,) not in cost_map(self.grid).flow_fields
+        field = flow_field(self.grid, [goal.coordinates])
+        if computed:
+            self.profiler.count("nodes_expanded", field.settled)
+        cells = field.follow(*start.coordinates)
+        came_from, finish = self.chain(cells, start)
+        return came_from, {finish: field.cost(*start.coordinates)}, finish
+
+    def joins(self, finish, step):
+        # fields do not know the heading a car arrives with
+        return True
@@ -0,0 +1,341 @@
+import numpy as np
+import logging
+import sys
+import time
+from multiprocessing import Process, Queue, resource_tracker, shared_memory
+
+log = logging.getLogger(__name__)
+
+# bus header: int64 fields
+_LATEST = 0
+_HEIGHT = 1
+_WIDTH = 2
+_CHANNELS = 3
+_SLOTS = 4
+_HEADER_FIELDS = 8
+
+# per slot header: int64 sequence numbers + float64 timestamp
+_SEQ_BEGIN = 0
+_SEQ_END = 1
+_TIMESTAMP = 2
+_SLOT_FIELDS = 3
+
+
+class FrameBus:
+    """
+    Single producer, many consumer frame ring buffer in multiprocessing.shared_memory.
+
+    The capture process publishes frames into a ring of slots, every frame gets a sequence number. Consumers in other
+    processes attach by name and get the latest frame as a numpy view straight into the shared buffer, nothing is
+    copied or pickled. Every slot is guarded like a seqlock: the writer bumps seq_begin before and seq_end after
+    writing, so a reader can tell whether the frame it looked at was overwritten in the meantime (is_valid()).
+    """
+
+    def __init__(self, shm, owner):
+        self._shm = shm
+        self.owner = owner
+        self.name = shm.name
+
+        self._header = np.ndarray((_HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        self.shape = tuple(int(v) for v in self._header[_HEIGHT:_CHANNELS + 1] if v > 0)
+        self.slots = int(self._header[_SLOTS])
+
+        offset = self._header.nbytes
+        self._sequences = np.ndarray((self.slots, 2), dtype=np.int64, buffer=shm.buf, offset=offset,
+                                     strides=(_SLOT_FIELDS * 8, 8))
+        self._timestamps = np.ndarray((self.slots,), dtype=np.float64, buffer=shm.buf,
+                                      offset=offset + _TIMESTAMP * 8, strides=(_SLOT_FIELDS * 8,))
+        offset += self.slots * _SLOT_FIELDS * 8
+        self._frames = np.ndarray((self.slots,) + self.shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+
+    @classmethod
+    def create(cls, shape, slots=8, name=None):
+        """
+        Allocate a new bus, the creating process owns (and unlinks) it
+        :param shape: frame shape, e.g. (480, 640, 3)
+        :param slots: ring size, a consumer view stays valid for roughly slots frame periods
+        :param name: shared memory name, random if None
+        """
+        frame_bytes = int(np.prod(shape))
+        size = _HEADER_FIELDS * 8 + slots * (_SLOT_FIELDS * 8 + frame_bytes)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((_HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[_HEIGHT:_HEIGHT + len(shape)] = shape
+        header[_SLOTS] = slots
+        bus = cls(shm, owner=True)
+        bus._sequences[:] = 0
+        del header
+        return bus
+
+    @classmethod
+    def attach(cls, name):
+        # only the owner may unlink the segment. Before Python 3.13 attaching registers it with the consumer's resource
+        # tracker, which unlinks it when the consumer exits, so the registration is taken back right away
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+
+    @property
+    def latest_sequence(self):
+        return int(self._header[_LATEST])
+
+    def publish(self, frame, timestamp=None):
+        """
+        Copy a frame into the next slot (the only copy on the way to every consumer)
+        :return: sequence number of the frame
+        """
+        seq = int(self._header[_LATEST]) + 1
+        slot = seq % self.slots
+        self._sequences[slot, _SEQ_BEGIN] = seq
+        np.copyto(self._frames[slot], frame)
+        self._timestamps[slot] = time.perf_counter() if timestamp is None else timestamp
+        self._sequences[slot, _SEQ_END] = seq
+        self._header[_LATEST] = seq
+        return seq
+
+    def latest(self):
+        """
+        :return: (sequence, timestamp, read-only frame view) of the newest complete frame, (0, None, None) if empty
+        """
+        while True:
+            seq = int(self._header[_LATEST])
+            if seq == 0:
+                return 0, None, None
+            slot = seq % self.slots
+            # seqlock read: end marker, payload, begin marker, the reverse of the order publish() writes them in
+            if self._sequences[slot, _SEQ_END] == seq:
+                timestamp = float(self._timestamps[slot])
+                if self._sequences[slot, _SEQ_BEGIN] == seq:
+                    frame = self._frames[slot]
+                    frame.flags.writeable = False
+                    return seq, timestamp, frame
+            # the slot is being written, let the producer finish
+            time.sleep(0)
+
+    def wait_next(self, last_sequence, timeout=1.0, poll=0.0005):
+        """
+        Block until a frame newer than last_sequence is published
+        :return: same as latest(), (0, None, None) on timeout
+        """
+        deadline = time.perf_counter() + timeout
+        while self._header[_LATEST] <= last_sequence:
+            if time.perf_counter() > deadline:
+                return 0, None, None
+            time.sleep(poll)
+        return self.latest()
+
+    def is_valid(self, sequence):
+        """
+        Check after processing a view from latest() that the writer did not start overwriting it
+        """
+        slot = sequence % self.slots
+        return self._sequences[slot, _SEQ_BEGIN] == sequence
+
+    def close(self):
+        """
+        Views handed out by latest() must be dropped before closing
+        """
+        self._header = self._sequences = self._timestamps = self._frames = None
+        self._shm.close()
+        if self.owner:
+            # a consumer started through multiprocessing shares this process' tracker and took the registration back
+            # when it attached, register again so unlink() has one to take back
+            resource_tracker.register(self._shm._name, "shared_memory")
+            self._shm.unlink()
+
+
+class BusCapture:
+    """
+    cv2.VideoCapture-like consumer end of a bus, so existing loops can read from it unchanged
+    """
+
+    def __init__(self, bus_name, timeout=1.0, copy=False):
+        """
+        :param copy: hand out private copies instead of views into the bus, for consumers slower than the producer
+            (recording to disk). A copy the producer overwrote while it was taken is dropped and counted in
+            torn_frames
+        """
+        self.bus = FrameBus.attach(bus_name)
+        self.timeout = timeout
+        self.copy = copy
+        self.sequence = 0
+        self.timestamp = None
+        self.torn_frames = 0
+
+    def read(self):
+        while True:
+            seq, timestamp, frame = self.bus.wait_next(self.sequence, self.timeout)
+            if seq == 0:
+                return False, None
+            self.sequence = seq
+            if self.copy:
+                frame = frame.copy()
+                if not self.bus.is_valid(seq):
+                    # the producer lapped the ring while we copied, a newer frame is already waiting
+                    self.torn_frames += 1
+                    continue
+            self.timestamp = timestamp
+            return True, frame
+
+    def release(self):
+        self.bus.close()
+
+
+def capture_process(bus_name, source, stop_after=None):
+    """
+    Process target: read frames from a capture and publish them on the bus
+    :param bus_name: name of a bus created by the parent
+    :param source: video path, stream url or camera index
+    :param stop_after: number of frames, None runs until the source ends
+    """
+    import cv2
+    if isinstance(source, str) and source.startswith("http"):
+        from .mjpeg_stream import MJPEGStream
+        capture = MJPEGStream(source).start()
+    else:
+        capture = cv2.VideoCapture(source)
+    bus = FrameBus.attach(bus_name)
+    published = 0
+    try:
+        while stop_after is None or published < stop_after:
+            ret, frame = capture.read()
+            if not ret:
+                if isinstance(capture, cv2.VideoCapture):
+                    break
+                continue
+            bus.publish(frame)
+            published += 1
+    finally:
+        capture.release()
+        bus.close()
+
+
+def _benchmark_producer(bus_name, duration, fps):
+    bus = FrameBus.attach(bus_name)
+    frame = np.random.randint(0, 255, bus.shape, dtype=np.uint8)
+    period = 1.0 / fps if fps else 0
+    end = time.perf_counter() + duration
+    next_time = time.perf_counter()
+    while time.perf_counter() < end:
+        bus.publish(frame)
+        if period:
+            next_time += period
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    bus.close()
+
+
+def _benchmark_consumer(bus_name, duration, results):
+    bus = FrameBus.attach(bus_name)
+    latencies = []
+    torn = 0
+    last = 0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        seq, timestamp, frame = bus.wait_next(last, timeout=0.1)
+        if seq == 0:
+            continue
+        # touch the frame like a consumer would
+        int(frame[::32, ::32].sum())
+        latencies.append(time.perf_counter() - timestamp)
+        if not bus.is_valid(seq):
+            torn += 1
+        last = seq
+    frame = None
+    bus.close()
+    results.put((len(latencies), torn, latencies))
+
+
+def benchmark(shape=(480, 640, 3), consumer_counts=(1, 2, 3, 4), duration=3.0, fps=None, slots=8):
+    """
+    Measure publish-to-read latency and per-consumer throughput for 1..n consumer processes
+    :param fps: producer rate, None publishes as fast as possible
+    :return: list of (consumers, published frames, frames read per consumer, median latency ms, p99 latency ms,
+             frames overwritten while being read)
+    """
+    rows = []
+    for consumers in consumer_counts:
+        bus = FrameBus.create(shape, slots=slots)
+        results = Queue()
+        workers = [Process(target=_benchmark_consumer, args=(bus.name, duration + 0.2, results))
+                   for _ in range(consumers)]
+        for worker in workers:
+            worker.start()
+        producer = Process(target=_benchmark_producer, args=(bus.name, duration, fps))
+        producer.start()
+        collected = [results.get() for _ in workers]
+        producer.join()
+        for worker in workers:
+            worker.join()
+        published = bus.latest_sequence
+        bus.close()
+
+        latencies = np.concatenate([np.asarray(c[2]) for c in collected]) * 1000
+        read = np.mean([c[0] for c in collected])
+        torn = sum(c[1] for c in collected)
+        row = (consumers, published, read,
+               float(np.median(latencies)) if len(latencies) else float('nan'),
+               float(np.percentile(latencies, 99)) if len(latencies) else float('nan'),
+               torn)
+        rows.append(row)
+        log.info("consumers: {} - published: {} - read/consumer: {:.0f} - latency median: {:.3f} ms "
+                 "- p99: {:.3f} ms - overwritten: {}".format(*row))
+    return rows
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        fps = float(sys.argv[2]) if len(sys.argv) > 2 else None
+        print("{:>9} {:>10} {:>14} {:>12} {:>10} {:>11}".format(
+            "consumers", "published", "read/consumer", "median ms", "p99 ms", "overwritten"))
+        for row in benchmark(fps=fps):
+            print("{:>9} {:>10} {:>14.0f} {:>12.3f} {:>10.3f} {:>11}".format(*row))
+    elif len(sys.argv) > 2 and sys.argv[1] == "capture":
+        import cv2
+        source = int(sys.argv[2]) if sys.argv[2].isdigit() else sys.argv[2]
+        probe = cv2.VideoCapture(source)
+        ret, first = probe.read()
+        probe.release()
+        if not ret:
+            print("Could not read from {}".format(sys.argv[2]))
+            exit()
+        bus = FrameBus.create(first.shape, name=sys.argv[3] if len(sys.argv) > 3 else None)
+        print("Publishing {} on bus {}".format(sys.argv[2], bus.name))
+        capture = Process(target=capture_process, args=(bus.name, source))
+        capture.start()
+        try:
+            capture.join()
+        except KeyboardInterrupt:
+            capture.terminate()
+        bus.close()
+    elif len(sys.argv) > 2 and sys.argv[1] == "preview":
+        import cv2
+        capture = BusCapture(sys.argv[2])
+        while 1:
+            ret, frame = capture.read()
+            if ret:
+                cv2.imshow('preview', frame)
+                frame = None
+            k = cv2.waitKey(1) & 0xFF
+            if k == 27:
+                break
+        capture.release()
+        cv2.destroyAllWindows()
+    elif len(sys.argv) > 3 and sys.argv[1] == "record":
+        from .recording import record
+        capture = BusCapture(sys.argv[2], copy=True)
+        record(capture, sys.argv[3], show=False)
+        if capture.torn_frames:
+            print("Dropped {} frames the producer overwrote while they were copied".format(capture.torn_frames))
+        capture.release()
+    else:
+        print("Usage: python -m slalom.frame_bus benchmark [fps]")
+        print("       python -m slalom.frame_bus capture <VideoPath|StreamUrl|CameraIndex> [BusName]")
+        print("       python -m slalom.frame_bus preview <BusName>")
+        print("       python -m slalom.frame_bus record <BusName> <RunDir>")
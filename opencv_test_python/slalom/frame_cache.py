@@ -0,0 +1,119 @@
+import cv2
+import numpy as np
+import logging
+import os
+import tempfile
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024  # bytes
+
+
+class FrameCache:
+    """
+    Looping, seekable frame source for short video clips.
+
+    Every frame is decoded exactly once (on first access) straight into a preallocated frame array. Clips that fit
+    into memory_budget are kept in RAM, larger clips go to a memory-mapped raw frame file. Later loops and seeks
+    return read-only views into that array, so playback from the cache neither decodes nor copies.
+    """
+
+    def __init__(self, video_path, memory_budget=DEFAULT_MEMORY_BUDGET, spill_path=None):
+        """
+        :param video_path: anything cv2.VideoCapture can open with a known frame count
+        :param memory_budget: max bytes kept in RAM before falling back to a memory-mapped file
+        :param spill_path: raw frame file for large clips, defaults to a temporary file
+        """
+        self.video_path = video_path
+        self._capture = cv2.VideoCapture(video_path)
+        ret, first = self._capture.read()
+        if not ret:
+            raise IOError("Could not read from {}".format(video_path))
+
+        self.frame_count = int(self._capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        if self.frame_count <= 0:
+            raise IOError("Unknown frame count for {}, cannot size the cache".format(video_path))
+        self.fps = self._capture.get(cv2.CAP_PROP_FPS) or 30
+        self.shape = first.shape
+        self.nbytes = self.frame_count * first.nbytes
+
+        self._spill_path = None
+        if self.nbytes <= memory_budget:
+            self._frames = np.empty((self.frame_count,) + first.shape, dtype=first.dtype)
+        else:
+            if spill_path is None:
+                fd, spill_path = tempfile.mkstemp(suffix=".raw", prefix="frame_cache_")
+                os.close(fd)
+                self._spill_path = spill_path
+            log.info("Clip needs {} MB, spilling to {}".format(self.nbytes // (1024 * 1024), spill_path))
+            self._frames = np.memmap(spill_path, dtype=first.dtype, mode="w+",
+                                     shape=(self.frame_count,) + first.shape)
+        self._frames[0] = first
+
+        self.decoded = 1  # frames [0, decoded) are in the cache
+        self.position = 0  # next frame read() returns
+
+    @property
+    def in_memory(self):
+        return not isinstance(self._frames, np.memmap)
+
+    @property
+    def complete(self):
+        return self._capture is None
+
+    def __len__(self):
+        return self.frame_count
+
+    def _decode_until(self, index):
+        while self.decoded <= index and self._capture is not None:
+            # decode directly into the cache slot
+            slot = self._frames[self.decoded]
+            ret, frame = self._capture.read(slot)
+            if not ret:
+                log.info("{} ended after {} of {} frames".format(self.video_path, self.decoded, self.frame_count))
+                self.frame_count = self.decoded
+                self._finish()
+                break
+            if not np.may_share_memory(frame, slot):
+                slot[...] = frame
+            self.decoded += 1
+            if self.decoded == self.frame_count:
+                self._finish()
+
+    def _finish(self):
+        self._capture.release()
+        self._capture = None
+        if not self.in_memory:
+            self._frames.flush()
+
+    def __getitem__(self, index):
+        """
+        Random access to a single frame, decoding up to it if the first pass has not got there yet
+        :param index: frame number, wraps around the clip length
+        :return: read-only view into the cache
+        """
+        if index < 0 or index >= self.decoded:
+            self._decode_until(index % self.frame_count if index >= 0 else self.frame_count - 1)
+        frame = self._frames[index % self.frame_count]
+        frame.flags.writeable = False
+        return frame
+
+    def seek(self, index):
+        self.position = index % self.frame_count
+
+    def read(self):
+        """
+        Same contract as cv2.VideoCapture.read(), but loops at the end of the clip
+        """
+        frame = self[self.position]
+        self.position = (self.position + 1) % self.frame_count
+        return True, frame
+
+    def release(self):
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
+        self._frames = None
+        if self._spill_path is not None:
+            os.remove(self._spill_path)
+            self._spill_path = None
@@ -0,0 +1,32 @@
+from math import sqrt
+
+
+class Rectangle:
+
+    def __init__(self, center_x, center_y, width, height, rotation=0, contour=None):
+        self.x = center_x
+        self.y = center_y
+        self.height = height
+        self.width = width
+        self.contour = contour
+        self.rotation = rotation
+
+    def distance(self, rectangle):
+        """
+        Distance from center to center
+        :param rectangle: 
+        :return: 
+        """
+        a = self.x - rectangle.x
+        b = self.y - rectangle.y
+
+        return sqrt(pow(a, 2) + pow(b, 2))
+
+    def intersects(self, rect):
+        import cv2  # only loaded once something is actually rasterized
+        r1 = ((self.x, self.y), (self.width, self.height), self.rotation)
+        r2 = ((rect.x, rect.y), (rect.width, rect.height), rect.rotation)
+        return cv2.rotatedRectangleIntersection(r1, r2)[0] > 0
+
+    def __str__(self):
+        return "center_x: {} - center_y: {} - w: {} - h: {}".format(self.x, self.y, self.width, self.height)
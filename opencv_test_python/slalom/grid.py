@@ -0,0 +1,288 @@
+import logging
+import copy
+
+from .geometry import Rectangle
+from .instrumentation import NULL_PROFILER
+
+log = logging.getLogger(__name__)
+
+
+class GridRectangle(Rectangle):
+
+    FREE = 0
+    CONE = 10
+    OBSTACLE = 20
+    AVOID = 30
+    WAYPOINT = 40
+
+    N = 200
+    NE = 210
+    E = 220
+    SE = 230
+    S = 240
+    SW = 250
+    W = 260
+    NW = 270
+
+    # step (dx, dy) -> heading
+    DIRECTIONS = {(0, -1): N, (1, -1): NE, (1, 0): E, (1, 1): SE, (0, 1): S, (-1, 1): SW, (-1, 0): W, (-1, -1): NW}
+
+    def __init__(self, center_x, center_y, width, height, x_coordinate, y_coordinate, occupied=FREE):
+        super().__init__(center_x, center_y, width, height)
+        self.coordinates = (x_coordinate, y_coordinate)
+        self.occupied = occupied
+        self.direction = None
+
+    def passable(self):
+        return self.occupied == GridRectangle.FREE or self.occupied == GridRectangle.WAYPOINT
+
+    def set_occupied(self, new_occupied):
+        self.occupied = new_occupied
+
+    def __gt__(self, rect2):
+        return self.coordinates[0] > rect2.coordinates[0] and self.coordinates[1] > rect2.coordinates[1]
+
+    # search states are (cell, heading): copies handed out by Grid.neighbors compare equal when both match, so
+    # Pathfinding.search does not expand the same state over and over again
+    def __eq__(self, rect2):
+        return isinstance(rect2, GridRectangle) and self.coordinates == rect2.coordinates and \
+            self.direction == rect2.direction
+
+    def __hash__(self):
+        return hash((self.coordinates, self.direction))
+
+    def __copy__(self):
+        # copy.copy() would go through __reduce_ex__, the planners copy a rect for every cell of a path
+        rect = type(self).__new__(type(self))
+        rect.__dict__.update(self.__dict__)
+        return rect
+
+    def same(self, rect2):
+        if self.direction is not None and rect2.direction is not None:
+            return self.coordinates == rect2.coordinates and self.direction == rect2.direction
+        else:
+            return self.coordinates == rect2.coordinates
+
+    def __str__(self):
+        return "coordinates: {} - occupied: {}".format(self.coordinates, self.occupied)
+
+
+class Grid:
+    """
+    Grid for use on OpenCV Images
+    """
+
+    def __init__(self, top_left_x, top_left_y, width, height, grid_size=7, spacing=2, profiler=NULL_PROFILER):
+        """
+        assuming top_left is 0, because opencv does it this way
+
+        :param top_left_x: image coordinate
+        :param top_left_y: image coordinate
+        :param width: image width
+        :param height: image height
+        :param grid_size: 
+        :param spacing: extra grid elements around the image grid
+        :param profiler: receives the cells_checked / cells_rasterized counters
+        """
+
+        self.x = top_left_x
+        self.y = top_left_y
+        self.width = width
+        self.height = height
+        self.grid_size = grid_size
+        self.spacing = spacing
+        self.profiler = profiler
+
+        # calculate grid
+        self.rows = int(abs(self.width / grid_size) + spacing * 2)
+        self.columns = int(abs(self.height / grid_size) + spacing * 2)
+        self.offset = int(spacing * grid_size)
+
+        # occupied codes of every cell, y * rows + x, kept in step with the cells by set_occupied()
+        self.cells = bytearray(self.rows * self.columns)
+        # bumped on every change, compiled forms like costs.cost_map() are rebuilt when it moves
+        self.version = 0
+        self.cost_layers = []  # extra per cell costs, see add_cost_layer()
+        self.turn_costs = None  # cost of a change of heading by 0..4 steps of 45°, None for costs.TURN_COSTS
+        self.cost_cache = None
+
+        self.grid = []
+        for i in range(self.columns):
+            self.grid.insert(i, [])
+            for j in range(self.rows):
+                # calculate center variables please
+                new_rect_center_x = (self.x - self.offset) + (j * grid_size) + (grid_size / 2)
+                new_rect_center_y = (self.y - self.offset) + (i * grid_size) + (grid_size / 2)
+                new_rect = GridRectangle(new_rect_center_x, new_rect_center_y, grid_size, grid_size, j, i)
+                self.grid[i].insert(j, new_rect)
+
+    def occupancy(self):
+        """
+        :return: uint8 array [y, x] of the occupied codes, the representation the array based planners work on
+        """
+        import numpy as np
+        return np.frombuffer(self.cells, dtype=np.uint8).reshape(self.columns, self.rows).copy()
+
+    def set_occupied(self, slot, occupied):
+        slot.set_occupied(occupied)
+        x, y = slot.coordinates
+        self.cells[y * self.rows + x] = occupied
+        self.version += 1
+
+    def clear(self):
+        """
+        Set every occupied cell back to FREE and drop the cost layers, so a grid of fixed geometry can be reused for the
+        next frame instead of being built again
+        """
+        rows = self.rows
+        for i, occupied in enumerate(self.cells):
+            if occupied:
+                self.grid[i // rows][i % rows].set_occupied(GridRectangle.FREE)
+        self.cells[:] = bytes(len(self.cells))
+        self.cost_layers = []
+        self.version += 1
+
+    def add_cost_layer(self, layer):
+        """
+        Add costs on top of what the occupancy costs, the planners pay them for entering a cell
+        :param layer: sequence with one cost per cell, y * rows + x
+        """
+        self.cost_layers.append(layer)
+        self.version += 1
+
+    def add_obstacle(self, obstacle, obstacle_type=GridRectangle.OBSTACLE, max_failed_steps=15):
+        estimated_col, estimated_row = self.get_index_from_position(obstacle.x, obstacle.y)
+        starting_row = estimated_row - int(max_failed_steps / 2)
+        starting_col = estimated_col - int(max_failed_steps / 2)
+        if starting_row < 0:
+            starting_row = 0
+        if starting_col < 0:
+            starting_col = 0
+
+        current_row = starting_row
+
+        rows_started = False
+        row_was_empty = False
+        checked = rasterized = 0
+
+        while ((not row_was_empty and rows_started) or not rows_started) and current_row < self.columns:
+            current_col = starting_col
+            row_started = False
+            row_ended = False
+            while ((not row_started and not row_ended and (current_col - starting_col) < max_failed_steps) or
+                   (row_started and not row_ended)) and current_col < self.rows:
+                slot_r = self.grid[current_row]
+                slot = slot_r[current_col]
+                intersects = slot.intersects(obstacle)
+                checked += 1
+                log.debug("Checking {} {}".format(current_row, current_col))
+                if intersects:
+                    self.set_occupied(slot, obstacle_type)
+                    rasterized += 1
+                    if obstacle_type == GridRectangle.OBSTACLE:
+                        for neighbor in self.neighbors(slot, directional=False):
+                            if neighbor.occupied == GridRectangle.FREE or \
+                                            neighbor.occupied == GridRectangle.AVOID:
+                                self.set_occupied(neighbor, GridRectangle.AVOID)
+                            for second_neighbor in self.neighbors(neighbor, directional=False):
+                                if second_neighbor.occupied == GridRectangle.FREE or \
+                                                second_neighbor.occupied == GridRectangle.AVOID:
+                                    self.set_occupied(second_neighbor, GridRectangle.AVOID)
+                                for third_neighbor in self.neighbors(second_neighbor, directional=False):
+                                    if third_neighbor.occupied == GridRectangle.FREE or \
+                                                    third_neighbor.occupied == GridRectangle.AVOID:
+                                        self.set_occupied(third_neighbor, GridRectangle.AVOID)
+
+                    if obstacle_type == GridRectangle.CONE:
+                        for neighbor in self.neighbors(slot, directional=False):
+                            if neighbor.occupied == GridRectangle.FREE or \
+                                            neighbor.occupied == GridRectangle.AVOID:
+                                self.set_occupied(neighbor, GridRectangle.AVOID)
+
+                    log.debug("Occupying {} {}".format(current_row, current_col))
+                    row_started = True
+                    rows_started = True
+                    row_was_empty = False
+                elif not intersects and row_started:
+                    row_ended = True
+                current_col += 1
+            if not row_started:
+                row_was_empty = True
+            current_row += 1
+        self.profiler.count("cells_checked", checked)
+        self.profiler.count("cells_rasterized", rasterized)
+
+    def add_cone(self, obstacle):
+        self.add_obstacle(obstacle, obstacle_type=GridRectangle.CONE)
+
+    def add_waypoint(self, waypoint):
+        self.add_obstacle(waypoint, obstacle_type=GridRectangle.WAYPOINT)
+
+    def get_index_from_position(self, x, y):
+        row = int((x - (self.x - self.offset)) / self.grid_size)
+        column = int((y - (self.y - self.offset)) / self.grid_size)
+        return row, column
+
+    def rect_in_bounds(self, coordinates):
+        log.debug("rect_in_bounds {}".format(coordinates))
+        x, y, direction = coordinates
+        log.debug("{}".format(0 <= y < self.columns and 0 <= x < self.rows))
+        return 0 <= y < self.columns and 0 <= x < self.rows
+
+    @staticmethod
+    def rect_passable(rect):
+        return rect.passable()
+
+    def neighbors(self, rect, directional=True):
+        try:
+            (x, y) = rect.coordinates
+            direction = rect.direction
+        except AttributeError:
+            y, x = self.get_index_from_position(rect.x, rect.y)
+            direction = None
+        result_rects = []
+
+        N = (x, y - 1, GridRectangle.N)
+        NE = (x + 1, y - 1, GridRectangle.NE)
+        E = (x + 1, y, GridRectangle.E)
+        SE = (x + 1, y + 1, GridRectangle.SE)
+        S = (x, y + 1, GridRectangle.S)
+        SW = (x - 1, y + 1, GridRectangle.SW)
+        W = (x - 1, y, GridRectangle.W)
+        NW = (x - 1, y - 1, GridRectangle.NW)
+
+        if directional:
+            if direction == GridRectangle.N:
+                results = [NW, N, NE]
+            elif direction == GridRectangle.NE:
+                results = [N, NE, E]
+            elif direction == GridRectangle.E:
+                results = [NE, E, SE]
+            elif direction == GridRectangle.SE:
+                results = [E, SE, S]
+            elif direction == GridRectangle.S:
+                results = [SE, S, SW]
+            elif direction == GridRectangle.SW:
+                results = [S, SW, W]
+            elif direction == GridRectangle.W:
+                results = [SW, W, NW]
+            elif direction == GridRectangle.NW:
+                results = [W, NW, N]
+            else:
+                results = [N, NE, E, SE, S, SW, W, NW]
+        else:
+            results = [N, NE, E, SE, S, SW, W, NW]
+
+        if (x + y) % 2 == 0: results.reverse()  # aesthetics
+        results = list(filter(self.rect_in_bounds, results))
+        for result in results:
+            if directional:
+                rect = copy.copy(self.grid[result[1]][result[0]])
+                rect.direction = result[2]
+                result_rects.append(rect)
+            else:
+                rect = self.grid[result[1]][result[0]]
+                result_rects.append(rect)
+        result_rects = list(filter(self.rect_passable, result_rects))
+        log.debug("for rect {} - results {} - result_rects {}".format(rect, list(results), result_rects))
+        return result_rects
@@ -0,0 +1,542 @@
+"""
+Hierarchical path-finding (HPA*) for large grids.
+
+The grid is cut into square clusters. Where two neighbouring clusters share a run of passable cells, entrances are
+placed along it, one every ENTRANCE_SPACING cells, and every entrance can be crossed straight or diagonally. Inside
+every cluster the costs from each crossing into it to the crossings out of it are stored. A query connects start and
+goal to the crossings of their own clusters, searches the small abstract graph and then stitches the stored
+intra-cluster paths back together.
+
+Costs are those of costs.cost_map(), as for the other grid planners: the cell layer with its graded AVOID penalty and
+cost layers, straight and diagonal step lengths and the turn table. The searches inside a cluster run over
+(cell, heading) states, and an abstract node is a crossing together with the heading it was crossed on, so turns
+are paid for inside the clusters as well as on their borders. Paths are not optimal, they have to go through the
+entrances and the abstract search is weighted, but they are priced the way A* prices them and a leg goes on with the
+heading the last one arrived on. straighten() takes the sideways jogs to the entrances back out where that is cheaper.
+
+Nothing is precomputed up front: borders and intra-cluster edges are built the first time a query touches them, so a
+query only pays for the entrances around its corridor. The graph is kept between frames, update() only drops the
+clusters whose cell costs (or whose border entrances) changed. The intra-cluster edges are also remembered by
+content, the cell costs of the cluster plus its crossings and goals, so a cluster that looks like one built before
+(the many all-free ones, or the same scene after the grid moved) reuses those edges even when the grid geometry changed
+between frames. The waypoints of a frame are goals of their clusters, the edges into them are stored like the others.
+
+Cells here are flat indices y * rows + x into CostMap.cells, the searches inside a cluster run on a padded copy of
+its costs with states cell * 8 + heading.
+"""
+import heapq
+import logging
+from collections import OrderedDict
+
+from .costs import HEADINGS, INFINITY, START_TURN, cost_map, heading_change, heading_index
+from .instrumentation import NULL_PROFILER
+from .planner import Pathfinding
+
+log = logging.getLogger(__name__)
+
+# passable runs along a border longer than this get an entrance every this many cells and one at their far end,
+# shorter ones one in the middle
+ENTRANCE_SPACING = 6
+# the abstract search is weighted A*: it expands about a quarter of the nodes for a few percent longer paths
+HEURISTIC_WEIGHT = 2.0
+# the abstract node a query ends in
+GOAL = -1
+HEADING_OF = {step: heading for heading, step in enumerate(HEADINGS)}
+
+
+def _turns_needed():
+    """
+    :return: {(sign of dx, sign of dy, sign of |dx| - |dy|): [turns for heading 0..7]}, the 45° turns a path
+        towards cells in that direction needs at least: onto the one or two headings its octile steps go along and
+        between those two
+    """
+    table = {}
+    for sx in (-1, 0, 1):
+        for sy in (-1, 0, 1):
+            for longer in (-1, 0, 1):
+                needed = []
+                if longer and (sx, sy)[longer < 0]:
+                    needed.append(HEADING_OF[(sx, 0) if longer > 0 else (0, sy)])
+                if sx and sy:
+                    needed.append(HEADING_OF[(sx, sy)])
+                if not needed:
+                    continue
+                table[(sx, sy, longer)] = [min(heading_change(heading, h) for h in needed) + len(needed) - 1
+                                           for heading in range(len(HEADINGS))]
+    return table
+
+
+TURNS_NEEDED = _turns_needed()
+
+
+def local_search(layer, width, sources, targets, steps, successors):
+    """
+    Dijkstra over the (cell, heading) states of one cluster, states are cell * 8 + heading
+    :param layer: cell costs of the cluster row by row, with a ring of INFINITY around it so no step leaves it
+    :param width: cells per row of layer, the ring included
+    :param sources: [(state, cost), ...]
+    :param targets: states to report, the search stops once all of them are settled
+    :return: {target: (cost, [cells from the source to the target])} for the reachable targets
+    """
+    offsets = [dy * width + dx for dx, dy in HEADINGS]
+    remaining = set(targets)
+    dist = [INFINITY] * (len(layer) * 8)
+    parent = [None] * (len(layer) * 8)
+    heap = []
+    for state, cost in sources:
+        if cost < dist[state]:
+            dist[state] = cost
+            heap.append((cost, state))
+    heapq.heapify(heap)
+    found = {}
+    while heap and remaining:
+        d, state = heapq.heappop(heap)
+        if d > dist[state]:
+            continue
+        if state in remaining:
+            remaining.discard(state)
+            path = []
+            step = state
+            while step is not None:
+                path.append(step >> 3)
+                step = parent[step]
+            path.reverse()
+            found[state] = (d, path)
+        cell = state >> 3
+        for heading, turn in successors[state & 7]:
+            n = cell + offsets[heading]
+            next = n << 3 | heading
+            nd = d + steps[heading] + layer[n] + turn
+            # a step onto the ring or a blocked cell costs INFINITY and never gets below it
+            if nd < dist[next]:
+                dist[next] = nd
+                parent[next] = state
+                heapq.heappush(heap, (nd, next))
+    return found
+
+
+def straighten(route, heading, costs):
+    """
+    Rearrange the stretches of a route that only go along two neighbouring headings into one run along each, where
+    that is cheaper. The entrances make a route jog sideways to cross a border where they are, and every jog costs two
+    turns; the stretch between two jogs usually has room for a single turn instead.
+    :param route: [(x, y), ...] of 8-neighbours
+    :param heading: heading index the route starts on, None for none
+    :param costs: CostMap the route was planned on
+    :return: (route, cost saved)
+    """
+    runs = []
+    for (ax, ay), (bx, by) in zip(route, route[1:]):
+        step = HEADING_OF[(bx - ax, by - ay)]
+        if runs and runs[-1][0] == step:
+            runs[-1][1] += 1
+        else:
+            runs.append([step, 1])
+
+    def price(x, y, before, stretch, after):
+        # cost of driving the runs of stretch from (x, y), the turns into it and out of it included
+        cost = 0
+        for step, count in stretch:
+            cost += START_TURN if before is None else costs.turns[heading_change(before, step)]
+            dx, dy = HEADINGS[step]
+            for _ in range(count):
+                x, y = x + dx, y + dy
+                cost += costs.steps[step] + costs.cost(x, y)
+            before = step
+        if after is not None:
+            cost += costs.turns[heading_change(before, after)]
+        return cost
+
+    straightened = []
+    saved = 0
+    x, y = route[0]
+    before = heading
+    i = 0
+    while i < len(runs):
+        end = i + 1
+        for pair in ((runs[i][0], (runs[i][0] + 1) % 8), ((runs[i][0] - 1) % 8, runs[i][0])):
+            j = i
+            while j < len(runs) and runs[j][0] in pair:
+                j += 1
+            if j - i >= 2 and j > end:
+                end = j
+        stretch = runs[i:end]
+        if len(stretch) >= 2:
+            after = runs[end][0] if end < len(runs) else None
+            first, second = stretch[0][0], stretch[1][0]
+            counts = [sum(count for step, count in stretch if step == h) for h in (first, second)]
+            best = price(x, y, before, stretch, after)
+            for candidate in ([[first, counts[0]], [second, counts[1]]], [[second, counts[1]], [first, counts[0]]]):
+                cost = price(x, y, before, candidate, after)
+                if cost < best:
+                    saved += best - cost
+                    best, stretch = cost, candidate
+        straightened += stretch
+        for step, count in stretch:
+            dx, dy = HEADINGS[step]
+            x, y = x + dx * count, y + dy * count
+        before = stretch[-1][0]
+        i = end
+
+    x, y = route[0]
+    route = [(x, y)]
+    for step, count in straightened:
+        dx, dy = HEADINGS[step]
+        for _ in range(count):
+            x, y = x + dx, y + dy
+            route.append((x, y))
+    return route, saved
+
+
+class ClusterGraph:
+    """
+    Abstract graph over the cost map of one grid, reused between frames
+    """
+
+    def __init__(self, cluster_size=16, profiler=NULL_PROFILER, max_layouts=4096, entrance_spacing=ENTRANCE_SPACING):
+        """
+        :param cluster_size: cells per cluster side
+        :param profiler: receives the clusters_rebuilt counter
+        :param max_layouts: cluster layouts remembered across frames, least recently used ones are dropped first
+        :param entrance_spacing: cells between the entrances along a passable run of a border
+        """
+        self.cluster_size = cluster_size
+        self.profiler = profiler
+        self.max_layouts = max_layouts
+        self.entrance_spacing = entrance_spacing
+        self.costs = None  # the CostMap the graph is in line with
+        self.clusters = (0, 0)  # along y and x
+        self.goals = {}  # cluster -> frozenset of the goal cells in it
+        # (cluster, cluster) -> [(cell, cell, heading), ...] crossings of that border both ways, filled by border()
+        self.borders = {}
+        self.intra = {}  # cluster -> (x0, y0, layout), filled by cluster_edges()
+        # (cell costs, crossings out, goals, ...) -> (crossings out, goals, {source: edges}, padded cell costs, width)
+        # in cluster relative cells
+        self.layouts = OrderedDict()
+
+    def cluster_of(self, cell):
+        y, x = divmod(cell, self.costs.rows)
+        return y // self.cluster_size, x // self.cluster_size
+
+    def bounds(self, cluster):
+        size = self.cluster_size
+        return (cluster[1] * size, min(self.costs.rows, (cluster[1] + 1) * size),
+                cluster[0] * size, min(self.costs.columns, (cluster[0] + 1) * size))
+
+    def neighbor_clusters(self, cluster):
+        cy, cx = cluster
+        rows, cols = self.clusters
+        for ny, nx in ((cy - 1, cx), (cy + 1, cx), (cy, cx - 1), (cy, cx + 1)):
+            if 0 <= ny < rows and 0 <= nx < cols:
+                yield ny, nx
+
+    def update(self, costs, goals=()):
+        """
+        Bring the graph in line with a new cost map. Nothing is built here, borders and clusters are built the first
+        time a query touches them, so a new grid shape costs nothing up front.
+        :param costs: costs.CostMap of the grid
+        :param goals: cells the queries of this frame end in
+        :return: number of clusters invalidated
+        """
+        size = self.cluster_size
+        old = self.costs
+        self.costs = costs
+        by_cluster = {}
+        for cell in goals:
+            by_cluster.setdefault(self.cluster_of(cell), set()).add(cell)
+        goals = {cluster: frozenset(cells) for cluster, cells in by_cluster.items()}
+        if old is None or (old.rows, old.columns, old.steps, old.turns) != \
+                (costs.rows, costs.columns, costs.steps, costs.turns):
+            self.clusters = (-(-costs.columns // size), -(-costs.rows // size))
+            self.goals = goals
+            self.borders = {}
+            self.intra = {}
+            return self.clusters[0] * self.clusters[1]
+
+        # list slices compare in C, a row at a time and then a cluster wide piece of the rows that changed
+        dirty = set()
+        rows = costs.rows
+        if old.cells is not costs.cells:
+            for y in range(costs.columns):
+                start = y * rows
+                if old.cells[start:start + rows] == costs.cells[start:start + rows]:
+                    continue
+                for x in range(0, rows, size):
+                    end = start + min(x + size, rows)
+                    if old.cells[start + x:end] != costs.cells[start + x:end]:
+                        dirty.add((y // size, x // size))
+
+        # entrances live on the borders, a changed cell can move the entrances of both clusters it touches
+        invalid = set(dirty)
+        for cluster in dirty:
+            for other in self.neighbor_clusters(cluster):
+                self.borders.pop((min(cluster, other), max(cluster, other)), None)
+                invalid.add(other)
+        invalid.update(cluster for cluster in set(goals) | set(self.goals)
+                       if goals.get(cluster) != self.goals.get(cluster))
+        self.goals = goals
+        for cluster in invalid:
+            self.intra.pop(cluster, None)
+        return len(invalid)
+
+    def border(self, first, second):
+        """
+        :param first: cluster above or left of second
+        :return: [(cell, cell, heading), ...] crossings from a cell of one cluster into one of the other
+        """
+        crossings = self.borders.get((first, second))
+        if crossings is None:
+            crossings = self.borders[(first, second)] = self.find_entrances(first, second)
+        return crossings
+
+    def find_entrances(self, first, second):
+        x0, x1, y0, y1 = self.bounds(first)
+        rows, cells = self.costs.rows, self.costs.cells
+        if first[0] == second[0]:
+            # side by side, the border is a column and crossing it goes east or west
+            inside = [y * rows + x1 - 1 for y in range(y0, y1)]
+            across, along = (1, 0), (0, 1)
+        else:
+            inside = [(y1 - 1) * rows + x for x in range(x0, x1)]
+            across, along = (0, 1), (1, 0)
+        forward = across[1] * rows + across[0]
+        sideways = along[1] * rows + along[0]
+        border = set(inside)
+
+        entrances = []
+        run = []
+        for a in inside + [None]:
+            if a is not None and cells[a] != INFINITY and cells[a + forward] != INFINITY:
+                run.append(a)
+                continue
+            if len(run) > self.entrance_spacing:
+                entrances += run[::self.entrance_spacing]
+                if (len(run) - 1) % self.entrance_spacing:
+                    entrances.append(run[-1])
+            elif run:
+                entrances.append(run[len(run) // 2])
+            run = []
+
+        crossings = []
+        for a in entrances:
+            b = a + forward
+            for side in (0, -1, 1):
+                if side and a + side * sideways not in border:
+                    continue
+                dx, dy = side * along[0], side * along[1]
+                if cells[b + side * sideways] != INFINITY:
+                    crossings.append((a, b + side * sideways, HEADING_OF[(across[0] + dx, across[1] + dy)]))
+                if cells[a + side * sideways] != INFINITY:
+                    crossings.append((b, a + side * sideways, HEADING_OF[(dx - across[0], dy - across[1])]))
+        return crossings
+
+    def cluster_edges(self, cluster):
+        """
+        :return: (x0, y0, layout), the layout with cells relative to the cluster corner (x0, y0). Clusters with the same
+            cell costs, crossings and goals share one layout, whichever frame or position they came from, and its
+            edges are filled one source at a time as the searches ask for them
+        """
+        known = self.intra.get(cluster)
+        if known is not None:
+            return known
+        costs = self.costs
+        rows = costs.rows
+        x0, x1, y0, y1 = self.bounds(cluster)
+        exits = []
+        for other in self.neighbor_clusters(cluster):
+            for a, b, heading in self.border(min(cluster, other), max(cluster, other)):
+                if self.cluster_of(a) == cluster:
+                    exits.append((a % rows - x0, a // rows - y0, heading))
+        goals = sorted((cell % rows - x0, cell // rows - y0) for cell in self.goals.get(cluster, ()))
+        content = []
+        for y in range(y0, y1):
+            content += costs.cells[y * rows + x0:y * rows + x1]
+        key = (tuple(content), x1 - x0, tuple(sorted(exits)), tuple(goals), tuple(costs.steps), costs.turns)
+        layout = self.layouts.get(key)
+        if layout is None:
+            width = x1 - x0 + 2
+            layer = [INFINITY] * width
+            for y in range(y1 - y0):
+                layer += [INFINITY] + content[y * (width - 2):(y + 1) * (width - 2)] + [INFINITY]
+            layer += [INFINITY] * width
+            layout = self.layouts[key] = (exits, goals, {}, layer, width)
+            if len(self.layouts) > self.max_layouts:
+                self.layouts.popitem(last=False)
+            self.profiler.count("clusters_rebuilt")
+        else:
+            self.layouts.move_to_end(key)
+        known = self.intra[cluster] = (x0, y0, layout)
+        return known
+
+    def edges_from(self, cluster, cell, heading):
+        """
+        :param heading: heading index the cell was entered on, None for a start without one
+        :return: (x0, y0, exits, goals) out of the state in its cluster, relative cells. exits are
+            [(x, y, heading, cost, [cells]), ...], the cheapest way over each crossing out of the cluster to the cell
+            (x, y) on the other side, the turn onto it and that step included; goals [(x, y, cost, [cells]), ...] the
+            cheapest way to each goal of the cluster
+        """
+        x0, y0, layout = self.cluster_edges(cluster)
+        rows = self.costs.rows
+        source = (cell % rows - x0, cell // rows - y0, heading)
+        edges = layout[2].get(source)
+        if edges is None:
+            edges = layout[2][source] = self.search_cluster(layout, source)
+        return (x0, y0) + edges
+
+    def search_cluster(self, layout, source):
+        """
+        :param source: (x, y, heading) the search starts from, relative cell
+        :return: (exits, goals) of edges_from()
+        """
+        exits, goals, _, layer, width = layout
+        costs = self.costs
+        turns, steps = costs.turns, costs.steps
+        x, y, heading = source
+        cell = (y + 1) * width + x + 1
+        if heading is None:
+            sources = [(cell << 3 | h, START_TURN) for h in range(len(HEADINGS))]
+        else:
+            sources = [(cell << 3 | heading, 0)]
+        targets = set()
+        for x, y, out in exits:
+            a = (y + 1) * width + x + 1
+            targets.update(a << 3 | h for h in range(len(HEADINGS)) if turns[heading_change(h, out)] != INFINITY)
+        for x, y in goals:
+            a = (y + 1) * width + x + 1
+            targets.update(a << 3 | h for h in range(len(HEADINGS)))
+        found = local_search(layer, width, sources, targets, steps, costs.successors)
+
+        def cheapest(x, y, out=None):
+            # over the headings the cell is reached on, with the turn onto the crossing out when there is one
+            a = (y + 1) * width + x + 1
+            best_cost, best_path = INFINITY, None
+            for h in range(len(HEADINGS)):
+                entry = found.get(a << 3 | h)
+                if entry is not None:
+                    cost = entry[0] if out is None else entry[0] + turns[heading_change(h, out)]
+                    if cost < best_cost:
+                        best_cost, best_path = cost, [(c % width - 1, c // width - 1) for c in entry[1]]
+            return best_cost, best_path
+
+        out_edges = []
+        for x, y, out in exits:
+            cost, path = cheapest(x, y, out)
+            if cost != INFINITY:
+                dx, dy = HEADINGS[out]
+                out_edges.append((x + dx, y + dy, out, cost + steps[out], path + [(x + dx, y + dy)]))
+        goal_edges = []
+        for x, y in goals:
+            cost, path = cheapest(x, y)
+            if cost != INFINITY:
+                goal_edges.append((x, y, cost, path))
+        return out_edges, goal_edges
+
+    def find_path(self, start, goal, heading=None):
+        """
+        :param start: cell
+        :param goal: cell
+        :param heading: heading index the leg starts on, None when it has none
+        :return: ([(x, y) from start to goal], cost), or (None, None) when the goal is unreachable
+        """
+        costs = self.costs
+        cells, rows, steps = costs.cells, costs.rows, costs.steps
+        if cells[goal] == INFINITY:
+            return None, None
+        goal_cluster = self.cluster_of(goal)
+        if goal not in self.goals.get(goal_cluster, ()):
+            # not one update() was told about, its cluster gets a layout with it
+            self.goals[goal_cluster] = self.goals.get(goal_cluster, frozenset()) | {goal}
+            self.intra.pop(goal_cluster, None)
+        gy, gx = divmod(goal, rows)
+        straight, diagonal = steps[HEADING_OF[(1, 0)]], steps[HEADING_OF[(1, 1)]]
+        turn = min(cost / change for change, cost in enumerate(costs.turns) if change and cost != INFINITY)
+
+        first = (start, heading)
+        frontier = [(0, 0, 0, first)]
+        cost_so_far = {first: 0}
+        # node -> (node before it, x0 and y0 of its cluster, relative cells from there to node)
+        came_from = {first: None}
+        expanded = 0
+        pushes = 1
+        while frontier:
+            _, _, cost, node = heapq.heappop(frontier)
+            if node == GOAL:
+                break
+            if cost > cost_so_far[node]:
+                continue
+            expanded += 1
+            cell, entered = node
+            cluster = self.cluster_of(cell)
+            x0, y0, exits, goals = self.edges_from(cluster, cell, entered)
+            origin = y0 * rows + x0
+            for x, y, out, edge_cost, path in exits:
+                crossed = origin + y * rows + x
+                new_cost = cost + edge_cost + cells[crossed]
+                next = (crossed, out)
+                if new_cost < cost_so_far.get(next, INFINITY):
+                    cost_so_far[next] = new_cost
+                    came_from[next] = (node, x0, y0, path)
+                    dx, dy = gx - x0 - x, gy - y0 - y
+                    ax, ay = abs(dx), abs(dy)
+                    # octile steps plus the turns they need, see _turns_needed()
+                    estimate = straight * abs(ax - ay) + diagonal * min(ax, ay)
+                    if ax or ay:
+                        estimate += turn * TURNS_NEEDED[((dx > 0) - (dx < 0), (dy > 0) - (dy < 0),
+                                                         (ax > ay) - (ax < ay))][out]
+                    heapq.heappush(frontier, (new_cost + HEURISTIC_WEIGHT * estimate, pushes, new_cost, next))
+                    pushes += 1
+            if cluster == goal_cluster:
+                for x, y, edge_cost, path in goals:
+                    if origin + y * rows + x == goal and cost + edge_cost < cost_so_far.get(GOAL, INFINITY):
+                        cost_so_far[GOAL] = cost + edge_cost
+                        came_from[GOAL] = (node, x0, y0, path)
+                        heapq.heappush(frontier, (cost + edge_cost, pushes, cost + edge_cost, GOAL))
+                        pushes += 1
+        self.profiler.count("nodes_expanded", expanded)
+        self.profiler.count("heap_pushes", pushes)
+        if GOAL not in came_from:
+            return None, None
+
+        # refine: swap every abstract edge for the cells it stands for, each one begins where the one before ended
+        segments = []
+        node = GOAL
+        while came_from[node] is not None:
+            node, x0, y0, path = came_from[node]
+            segments.append([(x + x0, y + y0) for x, y in path])
+        route = segments[-1][:1]
+        for segment in reversed(segments):
+            route += segment[1:]
+        route, saved = straighten(route, heading, costs)
+        return route, cost_so_far[GOAL] - saved
+
+
+class HierarchicalPathfinding(Pathfinding):
+    """
+    Pathfinding on a ClusterGraph, the graph is kept in cache so consecutive frames only rebuild what changed
+    """
+
+    def __init__(self, grid, waypoints, profiler=NULL_PROFILER, cache=None, cluster_size=16):
+        super().__init__(grid, waypoints, profiler, cache)
+        self.graph = self.cache.get("hpa")
+        if self.graph is None or self.graph.cluster_size != cluster_size:
+            self.graph = self.cache["hpa"] = ClusterGraph(cluster_size, profiler)
+        self.graph.profiler = profiler
+        goals = []
+        for waypoint in waypoints:
+            x, y = grid.get_index_from_position(waypoint.x, waypoint.y)
+            if 0 <= x < grid.rows and 0 <= y < grid.columns:
+                goals.append(y * grid.rows + x)
+        self.graph.update(cost_map(grid), goals)
+
+    def search(self, start, goal):
+        log.info("Finding hierarchical path from {} to {}".format(start, goal))
+        if start.coordinates == goal.coordinates:
+            return {start: None}, {start: 0}, start
+        rows = self.grid.rows
+        (sx, sy), (gx, gy) = start.coordinates, goal.coordinates
+        cells, cost = self.graph.find_path(sy * rows + sx, gy * rows + gx, heading_index(start.direction))
+        if cells is None:
+            return {start: None}, {start: 0}, start
+        came_from, finish = self.chain(cells, start)
+        return came_from, {finish: cost}, finish
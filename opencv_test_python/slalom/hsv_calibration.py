@@ -0,0 +1,221 @@
+"""
+HSV thresholds found from labelled frames instead of the trackbars.
+
+Cones and obstacles go through the same inRange box in Pipeline.process, so the box should hold every pixel of a
+marked cone or obstacle and nothing of the floor around them. HSVCalibrator builds two HSV histograms once, one of the
+pixels inside the marked regions and one of everything else, and turns each into a summed volume table: the number of
+pixels of either kind inside any box of bins then takes eight lookups, whatever the size of the box or the number of
+frames. That makes scoring a candidate box cheap enough to score tens of thousands of them, numpy does a whole batch
+at once, instead of running inRange over the frames per candidate.
+
+search() scores random boxes first and then moves single bounds of the best ones bin by bin while that still helps.
+A box scores the F1 of its pixels against the marks. Bounds fall on bin edges, so the pixel counts and the score of a
+box are exact; BINS sets the resolution, one bin spans 2 hue and 4 saturation and value steps by default. Pixels
+within IGNORE px of a region border count for neither side, marks are never that precise.
+
+Labels are ArenaTruth.to_dict() per frame: "cones" as centres with "cone_size" or as ((x, y), (w, h), angle) rotated
+rectangles, "obstacles" as rotated rectangles. python -m slalom.hsv_calibration [synthetic|<dataset> <labels.json>]
+[candidates] prints the best thresholds like the trackbar scripts do.
+"""
+import json
+import logging
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from .sweep import load_dataset
+
+log = logging.getLogger(__name__)
+
+BINS = (90, 64, 64)
+RANGES = (180, 256, 256)  # OpenCV 8 bit HSV, hue is 0..179
+IGNORE = 2  # px
+REFINE_STEPS = (1, 2, 4, 8)  # bins a bound is moved by per refinement try
+BATCH = 4096
+
+
+def region_mask(shape, labels):
+    """
+    :param labels: ArenaTruth.to_dict() of the frame
+    :return: uint8 mask, 255 inside the marked cones and obstacles
+    """
+    mask = np.zeros(shape[:2], dtype=np.uint8)
+    regions = list(labels.get("obstacles", []))
+    for cone in labels.get("cones", []):
+        if len(cone) == 2 and not isinstance(cone[0], (list, tuple)):
+            size = labels["cone_size"]
+            regions.append(((cone[0], cone[1]), (size, size), 0))
+        else:
+            regions.append(cone)
+    for center, size, angle in regions:
+        box = cv2.boxPoints((tuple(center), tuple(size), angle))
+        cv2.fillConvexPoly(mask, np.intp(np.round(box)), 255)
+    return mask
+
+
+class HSVCalibrator:
+    """
+    Histograms of the marked and unmarked pixels and box scoring on them, see the module docstring
+    """
+
+    def __init__(self, frames, labels, bins=BINS):
+        """
+        :param frames: BGR images
+        :param labels: ArenaTruth.to_dict() per frame, in the same order
+        """
+        self.bins = tuple(bins)
+        self.step = [r / float(b) for r, b in zip(RANGES, bins)]
+        inside = np.zeros(self.bins, dtype=np.float64)
+        outside = np.zeros(self.bins, dtype=np.float64)
+        kernel = np.ones((2 * IGNORE + 1, 2 * IGNORE + 1), np.uint8)
+        for frame, label in zip(frames, labels):
+            hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+            marked = region_mask(frame.shape, label)
+            core = cv2.erode(marked, kernel)
+            rest = cv2.bitwise_not(cv2.dilate(marked, kernel))
+            ranges = [0, RANGES[0], 0, RANGES[1], 0, RANGES[2]]
+            inside += cv2.calcHist([hsv], [0, 1, 2], core, list(self.bins), ranges)
+            outside += cv2.calcHist([hsv], [0, 1, 2], rest, list(self.bins), ranges)
+        self.positives = inside.sum()
+        if not self.positives:
+            raise ValueError("No labelled pixels in the frames")
+        self._inside = self._summed_volume(inside)
+        self._outside = self._summed_volume(outside)
+        self.scored = 0
+
+    @staticmethod
+    def _summed_volume(histogram):
+        table = np.zeros(tuple(b + 1 for b in histogram.shape), dtype=np.int64)
+        table[1:, 1:, 1:] = histogram.astype(np.int64).cumsum(0).cumsum(1).cumsum(2)
+        return table
+
+    @staticmethod
+    def _count(table, low, high):
+        """
+        :param low: (n, 3) first bins of the boxes
+        :param high: (n, 3) bins after the boxes
+        :return: pixels inside each box
+        """
+        h0, s0, v0 = low.T
+        h1, s1, v1 = high.T
+        return (table[h1, s1, v1] - table[h0, s1, v1] - table[h1, s0, v1] - table[h1, s1, v0] +
+                table[h0, s0, v1] + table[h0, s1, v0] + table[h1, s0, v0] - table[h0, s0, v0])
+
+    def score(self, low, high):
+        """
+        :return: F1 of each box of bins [low, high) against the marks
+        """
+        self.scored += len(low)
+        true_positives = self._count(self._inside, low, high)
+        false_positives = self._count(self._outside, low, high)
+        return 2.0 * true_positives / (self.positives + true_positives + false_positives)
+
+    def thresholds(self, low, high):
+        """
+        :return: Pipeline attributes hMin..vMax of the box of bins [low, high)
+        """
+        lower = [int(round(b * s)) for b, s in zip(low, self.step)]
+        upper = [int(round(b * s)) - 1 for b, s in zip(high, self.step)]
+        names = ("hMin", "sMin", "vMin", "hMax", "sMax", "vMax")
+        return dict(zip(names, lower + upper))
+
+    def _refine(self, low, high, best):
+        """
+        Move single bounds of one box while that raises its score
+        """
+        bins = np.array(self.bins)
+        improved = True
+        while improved:
+            improved = False
+            lows, highs = [], []
+            for axis in range(3):
+                for step in REFINE_STEPS:
+                    for sign in (-1, 1):
+                        for bound in (low, high):
+                            moved_low, moved_high = low.copy(), high.copy()
+                            (moved_low if bound is low else moved_high)[axis] += sign * step
+                            lows.append(moved_low)
+                            highs.append(moved_high)
+            lows, highs = np.array(lows), np.array(highs)
+            valid = (lows >= 0).all(1) & (highs <= bins).all(1) & (lows < highs).all(1)
+            lows, highs = lows[valid], highs[valid]
+            scores = self.score(lows, highs)
+            i = int(np.argmax(scores))
+            if scores[i] > best:
+                low, high, best = lows[i], highs[i], float(scores[i])
+                improved = True
+        return low, high, best
+
+    def search(self, candidates=20000, keep=8, seed=0):
+        """
+        :param candidates: random boxes scored before the refinement
+        :param keep: best random boxes refined
+        :return: (thresholds, F1)
+        """
+        rng = np.random.RandomState(seed)
+        bins = np.array(self.bins)
+        best = []
+        for start in range(0, candidates, BATCH):
+            n = min(BATCH, candidates - start)
+            a = rng.randint(0, bins + 1, size=(n, 3))
+            b = rng.randint(0, bins + 1, size=(n, 3))
+            low, high = np.minimum(a, b), np.maximum(a, b)
+            valid = (low < high).all(1)
+            low, high = low[valid], high[valid]
+            scores = self.score(low, high)
+            for i in np.argsort(scores)[-keep:]:
+                best.append((float(scores[i]), low[i], high[i]))
+            best = sorted(best, key=lambda entry: entry[0])[-keep:]
+        results = [self._refine(low, high, score) for score, low, high in best]
+        low, high, score = max(results, key=lambda result: result[2])
+        return self.thresholds(low, high), score
+
+
+def measure(frames, labels, thresholds):
+    """
+    :return: the pixel F1 inRange really gets with thresholds, over the same pixels HSVCalibrator counts
+    """
+    kernel = np.ones((2 * IGNORE + 1, 2 * IGNORE + 1), np.uint8)
+    lower = np.array([thresholds[name] for name in ("hMin", "sMin", "vMin")])
+    upper = np.array([thresholds[name] for name in ("hMax", "sMax", "vMax")])
+    true_positives = false_positives = positives = 0
+    for frame, label in zip(frames, labels):
+        selected = cv2.inRange(cv2.cvtColor(frame, cv2.COLOR_BGR2HSV), lower, upper) > 0
+        marked = region_mask(frame.shape, label)
+        core = cv2.erode(marked, kernel) > 0
+        rest = cv2.dilate(marked, kernel) == 0
+        positives += int(core.sum())
+        true_positives += int((selected & core).sum())
+        false_positives += int((selected & rest).sum())
+    return 2.0 * true_positives / (positives + true_positives + false_positives)
+
+
+def main(argv):
+    dataset = argv[0] if argv else "synthetic"
+    argv = argv[1:]
+    names, frames, truth = load_dataset(dataset)
+    if dataset != "synthetic":
+        with open(argv[0]) as f:
+            truth = json.load(f)
+        argv = argv[1:]
+    frames = [frame for name, frame in zip(names, frames) if name in truth]
+    labels = [truth[name] for name in names if name in truth]
+    candidates = int(argv[0]) if argv else 20000
+
+    began = time.perf_counter()
+    calibrator = HSVCalibrator(frames, labels)
+    built = time.perf_counter()
+    thresholds, score = calibrator.search(candidates)
+    done = time.perf_counter()
+    print("histograms of {} frames in {:.0f} ms, {} boxes scored in {:.0f} ms".format(
+        len(frames), (built - began) * 1000, calibrator.scored, (done - built) * 1000))
+    print("(hMin = %d , sMin = %d, vMin = %d), (hMax = %d , sMax = %d, vMax = %d)" % tuple(
+        thresholds[name] for name in ("hMin", "sMin", "vMin", "hMax", "sMax", "vMax")))
+    print("pixel F1 {:.4f} from the histograms, {:.4f} with inRange".format(score, measure(frames, labels, thresholds)))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main(sys.argv[1:])
@@ -0,0 +1,215 @@
+import csv
+import json
+import logging
+import time
+from collections import deque, OrderedDict
+
+log = logging.getLogger(__name__)
+
+
+class _NullStage:
+    """
+    Shared do-nothing context manager, what a disabled profiler hands out
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Profiler:
+    """
+    Per-frame stage timers and counters with rolling percentiles.
+
+    Wrap every stage in "with profiler.stage(name):" and report work with profiler.count(name, n). frame_start()
+    and frame_end() delimit a frame; frame_end() pushes the frame's record into the rolling windows and to every
+    attached sink. A disabled profiler returns a shared no-op context manager, so instrumented code costs one method
+    call per stage. Hot loops should count locally and report the total once.
+    """
+
+    def __init__(self, stages=(), counters=(), window=300, enabled=True):
+        """
+        :param stages: stage names known up front, they keep this order in overlay and exports
+        :param counters: counter names known up front
+        :param window: number of frames the percentiles are computed over
+        :param enabled: collect anything at all
+        """
+        self.enabled = enabled
+        self.window = window
+        self.stages = list(stages)
+        self.counters = list(counters)
+        self.frame = 0
+        self.sinks = []
+
+        self._times = OrderedDict((name, 0.0) for name in self.stages)
+        self._counts = OrderedDict((name, 0) for name in self.counters)
+        self._history = {}
+        self._frame_start = None
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def add_time(self, name, seconds):
+        if name not in self._times:
+            self.stages.append(name)
+            self._times[name] = 0.0
+        self._times[name] += seconds
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        if name not in self._counts:
+            self.counters.append(name)
+            self._counts[name] = 0
+        self._counts[name] += n
+
+    def frame_start(self):
+        if not self.enabled:
+            return
+        for name in self._times:
+            self._times[name] = 0.0
+        for name in self._counts:
+            self._counts[name] = 0
+        self._frame_start = time.perf_counter()
+
+    def frame_end(self):
+        """
+        :return: the finished frame's record (times in ms), None when disabled
+        """
+        if not self.enabled or self._frame_start is None:
+            return None
+        total = time.perf_counter() - self._frame_start
+        self._frame_start = None
+
+        record = OrderedDict()
+        record["frame"] = self.frame
+        record["timestamp"] = time.time()
+        record["total_ms"] = total * 1000
+        for name, seconds in self._times.items():
+            record[name + "_ms"] = seconds * 1000
+        for name, n in self._counts.items():
+            record[name] = n
+        self.frame += 1
+
+        for key, value in record.items():
+            if key in ("frame", "timestamp"):
+                continue
+            history = self._history.get(key)
+            if history is None:
+                history = self._history[key] = deque(maxlen=self.window)
+            history.append(value)
+
+        for sink in self.sinks:
+            sink.write(record)
+        return record
+
+    def percentiles(self, key, q=(50, 95, 99)):
+        """
+        :param key: record key, e.g. "hsv_ms" or "nodes_expanded"
+        :return: percentiles over the rolling window, None if nothing was recorded yet
+        """
+        import numpy as np  # keeps numpy out of planner-only workers
+        history = self._history.get(key)
+        if not history:
+            return None
+        return np.percentile(np.fromiter(history, dtype=np.float64, count=len(history)), q)
+
+    def summary(self):
+        """
+        :return: list of (key, p50, p95, p99) for every stage and counter
+        """
+        keys = ["total_ms"] + [name + "_ms" for name in self.stages] + list(self.counters)
+        rows = []
+        for key in keys:
+            p = self.percentiles(key)
+            if p is not None:
+                rows.append((key, float(p[0]), float(p[1]), float(p[2])))
+        return rows
+
+    def draw_overlay(self, image, origin=(10, 20), line_height=16, color=(0, 255, 255)):
+        """
+        Draw p50/p95/p99 of every stage and counter onto image
+        """
+        import cv2  # HighGUI only comes in once something is drawn
+        x, y = origin
+        cv2.putText(image, "{:<16}{:>8}{:>8}{:>8}".format("stage", "p50", "p95", "p99"), (x, y),
+                    cv2.FONT_HERSHEY_PLAIN, 1, color, 1)
+        for key, p50, p95, p99 in self.summary():
+            y += line_height
+            cv2.putText(image, "{:<16}{:>8.1f}{:>8.1f}{:>8.1f}".format(key, p50, p95, p99), (x, y),
+                        cv2.FONT_HERSHEY_PLAIN, 1, color, 1)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+        self.sinks = []
+
+
+class StatsWriter:
+    """
+    Profiler sink writing one line per frame, CSV or JSON Lines depending on the file extension (.csv / .jsonl)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.csv = path.endswith(".csv")
+        self._file = open(path, "w", newline="" if self.csv else None)
+        self._writer = None
+        self._fields = []
+
+    def write(self, record):
+        if self.csv:
+            new = [key for key in record if key not in self._fields]
+            if new:
+                self._add_columns(new)
+            self._writer.writerow(record)
+        else:
+            self._file.write(json.dumps(record))
+            self._file.write("\n")
+
+    def _add_columns(self, names):
+        """
+        A stage or counter showed up for the first time: rewrite what is there under the wider header, older rows
+        get empty cells for the new columns
+        """
+        rows = []
+        if self._writer is not None:
+            self._file.close()
+            with open(self.path, newline="") as f:
+                rows = list(csv.DictReader(f))
+            self._file = open(self.path, "w", newline="")
+        self._fields += names
+        self._writer = csv.DictWriter(self._file, fieldnames=self._fields, restval="")
+        self._writer.writeheader()
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+NULL_PROFILER = Profiler(enabled=False)
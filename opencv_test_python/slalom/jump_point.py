@@ -0,0 +1,244 @@
+"""
+Jump point search over the same (cell, heading) states as Pathfinding.search.
+
+The cost model of costs.cost_map() charges a turn cost for every change of heading and, for every step, its length
+plus the cost of the cell entered. Along a run of cells of equal cost on one heading, leaving the run at any of its
+cells costs the same, so instead of pushing every cell of the run an expansion walks the whole ray in one go and
+only pushes turns at cells where turning can reach something the cells before could not:
+
+* the cell in front is blocked, off the grid or costs something else than this one
+* a cell beside the ray costs something else here than it did for the previous cell (the corner of an obstacle, the
+  edge of an AVOID zone)
+* the goal lies on one of the ±45° headings
+* one of the ±45° rays from the cell passes such a corner or a change of cost (the recursive rule of JPS)
+* the cell is a waypoint
+
+At a jump point both ±45° turns are pushed, plus the ±90° corners the plain search makes by turning twice in a row.
+That needs a turn table that only allows ±45° per step, the default one. With anything sharper allowed search()
+falls back to Pathfinding.search.
+
+It also falls back on graded cost maps, where the open cells do not all cost the same: every ring of an AVOID zone
+and every step of a cost layer is a change of cost, each one makes jump points along every ray that crosses it and
+the rays end up walked and pushed more often than the plain search visits the cells. Jumping pays off on uniform
+grids, cones and obstacles without AVOID margins.
+"""
+import heapq
+import logging
+
+from .costs import HEADINGS, INFINITY, START_TURN, cost_map, heading_index
+from .grid import GridRectangle
+from .instrumentation import NULL_PROFILER
+from .planner import Pathfinding
+
+log = logging.getLogger(__name__)
+
+BORDER = 2  # blocked cells around the padded cell layer
+
+
+class JumpPointPathfinding(Pathfinding):
+    """
+    Pathfinding that jumps along runs of equal cost, same path cost as Pathfinding.search with far fewer heap pushes
+    on uniform grids, Pathfinding.search itself on the others
+    """
+
+    def __init__(self, grid, waypoints, profiler=NULL_PROFILER, cache=None):
+        super().__init__(grid, waypoints, profiler, cache)
+        self.costs = cost_map(grid)
+        self.turn_cost = self.costs.turns[1]
+        # sharper turns than ±45° break the turn rules, graded costs make jump points everywhere, see the module
+        # docstring
+        self.jumps = self.costs.turns[2] == INFINITY and len(set(self.costs.cells) - {INFINITY}) <= 1
+        if not self.jumps:
+            return
+        # the cell layer with a border of two blocked cells, neighbours of neighbours are looked up without bounds
+        # checks. Cells are flat indices into it from here on, see index()
+        self.width = grid.rows + 2 * BORDER
+        self.padded = [INFINITY] * (self.width * (grid.columns + 2 * BORDER))
+        for y in range(grid.columns):
+            row = self.costs.cells[y * grid.rows:(y + 1) * grid.rows]
+            self.padded[self.index(0, y):self.index(grid.rows, y)] = row
+        self.waypoint_cells = {self.index(i % grid.rows, i // grid.rows) for i, code in enumerate(grid.cells)
+                               if code == GridRectangle.WAYPOINT}
+        self.offsets = [dy * self.width + dx for dx, dy in HEADINGS]
+        self.sides = [[self.offsets[(heading + turn) % 8] for turn in (-1, 1, -2, 2)] for heading in range(8)]
+        self.rays = {}  # ray_turns() answers, they only depend on the grid
+
+    def index(self, x, y):
+        return (y + BORDER) * self.width + x + BORDER
+
+    def has_forced_turn(self, i, heading):
+        """
+        :return: True when a cell beside the ray is open at i and costs something else than it did for the previous
+            cell of the ray, the corner of an obstacle or the edge of an AVOID zone
+        """
+        padded = self.padded
+        previous = i - self.offsets[heading]
+        for side in self.sides[heading]:
+            cost = padded[i + side]
+            if cost != INFINITY and cost != padded[previous + side]:
+                return True
+        return False
+
+    def is_jump_point(self, i, x, y, heading, goal):
+        """
+        :return: True when turning at (x, y), flat index i, is worth a heap push
+        """
+        if (self.padded[i + self.offsets[heading]] != self.padded[i] or i in self.waypoint_cells or
+                self.has_forced_turn(i, heading)):
+            return True
+        gx, gy = goal
+        for turn in (heading - 1, heading + 1):
+            turn %= 8
+            tx, ty = HEADINGS[turn]
+            # the goal is straight ahead after turning here, or the turned ray runs past a corner or a change of cost
+            if aligned(gx - x, gy - y, tx, ty) or self.ray_turns(i + self.offsets[turn], turn):
+                return True
+        return False
+
+    def ray_turns(self, i, heading):
+        """
+        :return: True when the ray from flat index i along heading passes a forced turn or a change of cost,
+            remembered for every cell walked
+        """
+        padded = self.padded
+        step = self.offsets[heading]
+        walked = []
+        found = False
+        while padded[i] != INFINITY:
+            known = self.rays.get((i, heading))
+            if known is not None:
+                found = known
+                break
+            walked.append((i, heading))
+            ahead = padded[i + step]
+            if (ahead != INFINITY and ahead != padded[i]) or self.has_forced_turn(i, heading):
+                found = True
+                break
+            i += step
+        for state in walked:
+            self.rays[state] = found
+        return found
+
+    def search(self, start, goal):
+        if not self.jumps:
+            return super().search(start, goal)
+        log.info("Finding jump point path from {} to {}".format(start, goal))
+        goal_cell = goal.coordinates
+        start_state = start.coordinates + (heading_index(start.direction),)
+        steps = self.costs.steps
+        padded = self.padded
+        frontier = []
+        cost_so_far = {}
+        came_from = {}
+        closed = set()
+        pushes = 0
+        expanded = 0
+        current = start_state
+
+        def push(state, parent, cost):
+            nonlocal pushes
+            if state not in cost_so_far or cost < cost_so_far[state]:
+                cost_so_far[state] = cost
+                came_from[state] = parent
+                heapq.heappush(frontier, (cost + self.cell_heuristic(state, goal_cell), pushes, state))
+                pushes += 1
+
+        push(start_state, None, 0)
+        while frontier:
+            _, _, current = heapq.heappop(frontier)
+            if current in closed:
+                continue
+            x, y, heading = current
+            if (x, y) == goal_cell:
+                break
+            closed.add(current)
+            expanded += 1
+            cost = cost_so_far[current]
+            i = self.index(x, y)
+            if heading is None:
+                for turn, (dx, dy) in enumerate(HEADINGS):
+                    entered = padded[i + self.offsets[turn]]
+                    if entered != INFINITY:
+                        push((x + dx, y + dy, turn), current, cost + steps[turn] + entered + START_TURN)
+                continue
+
+            jump = current
+            dx, dy = HEADINGS[heading]
+            step = self.offsets[heading]
+            while True:
+                if (x, y) == goal_cell:
+                    push((x, y, heading), jump, cost)
+                    break
+                if self.is_jump_point(i, x, y, heading, goal_cell):
+                    if jump != (x, y, heading):
+                        # its own expansion turns there and walks on
+                        push((x, y, heading), jump, cost)
+                        break
+                    self.push_turns(push, jump, i, cost)
+                ahead = padded[i + step]
+                if ahead == INFINITY:
+                    break
+                x, y, i = x + dx, y + dy, i + step
+                cost += steps[heading] + ahead
+
+        self.profiler.count("nodes_expanded", expanded)
+        self.profiler.count("heap_pushes", pushes)
+        return self.unfold(came_from, cost_so_far, current, start)
+
+    def push_turns(self, push, state, i, cost):
+        """
+        Push the ±45° turns out of state at flat index i, plus the sharp ±90° corners the plain search gets by turning
+        twice in a row
+        """
+        x, y, heading = state
+        steps = self.costs.steps
+        for side in (-1, 1):
+            turn = (heading + side) % 8
+            tx, ty = HEADINGS[turn]
+            turned_i = i + self.offsets[turn]
+            entered = self.padded[turned_i]
+            if entered == INFINITY:
+                continue
+            turned = cost + steps[turn] + entered + self.turn_cost
+            push((x + tx, y + ty, turn), state, turned)
+            corner = (heading + 2 * side) % 8
+            cx, cy = HEADINGS[corner]
+            entered = self.padded[turned_i + self.offsets[corner]]
+            if entered != INFINITY:
+                push((x + tx + cx, y + ty + cy, corner), (x + tx, y + ty, turn),
+                     turned + steps[corner] + entered + self.turn_cost)
+
+    def cell_heuristic(self, state, goal_cell):
+        # Pathfinding.heuristic in cells: the pixel distance between the cell centres
+        return self.grid.grid_size * ((state[0] - goal_cell[0]) ** 2 + (state[1] - goal_cell[1]) ** 2) ** 0.5
+
+    def unfold(self, came_from, cost_so_far, finish, start):
+        """
+        Fill in the cells between consecutive jump points and hand back search()'s (came_from, cost, finish)
+        """
+        states = []
+        state = finish
+        while state is not None:
+            states.append(state)
+            state = came_from[state]
+        states.reverse()
+        cells = [states[0][:2]]
+        for (px, py, _), (x, y, heading) in zip(states, states[1:]):
+            # both a turn and a jump reach the next state along its own heading
+            dx, dy = HEADINGS[heading]
+            while (px, py) != (x, y):
+                px, py = px + dx, py + dy
+                cells.append((px, py))
+        rects, last = self.chain(cells, start)
+        return rects, {last: cost_so_far[finish]}, last
+
+
+def aligned(dx, dy, hx, hy):
+    """
+    :return: True when (dx, dy) is a positive multiple of the unit step (hx, hy)
+    """
+    if hx == 0:
+        return dx == 0 and dy * hy > 0
+    if hy == 0:
+        return dy == 0 and dx * hx > 0
+    return dx == dy * hx * hy and dx * hx > 0
@@ -0,0 +1,342 @@
+"""
+Hybrid A* for the car: paths it can actually drive with its turn radius and footprint.
+
+Poses are continuous (x, y in cells, heading in one of HEADING_BINS bins), the closed set is per (cell, heading bin).
+Every expansion applies the same six motion primitives, hard left, straight and hard right in both gears, each an arc
+of the car's turn radius that turns a whole number of heading bins, so headings never drift off their bins and the
+primitives can be tabulated once per grid resolution: end pose, cost and the points sampled along the arc. Reversing
+costs extra, but without it the car could not turn around anywhere narrower than twice its turn radius.
+
+The footprint check is a lookup: the configuration space holds, per heading bin, the obstacles dilated by the car
+rectangle rotated to that heading, so a pose collides exactly when its cell is set in the map of its heading. A leg
+ends as soon as a sample enters the waypoint's cell, the primitive it is on is cut there.
+
+The heuristic is the usual obstacle-aware one of Hybrid A*: octile distances from the waypoint over the cells the car
+fits into with at least one heading, one Dijkstra per leg that only runs as far as the poses looked up need, weighted
+by HEURISTIC_WEIGHT. Poses it cannot reach are never pushed.
+"""
+import copy
+import heapq
+import logging
+from math import ceil, cos, floor, hypot, pi, sin, sqrt
+
+import numpy as np
+
+from .grid import GridRectangle
+from .instrumentation import NULL_PROFILER
+from .measurements import CAR_LENGTH, CAR_TURN_RADIUS, CAR_WIDTH, CONE_WIDTH
+from .planner import Pathfinding
+
+log = logging.getLogger(__name__)
+
+HEADING_BINS = 16
+STEER_COST = 1.1  # arcs cost this much more than straight segments of the same length
+REVERSE_COST = 2.0  # and reversing this much more than driving forwards
+SAMPLE_SPACING = 0.5  # cells between the collision samples along a primitive
+# the holonomic distance knows nothing of the turn radius, turning the car around costs far more than it says. Weighting
+# it keeps a leg that starts facing away from its waypoint from expanding every pose around the car, for legs at most
+# this much dearer than the cheapest
+HEURISTIC_WEIGHT = 2.0
+# poses expanded per leg before giving up, keeps an unreachable waypoint from eating the frame
+MAX_EXPANSIONS = 5000
+# cell_mm is measured from the cones every frame, rounding it to this step keeps the noise from rebuilding the tables
+CELL_MM_STEP = 0.25
+
+SQRT2 = sqrt(2)
+STEPS = ((-1, -1, SQRT2), (-1, 0, 1), (-1, 1, SQRT2), (0, -1, 1), (0, 1, 1), (1, -1, SQRT2), (1, 0, 1), (1, 1, SQRT2))
+INFINITY = float("inf")
+
+
+def motion_primitives(turn_radius, bins=HEADING_BINS):
+    """
+    :param turn_radius: in cells
+    :return: per heading bin a list of (dx, dy, end bin, cost, [(dx, dy, bin) samples], gear) in cells, the cost is
+        the length weighted by STEER_COST and REVERSE_COST, gear is 1 forwards and -1 in reverse
+    """
+    step = 2 * pi / bins
+    # as few whole bins of turning as leave the cell
+    turns = max(1, int(ceil(sqrt(2) / (turn_radius * step))))
+    length = turn_radius * step * turns
+    samples = max(2, int(ceil(length / SAMPLE_SPACING)))
+    table = []
+    for k in range(bins):
+        theta = k * step
+        primitives = []
+        for gear, steer in ((1, -1), (1, 0), (1, 1), (-1, -1), (-1, 0), (-1, 1)):
+            points = []
+            for i in range(1, samples + 1):
+                t = gear * length * i / samples
+                if steer == 0:
+                    dx, dy, angle = t * cos(theta), t * sin(theta), theta
+                else:
+                    curvature = steer / turn_radius
+                    angle = theta + curvature * t
+                    dx = (sin(angle) - sin(theta)) / curvature
+                    dy = (cos(theta) - cos(angle)) / curvature
+                points.append((dx, dy, int(round(angle / step)) % bins))
+            end_x, end_y, end_bin = points[-1]
+            cost = length * (1 if steer == 0 else STEER_COST) * (1 if gear > 0 else REVERSE_COST)
+            primitives.append((end_x, end_y, end_bin, cost, points, gear))
+        table.append(primitives)
+    return table
+
+
+def footprint_kernels(length, width, bins=HEADING_BINS):
+    """
+    :param length: car length in cells
+    :param width: car width in cells
+    :return: per heading bin a uint8 mask of the cells whose centres the car rectangle covers, centred on the car and
+        rotated to that heading. Obstacles take every cell they touch, rounding the car outwards as well would close
+        gaps it fits through
+    """
+    size = int(ceil(hypot(length, width))) | 1
+    offsets = np.arange(size) - size // 2
+    dx, dy = np.meshgrid(offsets, offsets)
+    kernels = []
+    for k in range(bins):
+        theta = 2 * pi * k / bins
+        along = dx * cos(theta) + dy * sin(theta)
+        across = dy * cos(theta) - dx * sin(theta)
+        kernels.append(((np.abs(along) <= length / 2.0) & (np.abs(across) <= width / 2.0)).astype(np.uint8))
+    return kernels
+
+
+def configuration_space(occupancy, kernels):
+    """
+    :param occupancy: Grid.occupancy() array
+    :return: per heading bin a bool array [y, x], True where the car centred on that cell would hit something
+    """
+    import cv2
+    # AVOID is the clearance a point planner needs around obstacles, the footprint takes its place here
+    blocked = ((occupancy == GridRectangle.CONE) | (occupancy == GridRectangle.OBSTACLE)).astype(np.uint8)
+    # cells off the grid count as free, the grid only spans the detected arena, not its walls
+    return [cv2.dilate(blocked, kernel, borderType=cv2.BORDER_CONSTANT, borderValue=0).astype(bool)
+            for kernel in kernels]
+
+
+class HolonomicDistances:
+    """
+    Dijkstra from goal over the free cells, 8-connected with octile steps. It only runs as far as the cells asked for
+    so far, a leg rarely looks at more than the cells along its way
+    """
+
+    def __init__(self, free, goal):
+        """
+        :param free: rows of bools [y][x]
+        :param goal: (x, y), seeded even when it is not free itself
+        """
+        self.height, self.width = len(free), len(free[0])
+        self.free = [f for row in free for f in row]
+        self.distances = [INFINITY] * (self.width * self.height)
+        self.settled = bytearray(self.width * self.height)
+        gx, gy = goal
+        self.distances[gy * self.width + gx] = 0
+        self.frontier = [(0, gy * self.width + gx)]
+
+    def __call__(self, x, y):
+        """
+        :return: distance in cells from cell (x, y) to goal, INFINITY where goal cannot be reached
+        """
+        width, height = self.width, self.height
+        target = y * width + x
+        distances, settled, free, frontier = self.distances, self.settled, self.free, self.frontier
+        while not settled[target] and frontier:
+            d, i = heapq.heappop(frontier)
+            if settled[i]:
+                continue
+            settled[i] = 1
+            cy, cx = divmod(i, width)
+            for dx, dy, step in STEPS:
+                nx, ny = cx + dx, cy + dy
+                if 0 <= nx < width and 0 <= ny < height:
+                    n = ny * width + nx
+                    if free[n] and d + step < distances[n]:
+                        distances[n] = d + step
+                        heapq.heappush(frontier, (d + step, n))
+        return distances[target] if settled[target] else INFINITY
+
+
+class KinematicPathfinding(Pathfinding):
+    """
+    Pathfinding for drivable paths, legs continue with the heading the previous leg ended on
+    """
+
+    def __init__(self, grid, waypoints, profiler=NULL_PROFILER, cache=None, cell_mm=CONE_WIDTH / 2.0,
+                 max_expansions=MAX_EXPANSIONS):
+        """
+        :param cell_mm: size of one grid cell in mm, scales the car measurements to the grid resolution
+        :param max_expansions: per leg, a leg that runs out stops at the pose closest to its waypoint
+        """
+        super().__init__(grid, waypoints, profiler, cache)
+        self.max_expansions = max_expansions
+        cell_mm = self.cell_mm = round(cell_mm / CELL_MM_STEP) * CELL_MM_STEP
+        tables = self.cache.get("kinematic")
+        if tables is None or tables[0] != cell_mm:
+            # both tables only depend on the resolution, which moves a lot less than the arena does
+            tables = self.cache["kinematic"] = (cell_mm, motion_primitives(CAR_TURN_RADIUS / cell_mm),
+                                                footprint_kernels(CAR_LENGTH / cell_mm, CAR_WIDTH / cell_mm))
+        _, self.primitives, kernels = tables
+        collides = configuration_space(grid.occupancy(), kernels)
+        # bordered with blocked cells a primitive long, the samples of a pose on the grid never need a bounds check
+        pad = self.pad = int(ceil(max(hypot(px, py) for primitives in self.primitives for primitive in primitives
+                                      for px, py, _ in primitive[4]))) + 1
+        self.width = grid.rows + 2 * pad
+        self.collides = [np.pad(c, pad, constant_values=True).ravel().tolist() for c in collides]
+        # cells the car fits into with at least one heading, what the heuristic searches over
+        self.fits = (~np.logical_and.reduce(collides)).tolist()
+
+    def worker_arguments(self):
+        return {"cell_mm": self.cell_mm, "max_expansions": self.max_expansions}
+
+    def joins(self, finish, step):
+        # the next leg starts from the pose the car ended in, off the centre of its cell, the one planned from the
+        # centre is a different leg
+        return getattr(finish, "pose", None) is None and (finish.direction is None or
+                                                          finish.direction == step.direction)
+
+    def search(self, start, goal):
+        log.info("Finding drivable path from {} to {}".format(start, goal))
+        gx, gy = goal.coordinates
+        distances = HolonomicDistances(self.fits, (gx, gy))
+        weight = HEURISTIC_WEIGHT * self.grid.grid_size
+
+        def heuristic(x, y):
+            cx, cy = cell(x), cell(y)
+            if 0 <= cy < self.grid.columns and 0 <= cx < self.grid.rows:
+                return weight * distances(cx, cy)
+            return INFINITY
+        pose = getattr(start, "pose", None)
+        if pose is not None:
+            starts = [pose]
+        else:
+            # first leg, the car may face anywhere
+            sx, sy = start.coordinates
+            starts = [(sx, sy, k) for k in range(HEADING_BINS)]
+
+        frontier = []
+        poses = {}
+        cost_so_far = {}
+        # how a pose was reached: (previous pose key, primitive, samples of it driven), None for a start
+        came_from = {}
+        pushes = 0
+        for x, y, k in starts:
+            key = (cell(x), cell(y), k)
+            poses[key], cost_so_far[key], came_from[key] = (x, y, k), 0, None
+            heapq.heappush(frontier, (heuristic(x, y), pushes, key))
+            pushes += 1
+
+        collides, width, shift = self.collides, self.width, self.pad + 0.5
+        goal_x, goal_y = gx + self.pad, gy + self.pad
+        closed = set()
+        current = None
+        closest, closest_distance = None, float("inf")
+        expanded = 0
+        while frontier:
+            _, _, current = heapq.heappop(frontier)
+            if current in closed:
+                continue
+            if current[:2] == (gx, gy):
+                break
+            x, y, k = poses[current]
+            distance = hypot(gx - x, gy - y)
+            if distance < closest_distance:
+                closest, closest_distance = current, distance
+            if expanded >= self.max_expansions:
+                log.debug("Out of expansions, stopping {:.1f} cells short".format(closest_distance))
+                current = closest
+                break
+            closed.add(current)
+            expanded += 1
+            for primitive in self.primitives[k]:
+                dx, dy, end_bin, cost, points, _ = primitive
+                driven = None
+                for i, (px, py, pk) in enumerate(points):
+                    # cell() of the sample, shifted onto the border
+                    cx, cy = int(x + px + shift), int(y + py + shift)
+                    if collides[pk][cy * width + cx]:
+                        break
+                    if cx == goal_x and cy == goal_y:
+                        # entering the waypoint's cell ends the leg, the primitive is cut there
+                        driven = i + 1
+                        dx, dy, end_bin = px, py, pk
+                        cost *= driven / float(len(points))
+                        break
+                else:
+                    driven = len(points)
+                if driven is None:
+                    continue
+                nx, ny = x + dx, y + dy
+                key = (cell(nx), cell(ny), end_bin)
+                if key in closed:
+                    continue
+                new_cost = cost_so_far[current] + cost * self.grid.grid_size
+                if key not in cost_so_far or new_cost < cost_so_far[key]:
+                    estimate = heuristic(nx, ny)
+                    if estimate == INFINITY:
+                        continue
+                    poses[key], cost_so_far[key] = (nx, ny, end_bin), new_cost
+                    came_from[key] = (current, primitive, driven)
+                    heapq.heappush(frontier, (new_cost + estimate, pushes, key))
+                    pushes += 1
+        else:
+            # no way through, get the car as close as it can
+            log.debug("No drivable path, stopping {:.1f} cells short".format(closest_distance))
+            current = closest
+
+        self.profiler.count("nodes_expanded", expanded)
+        self.profiler.count("heap_pushes", pushes)
+        return self.drive(came_from, poses, cost_so_far, current, start)
+
+    def drive(self, came_from, poses, cost_so_far, finish, start):
+        """
+        :return: search()'s (came_from, cost, finish) through every cell the car passes, the last rect carries the
+            pose the next leg starts from. Rect headings are the direction of travel, against the car when reversing
+        """
+        steps = []
+        key = finish
+        while came_from[key] is not None:
+            steps.append(came_from[key])
+            key = came_from[key][0]
+        steps.reverse()
+        rects = [start]
+        index = {start: 0}
+        for before, primitive, driven in steps:
+            x, y, _ = poses[before]
+            for px, py, pk in primitive[4][:driven]:
+                cx, cy = cell(x + px), cell(y + py)
+                if (cx, cy) == rects[-1].coordinates:
+                    continue
+                rect = copy.copy(self.grid.grid[cy][cx])
+                rect.direction = heading(pk if primitive[5] > 0 else pk + HEADING_BINS // 2)
+                if rect in index:
+                    # back on a (cell, heading) state already passed, came_from holds one parent per state, so the
+                    # loop in between is dropped
+                    for dropped in rects[index[rect] + 1:]:
+                        del index[dropped]
+                    del rects[index[rect] + 1:]
+                    continue
+                index[rect] = len(rects)
+                rects.append(rect)
+        came_from = {start: None}
+        for previous, rect in zip(rects, rects[1:]):
+            came_from[rect] = previous
+        last = rects[-1]
+        if last is not start:
+            last.pose = poses[finish]
+        return came_from, {last: cost_so_far[finish]}, last
+
+
+def cell(position):
+    """
+    :return: the index of the cell a position in cells falls into
+    """
+    return int(floor(position + 0.5))
+
+
+def heading(heading_bin, bins=HEADING_BINS):
+    """
+    :return: the GridRectangle heading closest to a heading bin, bin 0 points along +x (E)
+    """
+    angle = 360.0 * (heading_bin % bins) / bins
+    # GridRectangle headings start at N and go clockwise, image y points down so the bins do too
+    return GridRectangle.N + 10 * (int(round((angle + 90) / 45)) % 8)
@@ -0,0 +1,160 @@
+"""
+Legs planned in earlier frames, reused while the cells they run through stay the same.
+
+A leg is looked up by the planner, the grid geometry, the cost layers and turn costs and its endpoints (cells, start
+heading and, for the kinematic planner, the start pose). Only legs that reached their goal are stored. The entry
+remembers the occupied codes of every cell the path runs through, a lookup only compares those, a few hundred bytes,
+against Grid.cells. A leg whose cells all still hold the same codes is handed back as it was, anything else is planned
+again. Changes off the path are not looked at: an obstacle that clears a shorter way past the cached path does not
+invalidate it, one that moves onto it or close enough to mark it AVOID does.
+
+Eviction is least recently used, bounded by an estimate of the bytes the entries hold.
+"""
+import logging
+import sys
+import time
+from collections import OrderedDict
+
+from .costs import cost_map
+from .grid import GridRectangle
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_BUDGET = 16 * 1024 * 1024  # bytes
+
+
+def _rect_bytes():
+    rect = GridRectangle(0, 0, 1, 1, 0, 0)
+    return sys.getsizeof(rect) + sys.getsizeof(rect.__dict__)
+
+
+# what one GridRectangle copy in a came_from map holds, object plus attribute dict
+RECT_BYTES = _rect_bytes()
+
+
+def path_cells(path):
+    """
+    :param path: rects of a leg in order, neighbouring rects may be further apart than one cell (Theta* corners)
+    :return: (x, y) of every cell the leg runs through, sampled like any_angle.line_of_sight does
+    """
+    cells = [path[0].coordinates]
+    for a, b in zip(path, path[1:]):
+        (ax, ay), (bx, by) = a.coordinates, b.coordinates
+        steps = 2 * max(abs(bx - ax), abs(by - ay))
+        if steps == 2:
+            # neighbouring cells, every planner but Theta* only takes those
+            cells.append(b.coordinates)
+            continue
+        for i in range(1, steps + 1):
+            cell = (int(round(ax + (bx - ax) * i / steps)), int(round(ay + (by - ay) * i / steps)))
+            if cell != cells[-1]:
+                cells.append(cell)
+    return cells
+
+
+class LegCache:
+    """
+    LRU map of planned legs, see the module docstring
+    """
+
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET):
+        """
+        :param memory_budget: estimated bytes the entries may hold before the least recently used ones are dropped
+        """
+        self.memory_budget = memory_budget
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0.0  # seconds the hits would have spent planning
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    @staticmethod
+    def key(planner, grid, start, goal):
+        # cell_mm scales the kinematic planner's car to the grid. Cost layers and turn costs change the best path
+        # without changing a single occupied code, their hash is computed once per CostMap
+        layers = cost_map(grid).layers_key if grid.cost_layers else None
+        return (type(planner).__name__, getattr(planner, "cell_mm", None), grid.x, grid.y, grid.grid_size, grid.rows,
+                grid.columns, layers, grid.turn_costs, start.coordinates, start.direction, getattr(start, "pose", None),
+                goal.coordinates)
+
+    def get(self, key, grid):
+        """
+        :return: the (came_from, cost, finish) stored under key when its cells are unchanged in grid, else None
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            result, indices, codes, seconds, _ = entry
+            cells = grid.cells
+            if bytes(cells[i] for i in indices) == codes:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.saved += seconds
+                return result, seconds
+            self._drop(key)
+        self.misses += 1
+        return None
+
+    def put(self, key, grid, result, seconds):
+        """
+        :param result: search()'s (came_from, cost, finish)
+        :param seconds: time the search took, what a hit saves
+        """
+        came_from, _, finish = result
+        path = []
+        rect = finish
+        while rect is not None:
+            path.append(rect)
+            rect = came_from.get(rect)
+        path.reverse()
+        indices = [y * grid.rows + x for x, y in path_cells(path)]
+        codes = bytes(grid.cells[i] for i in indices)
+        # the ints in indices are past the small int cache, 28 bytes each
+        nbytes = sys.getsizeof(came_from) + len(came_from) * RECT_BYTES + sys.getsizeof(indices) + \
+            len(indices) * 28 + sys.getsizeof(codes)
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (result, indices, codes, seconds, nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.memory_budget and len(self._entries) > 1:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        self.nbytes -= self._entries.pop(key)[4]
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+
+def cached_search(planner, start, goal):
+    """
+    planner.search(start, goal) through the LegCache under "legs" in planner.cache, a plain search when there is none.
+    Counts leg_cache_hits, leg_cache_misses and leg_cache_saved_ms on the planner's profiler
+    """
+    cache = planner.cache.get("legs")
+    if cache is None:
+        return planner.search(start, goal)
+    grid = planner.grid
+    key = LegCache.key(planner, grid, start, goal)
+    found = cache.get(key, grid)
+    if found is not None:
+        result, seconds = found
+        planner.profiler.count("leg_cache_hits")
+        planner.profiler.count("leg_cache_saved_ms", seconds * 1000)
+        return result
+    planner.profiler.count("leg_cache_misses")
+    began = time.perf_counter()
+    result = planner.search(start, goal)
+    # a leg that gave up short of its goal is planned again, the cells that blocked it are not on the path and would
+    # not show that they cleared. Anytime legs that are not optimal yet are planned again to improve them
+    if result[2].coordinates == goal.coordinates and getattr(result[2], "suboptimality", 1.0) <= 1.0:
+        cache.put(key, grid, result, time.perf_counter() - began)
+    return result
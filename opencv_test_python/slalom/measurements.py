@@ -0,0 +1,10 @@
+"""
+Sizes of the things on the course in mm, measured by hand, see test3.py. Nothing is imported here, the modules that
+scale grids and footprints by these load without numpy or OpenCV.
+"""
+CONE_WIDTH = 17
+JENGA_LENGTH = 75
+JENGA_WIDTH = 24
+CAR_LENGTH = 70
+CAR_WIDTH = 50
+CAR_TURN_RADIUS = 52
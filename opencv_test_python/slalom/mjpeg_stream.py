@@ -0,0 +1,325 @@
+import cv2
+import numpy as np
+import logging
+import sys
+import time
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger(__name__)
+
+JPEG_SOI = b'\xff\xd8'
+JPEG_EOI = b'\xff\xd9'
+
+# imdecode flags for the reduced resolutions libjpeg can decode directly (DCT scaling)
+REDUCED_COLOR_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def reduced_decode_flag(scale):
+    """
+    Pick the strongest reduced imdecode flag that does not go below the requested scale
+    :param scale: wanted output scale, e.g. 0.5 for half resolution
+    :return: (imdecode flag, scale that flag decodes to)
+    """
+    for factor, flag in REDUCED_COLOR_FLAGS:
+        if 1.0 / factor >= scale:
+            return flag, 1.0 / factor
+    return cv2.IMREAD_COLOR, 1.0
+
+
+def decode_jpeg(jpeg, scale=1.0):
+    """
+    Decode a JPEG at (roughly) the given scale. The bulk of the reduction is done by the JPEG decoder itself,
+    only a remaining non power of two factor is resized afterwards.
+    :param jpeg: encoded bytes
+    :param scale: wanted output scale (0 < scale <= 1)
+    :return: BGR image or None if the data could not be decoded
+    """
+    flag, decoded_scale = reduced_decode_flag(scale)
+    img = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), flag)
+    if img is not None and decoded_scale - scale > 1e-6:
+        factor = scale / decoded_scale
+        img = cv2.resize(img, (0, 0), fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+    return img
+
+
+def split_jpeg_frames(data):
+    """
+    Split a recorded .mjpeg file (concatenated JPEGs) into single frames
+    :param data: file content
+    :return: list of encoded frames
+    """
+    frames = []
+    start = data.find(JPEG_SOI)
+    while start != -1:
+        end = data.find(JPEG_EOI, start + 2)
+        if end == -1:
+            break
+        frames.append(data[start:end + 2])
+        start = data.find(JPEG_SOI, end + 2)
+    return frames
+
+
+class MJPEGStream:
+    """
+    Frame source for multipart MJPEG streams over HTTP (e.g. the DroidCam /mjpegfeed).
+
+    A background thread parses the multipart stream and only keeps the latest JPEG, so a slow consumer never works
+    on stale frames and frames it does not ask for are never decoded. Lost connections are retried with exponential
+    backoff. read() mimics cv2.VideoCapture.read().
+    """
+
+    def __init__(self, url, scale=1.0, timeout=5.0, min_backoff=0.25, max_backoff=8.0, chunk_size=16384):
+        """
+        :param url: stream url
+        :param scale: decode scale, powers of two (0.5, 0.25, 0.125) are decoded natively by libjpeg
+        :param timeout: socket timeout in seconds
+        :param min_backoff: first reconnect delay in seconds
+        :param max_backoff: upper bound for the reconnect delay
+        :param chunk_size: bytes read from the socket at once
+        """
+        self.url = url
+        self.scale = scale
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.chunk_size = chunk_size
+
+        self.frames_received = 0
+        self.frames_decoded = 0
+        self.reconnects = 0
+
+        self._jpeg = None
+        self._sequence = 0
+        self._read_sequence = 0
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+        self._response = None
+
+    def start(self):
+        if not self._running:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="MJPEGStream", daemon=True)
+            self._thread.start()
+        return self
+
+    def isOpened(self):
+        return self._running
+
+    def release(self):
+        self._running = False
+        response = self._response
+        if response is not None:
+            try:
+                response.close()
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join(self.timeout)
+            self._thread = None
+
+    def read_jpeg(self, timeout=None):
+        """
+        Wait for a JPEG newer than the last one handed out
+        :param timeout: seconds to wait, None waits forever
+        :return: (sequence number, encoded frame) or (None, None) on timeout
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._sequence > self._read_sequence or not self._running,
+                                            timeout):
+                return None, None
+            if self._sequence <= self._read_sequence:
+                return None, None
+            self._read_sequence = self._sequence
+            return self._sequence, self._jpeg
+
+    def read(self, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        _, jpeg = self.read_jpeg(timeout)
+        if jpeg is None:
+            return False, None
+        img = decode_jpeg(jpeg, self.scale)
+        if img is None:
+            log.warning("Could not decode frame from {}".format(self.url))
+            return False, None
+        self.frames_decoded += 1
+        return True, img
+
+    def _publish(self, jpeg):
+        with self._condition:
+            self._jpeg = jpeg
+            self._sequence += 1
+            self.frames_received += 1
+            self._condition.notify_all()
+
+    def _run(self):
+        backoff = self.min_backoff
+        while self._running:
+            try:
+                self._response = urllib.request.urlopen(self.url, timeout=self.timeout)
+                log.info("Connected to {}".format(self.url))
+                for jpeg in self._parts(self._response):
+                    self._publish(jpeg)
+                    backoff = self.min_backoff
+                    if not self._running:
+                        break
+                if self._running:
+                    log.warning("Stream {} ended".format(self.url))
+            except (OSError, ValueError) as e:
+                if self._running:
+                    log.warning("Stream {} failed: {}".format(self.url, e))
+            finally:
+                if self._response is not None:
+                    self._response.close()
+                    self._response = None
+            if self._running:
+                self.reconnects += 1
+                log.info("Reconnecting to {} in {:.2f}s".format(self.url, backoff))
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+        with self._condition:
+            self._condition.notify_all()
+
+    def _parts(self, response):
+        """
+        Parse a multipart/x-mixed-replace body into JPEGs. Uses Content-Length when the part headers carry one and
+        falls back to the JPEG end marker otherwise.
+        """
+        buffer = bytearray()
+        while self._running:
+            start = buffer.find(JPEG_SOI)
+            if start != -1:
+                length = self._content_length(buffer, start)
+                if length is not None:
+                    if len(buffer) >= start + length:
+                        yield bytes(buffer[start:start + length])
+                        del buffer[:start + length]
+                        continue
+                else:
+                    end = buffer.find(JPEG_EOI, start + 2)
+                    if end != -1:
+                        yield bytes(buffer[start:end + 2])
+                        del buffer[:end + 2]
+                        continue
+            elif len(buffer) > self.chunk_size:
+                # nothing but headers/garbage, keep the tail in case a marker was cut in half
+                del buffer[:-self.chunk_size]
+            chunk = response.read1(self.chunk_size) if hasattr(response, "read1") else response.read(self.chunk_size)
+            if not chunk:
+                return
+            buffer += chunk
+
+    @staticmethod
+    def _content_length(buffer, jpeg_start):
+        header_start = buffer.rfind(b'--', 0, jpeg_start)
+        if header_start == -1:
+            return None
+        headers = bytes(buffer[header_start:jpeg_start]).lower()
+        index = headers.find(b'content-length:')
+        if index == -1:
+            return None
+        value = headers[index + len(b'content-length:'):].split(b'\n', 1)[0].strip()
+        try:
+            return int(value)
+        except ValueError:
+            return None
+
+
+class MJPEGReplayServer:
+    """
+    Serves a recorded .mjpeg file as a looping multipart stream, mimicking the phone camera for local testing
+    """
+
+    BOUNDARY = "mjpegframe"
+
+    def __init__(self, mjpeg_path, host="127.0.0.1", port=4747, fps=30, path="/mjpegfeed"):
+        with open(mjpeg_path, "rb") as f:
+            self.frames = split_jpeg_frames(f.read())
+        if not self.frames:
+            raise ValueError("No JPEG frames found in {}".format(mjpeg_path))
+        self.fps = fps
+        self.path = path
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != server.path:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "multipart/x-mixed-replace; boundary={}".format(server.BOUNDARY))
+                self.end_headers()
+                try:
+                    server.stream_to(self.wfile)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, format, *args):
+                log.debug(format % args)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return "http://{}:{}{}".format(host, port, self.path)
+
+    def stream_to(self, wfile):
+        period = 1.0 / self.fps if self.fps else 0
+        next_time = time.perf_counter()
+        i = 0
+        while True:
+            jpeg = self.frames[i % len(self.frames)]
+            wfile.write("--{}\r\nContent-Type: image/jpeg\r\nContent-Length: {}\r\n\r\n".format(
+                self.BOUNDARY, len(jpeg)).encode("ascii"))
+            wfile.write(jpeg)
+            wfile.write(b"\r\n")
+            wfile.flush()
+            i += 1
+            next_time += period
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="MJPEGReplayServer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 3 or sys.argv[1] not in ("serve", "view"):
+        print("Usage: python -m slalom.mjpeg_stream serve <RecordingPath> [port] [fps]")
+        print("       python -m slalom.mjpeg_stream view <StreamUrl> [scale]")
+        exit()
+    if sys.argv[1] == "serve":
+        port = int(sys.argv[3]) if len(sys.argv) > 3 else 4747
+        fps = float(sys.argv[4]) if len(sys.argv) > 4 else 30
+        replay = MJPEGReplayServer(sys.argv[2], host="0.0.0.0", port=port, fps=fps)
+        log.info("Serving {} frames on port {}".format(len(replay.frames), port))
+        replay.httpd.serve_forever()
+    else:
+        stream = MJPEGStream(sys.argv[2], scale=float(sys.argv[3]) if len(sys.argv) > 3 else 1.0).start()
+        while 1:
+            ret, frame = stream.read()
+            if ret:
+                cv2.imshow('stream', frame)
+            k = cv2.waitKey(1) & 0xFF
+            if k == 27:
+                break
+        stream.release()
+        cv2.destroyAllWindows()
@@ -0,0 +1,272 @@
+"""
+Legs planned side by side in a process pool.
+
+Pathfinding.test_path plans leg i + 1 from the rect leg i finished on, heading included, so the legs run one after
+another. Here every leg starts from its own waypoint without a heading instead, which makes the legs independent:
+they are handed to a ProcessPoolExecutor all at once. The grid travels through one shared memory block holding
+Grid.cells followed by the cost layers as doubles, written once per grid version; only its name and a token go with
+each leg. A worker keeps its Grid between frames and only sets the cells that changed since the last one it saw,
+its planner lives as long as the token does.
+
+Stitching happens back in the parent, one join at a time. A leg planned without a heading is kept where it is what
+the sequential planner would have found: leg i finished on its first cell and Pathfinding.joins() holds for the turn
+into its first step. Everywhere else, a leg that stopped short of its waypoint or a turn that costs something, the
+leg is planned again from where leg i finished, as test_path() does. The output is that of test_path(), the pool only
+saves the time of the legs it kept.
+
+compare() puts the output of both modes side by side, python -m slalom.parallel_legs [workers] runs the synthetic
+corpus through both.
+"""
+import copy
+import logging
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from .grid import Grid
+from .leg_cache import cached_search
+from .planner import Pathfinding
+
+log = logging.getLogger(__name__)
+
+# worker side, the grid of the current frame and the planner built on it
+_worker_grid = None  # (block name, token, Grid)
+_worker_planner = None  # (block name, token, planner class, planner)
+_worker_caches = {}  # planner cache per planner class, kept between frames like Pipeline.planner_cache
+
+
+def _layers_offset(cells):
+    # the doubles of the cost layers start on the first 8 byte boundary after the cells
+    return -(-cells // 8) * 8
+
+
+def _attach(descriptor):
+    """
+    :return: the worker's Grid of the frame descriptor was published for, brought up to date from the shared block
+        when new
+    """
+    global _worker_grid
+    import numpy as np
+    name, token, geometry, size, layers, turn_costs = descriptor
+    if _worker_grid is None or _worker_grid[:2] != (name, token):
+        grid = _worker_grid[2] if _worker_grid is not None else None
+        if grid is None or (grid.x, grid.y, grid.width, grid.height, grid.grid_size, grid.spacing) != geometry:
+            grid = Grid(*geometry)
+        # the workers report to the parent's resource tracker, the block stays registered once and the parent's
+        # unlink() settles it
+        block = shared_memory.SharedMemory(name=name)
+        shared = np.ndarray((size,), dtype=np.uint8, buffer=block.buf)
+        changed = np.flatnonzero(shared != np.frombuffer(grid.cells, dtype=np.uint8)).tolist()
+        rows, codes = grid.rows, shared[changed].tolist()
+        for i, code in zip(changed, codes):
+            grid.set_occupied(grid.grid[i // rows][i % rows], code)
+        offset = _layers_offset(size)
+        doubles = np.ndarray((layers, size), dtype=np.float64, buffer=block.buf, offset=offset)
+        grid.cost_layers = []
+        for layer in doubles.tolist():
+            grid.add_cost_layer(layer)
+        grid.turn_costs = turn_costs
+        del shared, doubles
+        block.close()
+        _worker_grid = (name, token, grid)
+    return _worker_grid[2]
+
+
+def _plan_leg(descriptor, planner_class, arguments, start, goal):
+    """
+    Runs in a worker: one leg from cell start to cell goal, start without a heading
+    :return: ([((x, y), heading), ...] from start on, pose of the last rect or None)
+    """
+    global _worker_planner
+    grid = _attach(descriptor)
+    key = descriptor[:2] + (planner_class,)
+    if _worker_planner is None or _worker_planner[:3] != key:
+        cache = _worker_caches.setdefault(planner_class.__name__, {})
+        _worker_planner = key + (planner_class(grid, [], cache=cache, **arguments),)
+    planner = _worker_planner[3]
+    (sx, sy), (gx, gy) = start, goal
+    came_from, _, finish = planner.search(grid.grid[sy][sx], grid.grid[gy][gx])
+    path = Pathfinding.reconstruct(came_from, finish)
+    return [(rect.coordinates, rect.direction) for rect in path], getattr(finish, "pose", None)
+
+
+def continues(planner, finish, rects):
+    """
+    :param finish: last rect of the previous leg
+    :param rects: the next leg, planned from its waypoint's cell without a heading
+    :return: True when the next leg is what a search from finish finds, so it can go on from finish as it is
+    """
+    return finish.coordinates == rects[0].coordinates and (len(rects) < 2 or planner.joins(finish, rects[1]))
+
+
+def stitch(planner, legs, goals):
+    """
+    :param legs: what _plan_leg() returned for every leg, in order
+    :param goals: the (x, y) cell every leg goes to
+    :return: test_path()'s list of (came_from, finish)
+    """
+    grid = planner.grid
+    paths = []
+    finish = None
+    replanned = 0
+    for (cells, pose), (gx, gy) in zip(legs, goals):
+        rects = []
+        for (x, y), direction in cells:
+            rect = copy.copy(grid.grid[y][x])
+            rect.direction = direction
+            rects.append(rect)
+        if pose is not None:
+            rects[-1].pose = pose
+        if finish is not None:
+            if continues(planner, finish, rects):
+                rects = [finish] + rects[1:]
+            else:
+                came_from, _, end = cached_search(planner, finish, grid.grid[gy][gx])
+                rects = Pathfinding.reconstruct(came_from, end)
+                replanned += 1
+        came_from = {rects[0]: None}
+        for previous, rect in zip(rects, rects[1:]):
+            came_from[rect] = previous
+        finish = rects[-1]
+        paths.append((came_from, finish))
+    planner.profiler.count("legs_replanned", replanned)
+    return paths
+
+
+class LegPool:
+    """
+    Process pool planning the legs of a frame in parallel, see the module docstring
+    """
+
+    def __init__(self, workers=None):
+        """
+        :param workers: processes, None for one per CPU
+        """
+        self.workers = workers
+        self._executor = None
+        self._block = None
+        self._token = 0
+        self._published = None  # (grid, version) in the block
+
+    def publish(self, grid):
+        """
+        Copy the grid into the shared block, unless this version of it is there already
+        :return: what a worker needs to bring its Grid up to date
+        """
+        if self._published is None or self._published[0] is not grid or self._published[1] != grid.version:
+            size, layers = len(grid.cells), grid.cost_layers
+            offset = _layers_offset(size)
+            needed = offset + 8 * size * len(layers)
+            if self._block is None or self._block.size < needed:
+                self._close_block()
+                self._block = shared_memory.SharedMemory(create=True, size=max(1, needed))
+            self._block.buf[:size] = grid.cells
+            if layers:
+                doubles = self._block.buf[offset:needed].cast("d")
+                for i, layer in enumerate(layers):
+                    doubles[i * size:(i + 1) * size] = array("d", layer)
+                doubles.release()
+            self._token += 1
+            self._published = (grid, grid.version)
+        geometry = (grid.x, grid.y, grid.width, grid.height, grid.grid_size, grid.spacing)
+        return self._block.name, self._token, geometry, len(grid.cells), len(grid.cost_layers), grid.turn_costs
+
+    def test_path(self, planner):
+        """
+        planner.test_path() with the legs planned in parallel and stitched
+        """
+        waypoints, grid = planner.waypoints, planner.grid
+        if len(waypoints) < 2:
+            return None, None
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers)
+        descriptor = self.publish(grid)
+        cells = []
+        for waypoint in waypoints:
+            x, y = grid.get_index_from_position(waypoint.x, waypoint.y)
+            cells.append((x, y))
+        arguments = planner.worker_arguments()
+        futures = [self._executor.submit(_plan_leg, descriptor, type(planner), arguments, start, goal)
+                   for start, goal in zip(cells, cells[1:])]
+        legs = [future.result() for future in futures]
+        return stitch(planner, legs, cells[1:])
+
+    def _close_block(self):
+        if self._block is not None:
+            self._block.close()
+            self._block.unlink()
+            self._block = None
+            self._published = None
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._close_block()
+
+
+def compare(sequential, parallel):
+    """
+    :param sequential: Pathfinding.test_path() output
+    :param parallel: LegPool.test_path() output for the same planner and grid
+    :return: dict with the number of legs, legs with the same cells and per mode the cells and heading changes
+    """
+    result = {"legs": 0, "same_legs": 0, "cells": [0, 0], "turns": [0, 0]}
+    if sequential == (None, None) or parallel == (None, None):
+        return result
+    result["legs"] = len(sequential)
+    for (a_from, a_finish), (b_from, b_finish) in zip(sequential, parallel):
+        legs = Pathfinding.reconstruct(a_from, a_finish), Pathfinding.reconstruct(b_from, b_finish)
+        for i, rects in enumerate(legs):
+            result["cells"][i] += len(rects) - 1
+            result["turns"][i] += sum(a.direction != b.direction for a, b in zip(rects[1:], rects[2:]))
+        result["same_legs"] += [r.coordinates for r in legs[0]] == [r.coordinates for r in legs[1]]
+    return result
+
+
+def main(workers=None):
+    from .detector import Pipeline
+    from .instrumentation import Profiler
+    from .regression import load_corpus
+
+    frames = load_corpus("synthetic")
+    pool = LegPool(workers)
+    print("{:>10} {:>8} {:>8} {:>10} {:>10} {:>12} {:>12}".format(
+        "planner", "legs", "same", "seq_ms", "par_ms", "cells", "turns"))
+    try:
+        for planner_name in Pipeline.PLANNERS:
+            pipeline = Pipeline(Profiler(enabled=False))
+            pipeline.planner_cache.pop("legs")  # time the planners, not the leg cache
+            pipeline.planner = planner_name
+            # build the grids, the planning is timed below
+            pipeline.pathfinding = False
+            pipeline.draw_grid = True
+            totals = {"legs": 0, "same_legs": 0, "cells": [0, 0], "turns": [0, 0]}
+            seconds = [0.0, 0.0]
+            for _, frame in frames:
+                result = pipeline.process(frame)
+                if result.grid is None:
+                    continue
+                began = time.perf_counter()
+                sequential = pipeline.create_planner(result.waypoints).test_path()
+                seconds[0] += time.perf_counter() - began
+                began = time.perf_counter()
+                parallel = pool.test_path(pipeline.create_planner(result.waypoints))
+                seconds[1] += time.perf_counter() - began
+                found = compare(sequential, parallel)
+                totals["legs"] += found["legs"]
+                totals["same_legs"] += found["same_legs"]
+                for key in ("cells", "turns"):
+                    totals[key] = [a + b for a, b in zip(totals[key], found[key])]
+            print("{:>10} {:>8} {:>8} {:>10.1f} {:>10.1f} {:>12} {:>12}".format(
+                planner_name, totals["legs"], totals["same_legs"], seconds[0] * 1000, seconds[1] * 1000,
+                "{}/{}".format(*totals["cells"]), "{}/{}".format(*totals["turns"])))
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else None)
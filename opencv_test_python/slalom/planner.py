@@ -0,0 +1,160 @@
+import logging
+import heapq
+import copy
+from math import hypot
+
+from .costs import HEADINGS, INFINITY, START_TURN, cost_map, heading_change, heading_index
+from .grid import GridRectangle
+from .instrumentation import NULL_PROFILER
+from .leg_cache import cached_search
+
+log = logging.getLogger(__name__)
+
+
+class Pathfinding:
+
+    def __init__(self, grid, waypoints, profiler=NULL_PROFILER, cache=None):
+        """
+        :param grid: Grid to plan on
+        :param waypoints: rects to visit in order
+        :param profiler: receives the planner counters
+        :param cache: dict owned by the caller that outlives this object, planners keep state between frames in it
+        """
+        self.grid = grid
+        self.waypoints = waypoints
+        self.profiler = profiler
+        self.cache = {} if cache is None else cache
+        # TODO: Sort by distance
+        # self.waypoints = sorted(waypoints, key=lambda waypoint: waypoint.)
+
+    def heuristic(self, start, goal, node):
+        # max_dist = start.distance(goal)
+        # # return abs(goal.distance(node) - max_dist)
+        # return abs((goal.distance(node)/max_dist)*100)
+        return abs((goal.distance(node)))
+
+    def search(self, start, goal):
+        """
+        A* over (cell, heading) states on the grid's costs.cost_map(), costs are read by index, nothing is called per
+        edge
+        :return: (came_from, cost, finish), came_from holds copies of the rects of the leg with their headings set
+        """
+        log.info("Finding path from {} to {}".format(start, goal))
+        costs = cost_map(self.grid)
+        rows, columns, cells, steps = costs.rows, costs.columns, costs.cells, costs.steps
+        gx, gy = goal.coordinates
+        grid_size = self.grid.grid_size
+        start_state = start.coordinates + (heading_index(start.direction),)
+        all_headings = [(h, START_TURN) for h in range(len(HEADINGS))]
+        frontier = [(0, 0, start_state)]
+        came_from = {start_state: None}
+        cost_so_far = {start_state: 0}
+        current = start_state
+        expanded = 0
+        pushes = 1
+
+        while frontier:
+            _, _, current = heapq.heappop(frontier)
+            x, y, h = current
+            if x == gx and y == gy:
+                log.debug("Found a path, breaking")
+                break
+            expanded += 1
+            cost = cost_so_far[current]
+            for nh, turn in (all_headings if h is None else costs.successors[h]):
+                dx, dy = HEADINGS[nh]
+                nx, ny = x + dx, y + dy
+                if not (0 <= nx < rows and 0 <= ny < columns):
+                    continue
+                new_cost = cost + steps[nh] + cells[ny * rows + nx] + turn
+                if new_cost == INFINITY:
+                    continue
+                next = (nx, ny, nh)
+                if next not in cost_so_far or new_cost < cost_so_far[next]:
+                    cost_so_far[next] = new_cost
+                    came_from[next] = current
+                    heapq.heappush(frontier, (new_cost + grid_size * hypot(gx - nx, gy - ny), pushes, next))
+                    pushes += 1
+
+        self.profiler.count("nodes_expanded", expanded)
+        self.profiler.count("heap_pushes", pushes)
+        states = []
+        state = current
+        while state is not None:
+            states.append(state)
+            state = came_from[state]
+        states.reverse()
+        rects, last = self.chain([state[:2] for state in states], start)
+        return rects, {last: cost_so_far[current]}, last
+
+    def joins(self, finish, step):
+        """
+        :param finish: last rect of a leg, with the heading it arrived on
+        :param step: second rect of a leg planned from finish's cell without a heading
+        :return: True when that leg is also what search() finds from finish, so the next leg can go on from finish as
+            it is, False when it has to be planned again
+        """
+        a, b = heading_index(finish.direction), heading_index(step.direction)
+        if a is None or b is None:
+            return True
+        # without a heading the first step pays START_TURN whatever its direction, so going on straight takes the same
+        # off the cheapest path as it does at most off any other; after a turn another path may be cheaper
+        return cost_map(self.grid).turns[heading_change(a, b)] == 0
+
+    def worker_arguments(self):
+        """
+        :return: keyword arguments besides grid, waypoints and cache that rebuild this planner in another process
+        """
+        return {}
+
+    @staticmethod
+    def reconstruct(came_from, finish):
+        """
+        Follow a came_from map back from finish
+        :return: list of rects from the start of the leg to finish
+        """
+        path = []
+        rect = finish
+        while rect is not None:
+            path.append(rect)
+            rect = came_from.get(rect)
+        path.reverse()
+        return path
+
+    def chain(self, cells, start):
+        """
+        Turn a list of cell coordinates into the (came_from, finish) form search() returns, headings are taken from
+        the steps between the cells
+        :param cells: [(x, y), ...] beginning at start's cell
+        :param start: rect the leg starts from, kept as the root of came_from
+        """
+        came_from = {start: None}
+        previous = start
+        for (px, py), (x, y) in zip(cells, cells[1:]):
+            rect = copy.copy(self.grid.grid[y][x])
+            rect.direction = GridRectangle.DIRECTIONS[(x - px, y - py)]
+            came_from[rect] = previous
+            previous = rect
+        return came_from, previous
+
+    def test_path(self):
+        if len(self.waypoints) > 1:
+            paths = []
+            last_finish = None
+            for i in range(len(self.waypoints)-1):
+                if not last_finish:
+                    start_wp = self.waypoints[i]
+                    start_x, start_y = self.grid.get_index_from_position(start_wp.x, start_wp.y)
+                    start = self.grid.grid[start_y][start_x]
+                else:
+                    start = last_finish
+                goal_wp = self.waypoints[i+1]
+                goal_x, goal_y = self.grid.get_index_from_position(goal_wp.x, goal_wp.y)
+
+                finish = self.grid.grid[goal_y][goal_x]
+
+                result, cost, last_finish = cached_search(self, start, finish)
+                paths.append((result, last_finish))
+
+            return paths
+        return None, None
@@ -0,0 +1,41 @@
+"""
+Planner names and the one place a planner is built from one, shared by Pipeline and the offline replay without OpenCV.
+"""
+from .instrumentation import NULL_PROFILER
+from .measurements import CONE_WIDTH
+from .planner import Pathfinding
+from .any_angle import ThetaStarPathfinding
+from .hierarchical import HierarchicalPathfinding
+from .jump_point import JumpPointPathfinding
+from .kinematic import KinematicPathfinding
+from .quadtree import QuadtreePathfinding
+from .flow_field import FlowFieldPathfinding
+from .anytime import AnytimePathfinding
+
+# planner names, in the order of the Planner trackbar
+PLANNERS = ("astar", "hpa", "jps", "theta", "kinematic", "quadtree", "flow", "anytime")
+
+
+def create_planner(name, grid, waypoints, profiler=NULL_PROFILER, cache=None, cell_mm=CONE_WIDTH / 2.0,
+                   deadline=None):
+    """
+    :param name: one of PLANNERS, anything else plans with A*
+    :param cache: state the planner keeps between frames, see Pipeline.planner_cache
+    :param cell_mm: grid cell size in mm, only the kinematic planner uses it
+    :param deadline: seconds the anytime planner may spend on all legs, None for no limit
+    """
+    if name == "hpa":
+        return HierarchicalPathfinding(grid, waypoints, profiler, cache)
+    if name == "jps":
+        return JumpPointPathfinding(grid, waypoints, profiler, cache)
+    if name == "theta":
+        return ThetaStarPathfinding(grid, waypoints, profiler, cache)
+    if name == "kinematic":
+        return KinematicPathfinding(grid, waypoints, profiler, cache, cell_mm)
+    if name == "quadtree":
+        return QuadtreePathfinding(grid, waypoints, profiler, cache)
+    if name == "flow":
+        return FlowFieldPathfinding(grid, waypoints, profiler, cache)
+    if name == "anytime":
+        return AnytimePathfinding(grid, waypoints, profiler, cache, deadline)
+    return Pathfinding(grid, waypoints, profiler, cache)
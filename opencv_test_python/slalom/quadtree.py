@@ -0,0 +1,257 @@
+"""
+Region quadtree over the grid cells, and a planner searching its leaf adjacency.
+
+Most of an arena is empty floor. The tree starts with one square covering the grid (its side the next power of two)
+and only splits squares that hold something else than FREE cells. Squares that are all FREE or all blocked (CONE or
+OBSTACLE) become one leaf whatever their size, a blocked one coded CONE when all its cells are cones and OBSTACLE
+otherwise, so the tree comes down to single cells only around the cones, their AVOID rings and the waypoints. Squares
+entirely off the grid are left out.
+
+Leaves are found by descending from the root, their neighbours by walking the cells just outside each side and
+jumping over every neighbour found, so a big leaf only looks up as many cells as it has neighbours. Neighbours are
+found the first time a search touches a leaf.
+
+QuadtreePathfinding runs A* from leaf centre to leaf centre. Single cell leaves cost what costs.cost_map() charges
+for them, graded AVOID included, merged FREE leaves nothing and blocked ones are not entered; extra cost layers only
+count on single cell leaves. The leaf path is turned back into cells by going straight through every leaf from the
+cell it was entered on to the cell it is left from, the middle of the border it shares with the next leaf, so the
+legs come back as the usual came_from of adjacent GridRectangles. Headings are not modelled.
+"""
+import heapq
+import logging
+from math import hypot
+
+import numpy as np
+
+from .costs import INFINITY, cost_map
+from .geometry import Rectangle
+from .grid import GridRectangle
+from .instrumentation import NULL_PROFILER
+from .planner import Pathfinding
+
+log = logging.getLogger(__name__)
+
+BLOCKED = (GridRectangle.CONE, GridRectangle.OBSTACLE)
+
+
+class QuadTree:
+    """
+    Leaves are (x, y, size, code) in cells, inner nodes tuples of their four children NW, NE, SW, SE, None off the grid
+    """
+
+    def __init__(self, cells, rows, columns):
+        """
+        :param cells: occupied codes, y * rows + x, e.g. Grid.cells
+        """
+        self.rows = rows
+        self.columns = columns
+        self.size = 1
+        while self.size < max(rows, columns):
+            self.size *= 2
+        codes = np.frombuffer(bytes(cells), dtype=np.uint8).reshape(columns, rows)
+        # summed area tables of the non FREE, the blocked and the cone cells, any square is checked in O(1)
+        self._marked = self._integral(codes != GridRectangle.FREE)
+        self._blocked = self._integral(np.isin(codes, BLOCKED))
+        self._cones = self._integral(codes == GridRectangle.CONE)
+        self._codes = codes
+        self.leaves = []
+        self.nodes = 0
+        self.root = self._build(0, 0, self.size)
+        del self._marked, self._blocked, self._cones, self._codes
+        self._neighbors = {}
+
+    @staticmethod
+    def _integral(mask):
+        table = np.zeros((mask.shape[0] + 1, mask.shape[1] + 1), dtype=np.int64)
+        table[1:, 1:] = mask.cumsum(0).cumsum(1)
+        return table.tolist()
+
+    def _count(self, table, x, y, size):
+        x2, y2 = min(x + size, self.rows), min(y + size, self.columns)
+        return table[y2][x2] - table[y][x2] - table[y2][x] + table[y][x]
+
+    def _build(self, x, y, size):
+        if x >= self.rows or y >= self.columns:
+            return None
+        self.nodes += 1
+        inside = x + size <= self.rows and y + size <= self.columns
+        if size == 1:
+            code = int(self._codes[y, x])
+        elif inside and self._count(self._marked, x, y, size) == 0:
+            code = GridRectangle.FREE
+        elif inside and self._count(self._blocked, x, y, size) == size * size:
+            cones = self._count(self._cones, x, y, size) == size * size
+            code = GridRectangle.CONE if cones else GridRectangle.OBSTACLE
+        else:
+            half = size // 2
+            return (self._build(x, y, half), self._build(x + half, y, half),
+                    self._build(x, y + half, half), self._build(x + half, y + half, half))
+        self.leaves.append((x, y, size, code))
+        return len(self.leaves) - 1
+
+    @classmethod
+    def from_grid(cls, grid):
+        return cls(grid.cells, grid.rows, grid.columns)
+
+    def nbytes(self):
+        """
+        :return: rough size of the tree in bytes, 8 per pointer plus the leaf tuples
+        """
+        return 8 * 4 * (self.nodes - len(self.leaves)) + 120 * len(self.leaves)
+
+    def locate(self, x, y):
+        """
+        :return: index of the leaf holding cell (x, y), None off the grid
+        """
+        if not (0 <= x < self.rows and 0 <= y < self.columns):
+            return None
+        node, nx, ny, size = self.root, 0, 0, self.size
+        while isinstance(node, tuple):
+            size //= 2
+            right, down = x >= nx + size, y >= ny + size
+            node = node[right + 2 * down]
+            nx, ny = nx + size * right, ny + size * down
+        return node
+
+    def neighbors(self, leaf):
+        """
+        :return: [(neighbour leaf, cell left from, cell entered), ...] over the sides and corners of leaf
+        """
+        found = self._neighbors.get(leaf)
+        if found is not None:
+            return found
+        x, y, size, _ = self.leaves[leaf]
+        found = []
+        # per side the coordinate of the cells just inside and just outside it, and whether the side runs along x
+        for inside, outside, horizontal in ((y, y - 1, True), (y + size - 1, y + size, True), (x, x - 1, False),
+                                            (x + size - 1, x + size, False)):
+            t = x if horizontal else y
+            end = t + size
+            while t < end:
+                n = self.locate(t, outside) if horizontal else self.locate(outside, t)
+                if n is None:
+                    t += 1
+                    continue
+                nx, ny, nsize, _ = self.leaves[n]
+                start = nx if horizontal else ny
+                # the middle of the shared part of the border, then on past the neighbour
+                mid = (max(t, start) + min(end, start + nsize) - 1) // 2
+                if horizontal:
+                    found.append((n, (mid, inside), (mid, outside)))
+                else:
+                    found.append((n, (inside, mid), (outside, mid)))
+                t = start + nsize
+        for cx, cy, ox, oy in ((x, y, -1, -1), (x + size - 1, y, 1, -1), (x, y + size - 1, -1, 1),
+                               (x + size - 1, y + size - 1, 1, 1)):
+            n = self.locate(cx + ox, cy + oy)
+            if n is not None:
+                found.append((n, (cx, cy), (cx + ox, cy + oy)))
+        self._neighbors[leaf] = found
+        return found
+
+    def rectangles(self, grid):
+        """
+        :return: Rectangle of every leaf in image coordinates with its code, for drawing
+        """
+        origin_x, origin_y = grid.x - grid.offset, grid.y - grid.offset
+        for x, y, size, code in self.leaves:
+            width = min(size, self.rows - x) * grid.grid_size
+            height = min(size, self.columns - y) * grid.grid_size
+            yield Rectangle(origin_x + x * grid.grid_size + width / 2, origin_y + y * grid.grid_size + height / 2,
+                            width, height), code
+
+
+def cell_line(a, b):
+    """
+    :return: the cells after a up to b, 8-connected
+    """
+    (ax, ay), (bx, by) = a, b
+    steps = max(abs(bx - ax), abs(by - ay))
+    return [(int(round(ax + (bx - ax) * i / steps)), int(round(ay + (by - ay) * i / steps)))
+            for i in range(1, steps + 1)] if steps else []
+
+
+class QuadtreePathfinding(Pathfinding):
+    """
+    Pathfinding over the leaves of a QuadTree of the grid, see the module docstring
+    """
+
+    def __init__(self, grid, waypoints, profiler=NULL_PROFILER, cache=None):
+        super().__init__(grid, waypoints, profiler, cache)
+        cached = self.cache.get("quadtree")
+        if cached is None or cached[0] is not grid or cached[1] != grid.version:
+            cached = self.cache["quadtree"] = (grid, grid.version, QuadTree.from_grid(grid))
+        self.tree = cached[2]
+        self.costs = cost_map(grid).cells
+        profiler.count("quadtree_leaves", len(self.tree.leaves))
+
+    def leaf_cost(self, leaf):
+        x, y, size, code = self.tree.leaves[leaf]
+        if code in BLOCKED:
+            return INFINITY
+        if size == 1:
+            return self.costs[y * self.grid.rows + x]
+        return 0
+
+    def search(self, start, goal):
+        log.info("Finding quadtree path from {} to {}".format(start, goal))
+        tree, grid_size = self.tree, self.grid.grid_size
+        start_leaf, goal_leaf = tree.locate(*start.coordinates), tree.locate(*goal.coordinates)
+        gx, gy = goal.coordinates
+
+        def centre(leaf):
+            x, y, size, _ = tree.leaves[leaf]
+            return x + (size - 1) / 2.0, y + (size - 1) / 2.0
+
+        frontier = [(0, 0, start_leaf)]
+        cost_so_far = {start_leaf: 0}
+        came_from = {start_leaf: None}
+        closed = set()
+        pushes = 1
+        expanded = 0
+        current = start_leaf
+        while frontier:
+            _, _, current = heapq.heappop(frontier)
+            if current in closed:
+                continue
+            if current == goal_leaf:
+                break
+            closed.add(current)
+            expanded += 1
+            cx, cy = centre(current)
+            for leaf, exit_cell, entry_cell in tree.neighbors(current):
+                if leaf in closed:
+                    continue
+                entered = self.leaf_cost(leaf)
+                if entered == INFINITY:
+                    continue
+                nx, ny = centre(leaf)
+                new_cost = cost_so_far[current] + grid_size * hypot(nx - cx, ny - cy) + entered
+                if leaf not in cost_so_far or new_cost < cost_so_far[leaf]:
+                    cost_so_far[leaf] = new_cost
+                    came_from[leaf] = (current, exit_cell, entry_cell)
+                    heapq.heappush(frontier, (new_cost + grid_size * hypot(gx - nx, gy - ny), pushes, leaf))
+                    pushes += 1
+        self.profiler.count("nodes_expanded", expanded)
+        self.profiler.count("heap_pushes", pushes)
+        if current != goal_leaf:
+            return {start: None}, {start: 0}, start
+
+        # crossings from the goal back, then straight lines through every leaf between them
+        crossings = []
+        leaf = current
+        while came_from[leaf] is not None:
+            leaf, exit_cell, entry_cell = came_from[leaf]
+            crossings.append((exit_cell, entry_cell))
+        crossings.reverse()
+        cells = [start.coordinates]
+        for exit_cell, entry_cell in crossings:
+            cells += cell_line(cells[-1], exit_cell)
+            cells.append(entry_cell)
+        cells += cell_line(cells[-1], goal.coordinates)
+        came_from, finish = self.chain(cells, start)
+        return came_from, {finish: cost_so_far[current]}, finish
+
+    def joins(self, finish, step):
+        # headings are not modelled
+        return True
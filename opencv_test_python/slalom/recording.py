@@ -0,0 +1,211 @@
+import numpy as np
+import logging
+import os
+import sys
+import time
+
+log = logging.getLogger(__name__)
+
+# one record per frame, appended to index.bin while recording
+INDEX_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('chunk', '<u4'),
+    ('offset', '<u8'),
+    ('height', '<u4'),
+    ('width', '<u4'),
+    ('channels', '<u4'),  # 0 for single channel 2d frames
+])
+
+INDEX_FILE = "index.bin"
+CHUNK_FILE = "chunk_{:05d}.raw"
+DEFAULT_CHUNK_BYTES = 256 * 1024 * 1024
+
+
+class RunRecorder:
+    """
+    Records frames of a run as raw uint8 pixels into chunk files plus a small index of timestamps and offsets.
+    Nothing is encoded, so replaying a run costs a page fault instead of a decode.
+    """
+
+    def __init__(self, run_path, chunk_bytes=DEFAULT_CHUNK_BYTES):
+        """
+        :param run_path: directory for the run, created if missing
+        :param chunk_bytes: chunk files are rolled over once they would grow beyond this size
+        """
+        if os.path.exists(os.path.join(run_path, INDEX_FILE)):
+            raise IOError("{} already contains a recorded run".format(run_path))
+        os.makedirs(run_path, exist_ok=True)
+        self.run_path = run_path
+        self.chunk_bytes = chunk_bytes
+        self.frame_count = 0
+        self._chunk = -1
+        self._chunk_file = None
+        self._offset = 0
+        self._index_file = open(os.path.join(run_path, INDEX_FILE), "wb")
+
+    def _next_chunk(self):
+        if self._chunk_file is not None:
+            self._chunk_file.close()
+        self._chunk += 1
+        self._offset = 0
+        self._chunk_file = open(os.path.join(self.run_path, CHUNK_FILE.format(self._chunk)), "wb")
+
+    def write(self, frame, timestamp=None):
+        """
+        Append a frame
+        :param frame: uint8 image, 2d or 3d
+        :param timestamp: capture time in seconds, defaults to now
+        """
+        if frame.dtype != np.uint8:
+            raise ValueError("Only uint8 frames can be recorded, got {}".format(frame.dtype))
+        frame = np.ascontiguousarray(frame)
+        if self._chunk_file is None or (self._offset > 0 and self._offset + frame.nbytes > self.chunk_bytes):
+            self._next_chunk()
+
+        record = np.zeros(1, dtype=INDEX_DTYPE)
+        record['timestamp'] = time.time() if timestamp is None else timestamp
+        record['chunk'] = self._chunk
+        record['offset'] = self._offset
+        record['height'] = frame.shape[0]
+        record['width'] = frame.shape[1]
+        record['channels'] = frame.shape[2] if frame.ndim == 3 else 0
+
+        self._chunk_file.write(frame.data)
+        self._index_file.write(record.tobytes())
+        self._offset += frame.nbytes
+        self.frame_count += 1
+
+    def close(self):
+        if self._chunk_file is not None:
+            self._chunk_file.close()
+            self._chunk_file = None
+        self._index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RunReader:
+    """
+    Random access to a recorded run. Frames are zero-copy, read-only views into memory-mapped chunk files, so
+    jumping to any frame is O(1).
+    """
+
+    def __init__(self, run_path):
+        self.run_path = run_path
+        self.index = np.fromfile(os.path.join(run_path, INDEX_FILE), dtype=INDEX_DTYPE)
+        self._chunks = {}
+        self.position = 0
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def timestamps(self):
+        return self.index['timestamp']
+
+    def _chunk(self, chunk):
+        mapped = self._chunks.get(chunk)
+        if mapped is None:
+            mapped = np.memmap(os.path.join(self.run_path, CHUNK_FILE.format(chunk)), dtype=np.uint8, mode="r")
+            self._chunks[chunk] = mapped
+        return mapped
+
+    def __getitem__(self, i):
+        record = self.index[i]
+        if record['channels']:
+            shape = (int(record['height']), int(record['width']), int(record['channels']))
+        else:
+            shape = (int(record['height']), int(record['width']))
+        start = int(record['offset'])
+        size = shape[0] * shape[1] * (shape[2] if len(shape) == 3 else 1)
+        return self._chunk(int(record['chunk']))[start:start + size].reshape(shape)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def frame_at(self, timestamp):
+        """
+        Index of the last frame captured at or before timestamp
+        """
+        return max(int(np.searchsorted(self.timestamps, timestamp, side="right")) - 1, 0)
+
+    def seek(self, i):
+        self.position = i
+
+    def read(self):
+        """
+        Same contract as cv2.VideoCapture.read()
+        """
+        if self.position >= len(self):
+            return False, None
+        frame = self[self.position]
+        self.position += 1
+        return True, frame
+
+    def release(self):
+        self._chunks = {}
+
+
+def record(source, run_path, max_frames=None, show=True, max_timeouts=10):
+    """
+    Record everything a capture (cv2.VideoCapture, MJPEGStream, ...) delivers until ESC or max_frames
+    :param max_timeouts: stop after this many failed reads in a row, live sources time out instead of ending
+    """
+    import cv2
+    count = 0
+    timeouts = 0
+    with RunRecorder(run_path) as recorder:
+        while max_frames is None or count < max_frames:
+            ret, frame = source.read()
+            if not ret:
+                timeouts += 1
+                if isinstance(source, cv2.VideoCapture) or timeouts >= max_timeouts:
+                    break
+                continue
+            timeouts = 0
+            recorder.write(frame)
+            count += 1
+            if show:
+                cv2.imshow('recording', frame)
+                k = cv2.waitKey(1) & 0xFF
+                if k == 27:
+                    break
+    log.info("Recorded {} frames to {}".format(count, run_path))
+    return count
+
+
+if __name__ == "__main__":
+    import cv2
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 3 or sys.argv[1] not in ("record", "play") or \
+            (sys.argv[1] == "record" and len(sys.argv) < 4):
+        print("Usage: python -m slalom.recording record <VideoPath|StreamUrl|CameraIndex> <RunDir>")
+        print("       python -m slalom.recording play <RunDir>")
+        exit()
+    if sys.argv[1] == "record":
+        if sys.argv[2].startswith("http"):
+            from .mjpeg_stream import MJPEGStream
+            capture = MJPEGStream(sys.argv[2]).start()
+        elif sys.argv[2].isdigit():
+            capture = cv2.VideoCapture(int(sys.argv[2]))
+        else:
+            capture = cv2.VideoCapture(sys.argv[2])
+        record(capture, sys.argv[3])
+        capture.release()
+    else:
+        run = RunReader(sys.argv[2])
+        timestamps = run.timestamps
+        for i, frame in enumerate(run):
+            cv2.imshow('run', frame)
+            delay = 1
+            if i + 1 < len(run):
+                delay = max(int((timestamps[i + 1] - timestamps[i]) * 1000), 1)
+            k = cv2.waitKey(delay) & 0xFF
+            if k == 27:
+                break
+        cv2.destroyAllWindows()
@@ -0,0 +1,221 @@
+import cv2
+import json
+import logging
+import os
+import sys
+
+from .detector import Pipeline
+from .instrumentation import Profiler
+from .leg_cache import LegCache
+from .planner import Pathfinding
+from .recording import RunReader
+from .synthetic_arena import generate_arena
+
+log = logging.getLogger(__name__)
+
+# committed golden outputs and budgets for the synthetic corpus, the defaults of the command line
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "regression")
+DEFAULT_GOLDEN = os.path.join(DATA_DIR, "synthetic_golden.json")
+DEFAULT_BUDGETS_PATH = os.path.join(DATA_DIR, "budgets.json")
+
+# budgets.json holds per-stage budgets in ms, checked against the given percentile over the whole corpus, and
+# per planner overrides under "planners". The frame target is 33 ms; the committed numbers are what the stages cost
+# today with headroom, so the gate catches regressions and gets tightened as the stages get faster
+
+POSITION_TOLERANCE = 0.5  # px
+SYNTHETIC_CORPUS = [dict(n_gates=n, resolution=(640, 480), noise=noise, seed=seed)
+                    for n, noise, seed in ((2, 0, 0), (3, 0, 1), (4, 0, 2), (4, 5, 3), (5, 5, 4), (6, 0, 5))]
+
+
+def load_corpus(path):
+    """
+    :param path: recorded run directory, directory of images or "synthetic" for the generated arenas
+    :return: list of (name, BGR frame)
+    """
+    if path == "synthetic":
+        return [("arena_{}".format(i), generate_arena(**scene)[0]) for i, scene in enumerate(SYNTHETIC_CORPUS)]
+    if os.path.exists(os.path.join(path, "index.bin")):
+        run = RunReader(path)
+        return [("frame_{:05d}".format(i), run[i]) for i in range(len(run))]
+    frames = []
+    for name in sorted(os.listdir(path)):
+        img = cv2.imread(os.path.join(path, name))
+        if img is not None:
+            frames.append((name, img))
+    return frames
+
+
+def summarize(result):
+    """
+    Reduce a FrameResult to plain, comparable data
+    """
+    cones = [[round(c.x, 2), round(c.y, 2), round(c.width, 2), round(c.height, 2)] for c in result.cones]
+    index = {id(c): i for i, c in enumerate(result.cones)}
+    paths = []
+    if result.paths and result.paths != (None, None):
+        for came_from, finish in result.paths:
+            paths.append([list(rect.coordinates) for rect in Pathfinding.reconstruct(came_from, finish)])
+    return {
+        "cones": cones,
+        "obstacles": [[round(o.x, 2), round(o.y, 2), round(o.width, 2), round(o.height, 2)]
+                      for o in result.obstacles],
+        "pairs": [[index[id(a)], index[id(b)]] for a, b in result.pairs],
+        "waypoints": [[round(w.x, 2), round(w.y, 2)] for w in result.waypoints],
+        "paths": paths,
+    }
+
+
+def load_budgets(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def run_corpus(frames, repeats=1, planner="astar"):
+    """
+    :param planner: one of Pipeline.PLANNERS
+    :return: (summaries by frame name, profiler holding the timings of every run)
+    """
+    profiler = Profiler(Pipeline.STAGES, Pipeline.COUNTERS, window=len(frames) * repeats)
+    pipeline = Pipeline(profiler)
+    pipeline.planner = planner
+    summaries = {}
+    for _ in range(repeats):
+        # every repeat is a run of its own, legs and planner state cached by the one before would only time the caches
+        pipeline.planner_cache = {"legs": LegCache()}
+        for name, frame in frames:
+            profiler.frame_start()
+            result = pipeline.process(frame)
+            profiler.frame_end()
+            summaries[name] = summarize(result)
+    return summaries, profiler
+
+
+def _close(a, b):
+    return len(a) == len(b) and all(abs(x - y) <= POSITION_TOLERANCE for x, y in zip(a, b))
+
+
+def diff_frame(expected, actual):
+    """
+    :return: list of human readable differences, empty if the frame matches
+    """
+    problems = []
+    for key in ("cones", "obstacles", "waypoints"):
+        exp, act = expected[key], actual[key]
+        if len(exp) != len(act):
+            problems.append("{}: expected {} got {}".format(key, len(exp), len(act)))
+            continue
+        for i, (e, a) in enumerate(zip(exp, act)):
+            if not _close(e, a):
+                problems.append("{}[{}]: expected {} got {}".format(key, i, e, a))
+    if expected["pairs"] != actual["pairs"]:
+        problems.append("pairs: expected {} got {}".format(expected["pairs"], actual["pairs"]))
+    exp_paths, act_paths = expected["paths"], actual["paths"]
+    if len(exp_paths) != len(act_paths):
+        problems.append("paths: expected {} legs got {}".format(len(exp_paths), len(act_paths)))
+    for leg, (e, a) in enumerate(zip(exp_paths, act_paths)):
+        if e != a:
+            diverge = next((i for i, (x, y) in enumerate(zip(e, a)) if x != y), min(len(e), len(a)))
+            problems.append("path leg {}: {} cells expected, {} got, first difference at cell {} ({} vs {})".format(
+                leg, len(e), len(a), diverge, e[diverge] if diverge < len(e) else None,
+                a[diverge] if diverge < len(a) else None))
+    return problems
+
+
+def check_budgets(profiler, budgets, planner="astar"):
+    """
+    :return: list of (stage, measured ms, budget ms) for every stage over budget
+    """
+    percentile = budgets.get("percentile", 95)
+    stages = dict(budgets.get("stages", {}))
+    stages.update(budgets.get("planners", {}).get(planner, {}))
+    over = []
+    for stage, budget in sorted(stages.items()):
+        measured = profiler.percentiles(stage + "_ms", percentile)
+        if measured is not None and measured > budget:
+            over.append((stage, float(measured), budget))
+    return over
+
+
+def check(corpus_path, golden_path=DEFAULT_GOLDEN, budgets=None, repeats=3, planners=None):
+    """
+    Run the corpus once per planner and compare against that planner's golden outputs and the budgets
+    :param budgets: budgets dict, defaults to the committed budgets.json
+    :param planners: planner modes to check, defaults to every planner in the golden file
+    :return: True if both correctness and timings pass
+    """
+    if budgets is None:
+        budgets = load_budgets(DEFAULT_BUDGETS_PATH)
+    with open(golden_path) as f:
+        goldens = json.load(f)["planners"]
+    frames = load_corpus(corpus_path)
+    ok = True
+    for planner in planners or sorted(goldens):
+        if planner not in goldens:
+            print("FAIL {}: no golden outputs for this planner, record them first".format(planner))
+            ok = False
+            continue
+        print("== {} ==".format(planner))
+        ok = check_planner(frames, goldens[planner], budgets, repeats, planner) and ok
+    return ok
+
+
+def check_planner(frames, golden, budgets, repeats, planner):
+    summaries, profiler = run_corpus(frames, repeats, planner)
+
+    ok = True
+    for name in sorted(set(golden) | set(summaries)):
+        if name not in summaries:
+            print("FAIL {}: missing from the corpus".format(name))
+            ok = False
+            continue
+        if name not in golden:
+            print("FAIL {}: no golden output, record it first".format(name))
+            ok = False
+            continue
+        problems = diff_frame(golden[name], summaries[name])
+        if problems:
+            ok = False
+            print("FAIL {}:".format(name))
+            for problem in problems:
+                print("    " + problem)
+
+    for stage, measured, budget in check_budgets(profiler, budgets, planner):
+        ok = False
+        print("SLOW {}: p{} {:.2f} ms over budget {:.2f} ms".format(stage, budgets.get("percentile", 95), measured,
+                                                                     budget))
+
+    print("{} frames, {}".format(len(summaries), "OK" if ok else "FAILED"))
+    for key, p50, p95, p99 in profiler.summary():
+        if key.endswith("_ms"):
+            print("    {:<16} p50 {:8.2f}  p95 {:8.2f}  p99 {:8.2f}".format(key, p50, p95, p99))
+    return ok
+
+
+def record(corpus_path, golden_path=DEFAULT_GOLDEN, planners=Pipeline.PLANNERS):
+    """
+    Store the golden outputs of every planner, {"planners": {planner: {frame name: summary}}}
+    """
+    frames = load_corpus(corpus_path)
+    goldens = {planner: run_corpus(frames, planner=planner)[0] for planner in planners}
+    with open(golden_path, "w") as f:
+        json.dump({"planners": goldens}, f, indent=1, sort_keys=True)
+    print("Recorded {} frames x {} planners to {}".format(len(frames), len(goldens), golden_path))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("slalom").setLevel(logging.WARNING)
+    if len(sys.argv) < 2 or sys.argv[1] not in ("record", "check"):
+        print("Usage: python -m slalom.regression record [RunDir|ImageDir|synthetic] [Golden.json] [planner,...]")
+        print("       python -m slalom.regression check [RunDir|ImageDir|synthetic] [Golden.json] [Budgets.json] "
+              "[planner,...]")
+        print("Without arguments the synthetic corpus is checked against the committed goldens and budgets")
+        exit()
+    corpus = sys.argv[2] if len(sys.argv) > 2 else "synthetic"
+    golden_path = sys.argv[3] if len(sys.argv) > 3 else DEFAULT_GOLDEN
+    if sys.argv[1] == "record":
+        record(corpus, golden_path, sys.argv[4].split(",") if len(sys.argv) > 4 else Pipeline.PLANNERS)
+    else:
+        budgets = load_budgets(sys.argv[4] if len(sys.argv) > 4 else DEFAULT_BUDGETS_PATH)
+        planners = sys.argv[5].split(",") if len(sys.argv) > 5 else None
+        sys.exit(0 if check(corpus, golden_path, budgets, planners=planners) else 1)
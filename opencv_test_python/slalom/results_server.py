@@ -0,0 +1,387 @@
+"""
+Pipeline results for the car controller, pushed over a local socket as they are found.
+
+A ResultsPublisher runs an asyncio server in a thread of its own, TCP ("tcp:host:port") or a Unix domain socket
+("unix:path"). publish() encodes a FrameResult in the calling thread and hands the bytes to the server loop, it never
+waits for a subscriber. Every subscriber has a single slot holding the newest message it has not been sent yet: a
+subscriber that reads slowly skips the frames published in the meantime and gets the latest one next, it cannot hold
+the pipeline or the other subscribers up. read_messages() keeps to the same on the client side, it only hands out the
+newest message that arrived while the caller was busy.
+
+Messages are length prefixed, all little endian:
+
+    uint32   length of the rest
+    header   HEADER: sequence, capture time, publish time, cones, obstacles, pairs, waypoints, legs, grid flag
+    cones    CONE per cone: x, y, width, height, rotation in image pixels
+    obstacles    the same per obstacle
+    pairs    PAIR per gate: indices of its two cones
+    waypoints    POINT per waypoint: x, y
+    grid     when the flag is set, GRID: x, y, grid_size, offset, rows, columns, then one bit per cell, y * rows + x,
+             set where the cell is not passable (GridRectangle.passable), least significant bit first
+    legs     per leg a uint16 count, then CELL per cell: x, y
+
+Times are time.perf_counter() like FrameBus timestamps, which is one clock for every process on the machine, so a
+local subscriber can tell how old a message is. python -m slalom.results_server [address] [frames] runs the
+synthetic corpus through a pipeline publishing at 30 FPS and reports the capture to receipt latency a loopback client
+in another process measured.
+"""
+import asyncio
+import logging
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+from multiprocessing import Process, Queue
+
+from .grid import GridRectangle
+from .planner import Pathfinding
+
+log = logging.getLogger(__name__)
+
+DEFAULT_ADDRESS = "tcp:127.0.0.1:5800"
+# send buffer per subscriber, kept small so a subscriber that stops reading starts skipping after a few messages
+SOCKET_BUFFER = 8 * 1024
+
+LENGTH = struct.Struct("<I")
+HEADER = struct.Struct("<IddHHHHHB")
+CONE = struct.Struct("<5f")
+PAIR = struct.Struct("<HH")
+POINT = struct.Struct("<2f")
+GRID = struct.Struct("<4f2H")
+COUNT = struct.Struct("<H")
+CELL = struct.Struct("<HH")
+
+
+def parse_address(address):
+    """
+    :param address: "tcp:host:port", "unix:path" or just a port
+    :return: ("tcp", (host, port)) or ("unix", path)
+    """
+    if address.startswith("unix:"):
+        return "unix", address[5:]
+    if address.startswith("tcp:"):
+        address = address[4:]
+    host, _, port = address.rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+
+def occupancy_bits(grid):
+    """
+    :return: one bit per cell of grid, set where it is not passable, least significant bit first
+    """
+    bits = bytearray((len(grid.cells) + 7) // 8)
+    for i, occupied in enumerate(grid.cells):
+        if occupied and occupied != GridRectangle.WAYPOINT:
+            bits[i >> 3] |= 1 << (i & 7)
+    return bytes(bits)
+
+
+def encode(result, sequence, capture_time):
+    """
+    :param result: FrameResult
+    :param capture_time: time.perf_counter() when the frame was captured
+    :return: the message, length prefix included
+    """
+    cones, obstacles, grid = result.cones, result.obstacles, result.grid
+    legs = result.paths or []
+    index = {id(cone): i for i, cone in enumerate(cones)}
+    parts = [HEADER.pack(sequence, capture_time, time.perf_counter(), len(cones), len(obstacles), len(result.pairs),
+                         len(result.waypoints), len(legs), grid is not None)]
+    for rect in cones + obstacles:
+        parts.append(CONE.pack(rect.x, rect.y, rect.width, rect.height, rect.rotation or 0))
+    for a, b in result.pairs:
+        parts.append(PAIR.pack(index[id(a)], index[id(b)]))
+    for waypoint in result.waypoints:
+        parts.append(POINT.pack(waypoint.x, waypoint.y))
+    if grid is not None:
+        parts.append(GRID.pack(grid.x, grid.y, grid.grid_size, grid.offset, grid.rows, grid.columns))
+        parts.append(occupancy_bits(grid))
+    for came_from, finish in legs:
+        rects = Pathfinding.reconstruct(came_from, finish)
+        parts.append(COUNT.pack(len(rects)))
+        parts.extend(CELL.pack(*rect.coordinates) for rect in rects)
+    body = b"".join(parts)
+    return LENGTH.pack(len(body)) + body
+
+
+def decode(body):
+    """
+    :param body: a message without its length prefix
+    :return: dict of everything in it, "occupancy" holds the raw bits, see blocked()
+    """
+    (sequence, capture_time, publish_time, n_cones, n_obstacles, n_pairs, n_waypoints, n_legs,
+     has_grid) = HEADER.unpack_from(body)
+    offset = HEADER.size
+    rects = [CONE.unpack_from(body, offset + i * CONE.size) for i in range(n_cones + n_obstacles)]
+    offset += len(rects) * CONE.size
+    pairs = [PAIR.unpack_from(body, offset + i * PAIR.size) for i in range(n_pairs)]
+    offset += n_pairs * PAIR.size
+    waypoints = [POINT.unpack_from(body, offset + i * POINT.size) for i in range(n_waypoints)]
+    offset += n_waypoints * POINT.size
+    grid = occupancy = None
+    if has_grid:
+        grid = GRID.unpack_from(body, offset)
+        offset += GRID.size
+        size = (grid[4] * grid[5] + 7) // 8
+        occupancy = body[offset:offset + size]
+        offset += size
+    legs = []
+    for _ in range(n_legs):
+        count, = COUNT.unpack_from(body, offset)
+        offset += COUNT.size
+        legs.append([CELL.unpack_from(body, offset + i * CELL.size) for i in range(count)])
+        offset += count * CELL.size
+    return {"sequence": sequence, "capture_time": capture_time, "publish_time": publish_time,
+            "cones": rects[:n_cones], "obstacles": rects[n_cones:], "pairs": pairs, "waypoints": waypoints,
+            "grid": grid, "occupancy": occupancy, "legs": legs}
+
+
+def blocked(message, x, y):
+    """
+    :return: whether cell (x, y) of a decoded message's grid is not passable
+    """
+    i = y * message["grid"][4] + x
+    return bool(message["occupancy"][i >> 3] >> (i & 7) & 1)
+
+
+class _Subscriber:
+    """
+    One connection and the newest message it was not sent yet
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.pending = None
+        self.ready = asyncio.Event()
+        self.skipped = 0
+        self.task = None
+
+    def offer(self, message):
+        if self.pending is not None:
+            self.skipped += 1
+        self.pending = message
+        self.ready.set()
+
+    async def run(self):
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                message, self.pending = self.pending, None
+                self.writer.write(message)
+                await self.writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.writer.close()
+
+
+class ResultsPublisher:
+    """
+    Latest-only results server on a thread of its own, see the module docstring
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS):
+        self.address = address
+        self.sequence = 0
+        self._subscribers = set()
+        self._loop = asyncio.new_event_loop()
+        self._server = None
+        started = threading.Event()
+        self._thread = threading.Thread(target=self._serve, args=(started,), name="results-publisher", daemon=True)
+        self._thread.start()
+        started.wait()
+        if self._server is None:
+            raise IOError("Could not serve results on {}".format(address))
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
+
+    def _serve(self, started):
+        asyncio.set_event_loop(self._loop)
+        kind, where = parse_address(self.address)
+        try:
+            if kind == "unix":
+                server = asyncio.start_unix_server(self._connected, where)
+            else:
+                server = asyncio.start_server(self._connected, *where)
+            self._server = self._loop.run_until_complete(server)
+        except OSError as e:
+            log.error("Results server on {} failed: {}".format(self.address, e))
+            started.set()
+            return
+        log.info("Serving results on {}".format(self.address))
+        started.set()
+        self._loop.run_forever()
+
+    async def _connected(self, reader, writer):
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER)
+            if sock.family in (socket.AF_INET, socket.AF_INET6):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # drain() only returns once the message is with the kernel, until then newer ones replace the pending one
+        writer.transport.set_write_buffer_limits(high=0)
+        subscriber = _Subscriber(writer)
+        subscriber.task = asyncio.current_task()
+        self._subscribers.add(subscriber)
+        log.info("Results subscriber connected, {} now".format(len(self._subscribers)))
+        try:
+            await subscriber.run()
+        finally:
+            self._subscribers.discard(subscriber)
+
+    def _offer(self, message):
+        for subscriber in self._subscribers:
+            subscriber.offer(message)
+
+    def publish(self, result, capture_time=None):
+        """
+        Queue a FrameResult for every subscriber, returns right away
+        :param capture_time: time.perf_counter() when the frame was captured, defaults to now
+        """
+        self.sequence += 1
+        message = encode(result, self.sequence, time.perf_counter() if capture_time is None else capture_time)
+        self._loop.call_soon_threadsafe(self._offer, message)
+
+    def close(self):
+        async def shutdown():
+            self._server.close()
+            tasks = [subscriber.task for subscriber in self._subscribers]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._server.wait_closed()
+
+        if self._server is not None and self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(5)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+        self._loop.close()
+        kind, where = parse_address(self.address)
+        if kind == "unix" and os.path.exists(where):
+            os.unlink(where)
+
+
+class _LatestProtocol(asyncio.Protocol):
+    """
+    Client side of the latest-only contract: splits the stream into messages as it arrives and keeps only the newest
+    one that was not taken yet, so a reader that is busy skips to it instead of working through a backlog
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.latest = None  # (receipt time, body)
+        self.ready = asyncio.Event()
+        self.closed = False
+
+    def data_received(self, data):
+        self.buffer += data
+        received = time.perf_counter()
+        while len(self.buffer) >= LENGTH.size:
+            length, = LENGTH.unpack_from(self.buffer)
+            end = LENGTH.size + length
+            if len(self.buffer) < end:
+                break
+            self.latest = (received, bytes(self.buffer[LENGTH.size:end]))
+            del self.buffer[:end]
+            self.ready.set()
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self.ready.set()
+
+
+async def read_messages(address):
+    """
+    Connect to a ResultsPublisher and yield (receipt time, decoded message), always the newest message received since
+    the last one was taken
+    """
+    kind, where = parse_address(address)
+    loop = asyncio.get_running_loop()
+    if kind == "unix":
+        transport, protocol = await loop.create_unix_connection(_LatestProtocol, where)
+    else:
+        transport, protocol = await loop.create_connection(_LatestProtocol, *where)
+        transport.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    try:
+        while True:
+            if protocol.latest is None:
+                if protocol.closed:
+                    return
+                await protocol.ready.wait()
+                protocol.ready.clear()
+                continue
+            (received, body), protocol.latest = protocol.latest, None
+            yield received, decode(body)
+    finally:
+        transport.close()
+
+
+def latency_client(address, frames, results):
+    """
+    Process target: read frames messages and put (received, skipped, capture to receipt latencies in seconds)
+    """
+    async def run():
+        latencies = []
+        last = 0
+        skipped = 0
+        async for received, message in read_messages(address):
+            latencies.append(received - message["capture_time"])
+            skipped += max(message["sequence"] - last - 1, 0)
+            last = message["sequence"]
+            if len(latencies) >= frames:
+                break
+        return latencies, skipped
+
+    latencies, skipped = asyncio.run(run())
+    results.put((len(latencies), skipped, latencies))
+
+
+def main(address=DEFAULT_ADDRESS, frames=300, fps=30.0):
+    from .detector import Pipeline
+    from .regression import load_corpus
+
+    corpus = [frame for _, frame in load_corpus("synthetic")]
+    publisher = ResultsPublisher(address)
+    results = Queue()
+    client = Process(target=latency_client, args=(address, frames, results))
+    client.start()
+    pipeline = Pipeline()
+    period = 1.0 / fps
+    try:
+        while not publisher.subscribers:
+            time.sleep(0.01)
+        encode_seconds = []
+        sequence = 0
+        while client.is_alive() and sequence < frames * 2:
+            captured = time.perf_counter()
+            result = pipeline.process(corpus[sequence % len(corpus)])
+            began = time.perf_counter()
+            publisher.publish(result, captured)
+            encode_seconds.append(time.perf_counter() - began)
+            sequence += 1
+            time.sleep(max(period - (time.perf_counter() - captured), 0))
+        received, skipped, latencies = results.get()
+        client.join()
+    finally:
+        publisher.close()
+        pipeline.close()
+    latencies = sorted(latencies)
+    encode_seconds = sorted(encode_seconds)
+
+    def at(values, q):
+        return values[min(int(q * len(values)), len(values) - 1)] * 1000
+
+    print("{} messages received, {} skipped".format(received, skipped))
+    print("capture to receipt ms  p50 {:.2f}  p95 {:.2f}  p99 {:.2f}".format(
+        at(latencies, 0.5), at(latencies, 0.95), at(latencies, 0.99)))
+    print("publish() ms           p50 {:.3f}  p95 {:.3f}".format(at(encode_seconds, 0.5), at(encode_seconds, 0.95)))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_ADDRESS, int(sys.argv[2]) if len(sys.argv) > 2 else 300)
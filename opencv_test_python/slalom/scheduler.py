@@ -0,0 +1,108 @@
+"""
+Frame pacing against a target period, shedding optional work instead of falling behind.
+
+The display loops used to wait a fixed 33 ms after every frame, so a slow frame simply came on top of it. The
+FrameScheduler measures how long the frame took, from begin() to wait_ms(), and only waits for what is left of the
+period, at least 1 ms so HighGUI still gets to handle its events.
+
+A frame over the period raises the degradation level by one, RECOVER_FRAMES frames in a row under HEADROOM of the
+period lower it again. The levels shed work in this order, every level keeping what the ones below it shed:
+
+    0 full          everything
+    1 no_grid       the grid is not drawn
+    2 low_scale     detection runs on the frame shrunk to REDUCED_SCALE, Pipeline.detection_scale
+    3 fewer_legs    only the first MAX_LEGS legs are planned, Pipeline.max_legs
+    4 last_path     planning is skipped, the previous frame's paths are shown again, Pipeline.reuse_path
+
+apply() only touches the Pipeline attributes the level sheds: the pipeline's own value is kept aside when its level is
+reached and put back when the scheduler recovers below it, so a detection_scale or max_legs set by the caller stays in
+force at the levels that do not shed it, and a smaller one than the level's is kept. apply() also reports the level as
+Pipeline.degradation_level, which every FrameResult carries, and sets Pipeline.frame_deadline to the end of the
+period, the anytime planner then gets what is left of the frame when planning starts as its Pipeline.planning_deadline.
+"""
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+LEVELS = ("full", "no_grid", "low_scale", "fewer_legs", "last_path")
+HEADROOM = 0.75  # share of the period a frame has to stay under to count towards recovery
+RECOVER_FRAMES = 30
+REDUCED_SCALE = 0.5
+MAX_LEGS = 2
+# (level, Pipeline attribute, its value at that level and above from the pipeline's own value)
+SHED = (
+    (1, "draw_grid", lambda own: False),
+    (2, "detection_scale", lambda own: min(own, REDUCED_SCALE)),
+    (3, "max_legs", lambda own: MAX_LEGS if own is None else min(own, MAX_LEGS)),
+    (4, "reuse_path", lambda own: True),
+)
+
+
+class FrameScheduler:
+    """
+    Waits for the rest of the frame period and picks the degradation level of the next frame, see the module docstring
+    """
+
+    def __init__(self, period=1 / 30.0, max_level=len(LEVELS) - 1):
+        """
+        :param period: target seconds per frame
+        :param max_level: highest level the scheduler may go to, 0 only paces the loop
+        """
+        self.period = period
+        self.max_level = max_level
+        self.level = 0
+        self.elapsed = 0.0  # seconds the last finished frame took
+        self._under = 0
+        self._start = None
+        self._own = {}  # Pipeline attribute -> the pipeline's value, while the level sheds it
+
+    @property
+    def level_name(self):
+        return LEVELS[self.level]
+
+    def begin(self):
+        """
+        The frame starts now
+        """
+        self._start = time.perf_counter()
+
+    def apply(self, pipeline):
+        """
+        Set the pipeline up for the current level
+        """
+        if self._start is not None:
+            pipeline.frame_deadline = self._start + self.period
+        for level, name, value in SHED:
+            if self.level >= level:
+                own = self._own.setdefault(name, getattr(pipeline, name))
+                setattr(pipeline, name, value(own))
+            elif name in self._own:
+                setattr(pipeline, name, self._own.pop(name))
+        pipeline.degradation_level = self.level
+
+    def wait_ms(self):
+        """
+        The frame is done: update the level for the next one
+        :return: milliseconds to wait for the rest of the period, for cv2.waitKey()
+        """
+        if self._start is None:
+            return max(1, int(self.period * 1000))
+        self.elapsed = time.perf_counter() - self._start
+        self._start = None
+        level = self.level
+        if self.elapsed > self.period:
+            self._under = 0
+            level = min(level + 1, self.max_level)
+        elif self.elapsed < HEADROOM * self.period:
+            self._under += 1
+            if self._under >= RECOVER_FRAMES and level > 0:
+                self._under = 0
+                level -= 1
+        else:
+            self._under = 0
+        if level != self.level:
+            log.info("Frame took {:.1f} ms of {:.1f} ms, degradation level {} -> {} ({})".format(
+                self.elapsed * 1000, self.period * 1000, self.level, level, LEVELS[level]))
+            self.level = level
+        return max(1, int((self.period - self.elapsed) * 1000))
@@ -0,0 +1,208 @@
+"""
+Planning problems of single frames written to disk, and a runner that plans them again offline.
+
+A slow or wrong path used to need the original image and every trackbar as they were to show up again. With
+Pipeline.snapshots set to a SnapshotWriter, each frame that plans writes one np.savez_compressed file right before the
+planner runs, holding all the planner sees:
+
+- planner name, cell_mm and planning deadline
+- grid geometry (x, y, width, height, grid_size, spacing) and the occupancy codes, Grid.cells
+- cost layers and turn costs, where the grid has any
+- the waypoints handed to the planner, after max_legs, and the start cell, the cell of the first one
+
+The occupancy codes are mostly FREE and compress to well under a kB for a typical grid.
+
+replay() loads the snapshots of a run and builds every grid before the clock starts, so only create_planner() and
+test_path() are timed, per frame and through a Profiler like the live pipeline's. Planners keep their cache between
+the frames of a run as they do in Pipeline, every repeat starts with an empty one. Nothing here imports OpenCV, grids
+are filled from the stored codes instead of being rasterized:
+
+    python -m slalom.snapshot record <dataset> <snapshot directory> [planner]
+    python -m slalom.snapshot replay <snapshot directory> [planner,planner,...] [repeats] [stats.csv|stats.jsonl]
+
+record runs a dataset through Pipeline (that needs OpenCV), replay plans the snapshots again with the planners given,
+by default the one each snapshot was recorded with.
+"""
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+from .geometry import Rectangle
+from .grid import Grid
+from .instrumentation import Profiler, StatsWriter
+from .leg_cache import LegCache
+from .planners import PLANNERS, create_planner
+from .stage_cache import fill_grid
+
+log = logging.getLogger(__name__)
+
+
+class Snapshot:
+    """
+    One frame's planning problem, see the module docstring
+    """
+
+    def __init__(self, name, planner, geometry, cells, waypoints, start, cell_mm, deadline=None, cost_layers=(),
+                 turn_costs=None):
+        """
+        :param geometry: (x, y, width, height, grid_size, spacing) of the Grid
+        :param cells: occupancy codes, y * rows + x
+        :param waypoints: (x, y, width, height) of each waypoint
+        :param start: (x, y) cell the first leg starts from
+        """
+        self.name = name
+        self.planner = planner
+        self.geometry = geometry
+        self.cells = cells
+        self.waypoints = waypoints
+        self.start = start
+        self.cell_mm = cell_mm
+        self.deadline = deadline
+        self.cost_layers = cost_layers
+        self.turn_costs = turn_costs
+
+    @classmethod
+    def from_pipeline(cls, name, pipeline, waypoints):
+        """
+        :param waypoints: what the pipeline hands to its planner
+        """
+        grid = pipeline.grid
+        start = grid.get_index_from_position(waypoints[0].x, waypoints[0].y) if waypoints else (-1, -1)
+        return cls(name, pipeline.planner, (grid.x, grid.y, grid.width, grid.height, grid.grid_size, grid.spacing),
+                   bytes(grid.cells), [(w.x, w.y, w.width, w.height) for w in waypoints], start, pipeline.cell_mm,
+                   pipeline.planning_deadline, grid.cost_layers, grid.turn_costs)
+
+    def save(self, path):
+        arrays = {"planner": np.array(self.planner), "geometry": np.array(self.geometry),
+                  "cells": np.frombuffer(self.cells, dtype=np.uint8),
+                  "waypoints": np.array(self.waypoints, dtype=np.float64).reshape(-1, 4),
+                  "start": np.array(self.start, dtype=np.int32), "cell_mm": np.float64(self.cell_mm),
+                  "deadline": np.float64(np.nan if self.deadline is None else self.deadline)}
+        if self.cost_layers:
+            arrays["cost_layers"] = np.array([list(layer) for layer in self.cost_layers], dtype=np.float64)
+        if self.turn_costs is not None:
+            arrays["turn_costs"] = np.array(self.turn_costs, dtype=np.float64)
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            deadline = float(data["deadline"])
+            return cls(os.path.splitext(os.path.basename(path))[0], str(data["planner"]),
+                       tuple(data["geometry"].tolist()), data["cells"].tobytes(), data["waypoints"].tolist(),
+                       tuple(data["start"].tolist()), float(data["cell_mm"]), None if np.isnan(deadline) else deadline,
+                       data["cost_layers"].tolist() if "cost_layers" in data.files else (),
+                       tuple(data["turn_costs"].tolist()) if "turn_costs" in data.files else None)
+
+    def grid(self):
+        """
+        :return: a new Grid in the state the planner found it in
+        """
+        x, y, width, height, grid_size, spacing = self.geometry
+        grid = Grid(x, y, width, height, grid_size, spacing)
+        fill_grid(grid, np.frombuffer(self.cells, dtype=np.uint8))
+        for layer in self.cost_layers:
+            grid.add_cost_layer(layer)
+        grid.turn_costs = self.turn_costs
+        return grid
+
+    def rects(self):
+        return [Rectangle(x, y, width, height) for x, y, width, height in self.waypoints]
+
+
+class SnapshotWriter:
+    """
+    Pipeline.snapshots, writes one numbered file per planned frame into a directory
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.written = 0
+
+    def write(self, pipeline, waypoints):
+        name = "frame_{:05d}".format(self.written)
+        Snapshot.from_pipeline(name, pipeline, waypoints).save(os.path.join(self.directory, name + ".npz"))
+        self.written += 1
+
+
+def load_snapshots(directory):
+    return [Snapshot.load(os.path.join(directory, name)) for name in sorted(os.listdir(directory))
+            if name.endswith(".npz")]
+
+
+def replay(snapshots, planner=None, repeats=1, profiler=None):
+    """
+    :param planner: one of PLANNERS for every snapshot, None plans each with the planner it was recorded with
+    :param profiler: receives one frame per planned snapshot, the planner time as the "astar" stage
+    :return: [(snapshot name, planner ms), ...] of every planned frame
+    """
+    profiler = profiler or Profiler(("astar",), window=len(snapshots) * repeats)
+    timings = []
+    for _ in range(repeats):
+        cache = {"legs": LegCache()}
+        for snapshot in snapshots:
+            # built before the clock starts, the compiled costs a planner leaves on a grid must not carry over
+            grid, waypoints = snapshot.grid(), snapshot.rects()
+            profiler.frame_start()
+            began = time.perf_counter()
+            with profiler.stage("astar"):
+                create_planner(planner or snapshot.planner, grid, waypoints, profiler, cache, snapshot.cell_mm,
+                               snapshot.deadline).test_path()
+            timings.append((snapshot.name, (time.perf_counter() - began) * 1000))
+            profiler.frame_end()
+    return timings
+
+
+def record(dataset, directory, planner="astar"):
+    """
+    Run a dataset through Pipeline and write the snapshots of every frame that plans
+    :return: number of snapshots written
+    """
+    from .detector import Pipeline
+    from .regression import load_corpus
+    pipeline = Pipeline()
+    pipeline.planner = planner
+    pipeline.snapshots = SnapshotWriter(directory)
+    for _, frame in load_corpus(dataset):
+        pipeline.process(frame)
+    pipeline.close()
+    return pipeline.snapshots.written
+
+
+def main(argv):
+    if argv[0] == "record":
+        written = record(argv[1], argv[2], argv[3] if len(argv) > 3 else "astar")
+        print("{} snapshots written to {}".format(written, argv[2]))
+        return
+    snapshots = load_snapshots(argv[1])
+    planners = argv[2].split(",") if len(argv) > 2 and argv[2] != "-" else [None]
+    repeats = int(argv[3]) if len(argv) > 3 else 1
+    for planner in planners:
+        if planner is not None and planner not in PLANNERS:
+            raise ValueError("Unknown planner {}, pick from {}".format(planner, ", ".join(PLANNERS)))
+        profiler = Profiler(("astar",), window=len(snapshots) * repeats)
+        if len(argv) > 4:
+            root, extension = os.path.splitext(argv[4])
+            profiler.sinks.append(StatsWriter("{}_{}{}".format(root, planner or "recorded", extension)))
+        timings = replay(snapshots, planner, repeats, profiler)
+        profiler.close()
+        name, slowest = max(timings, key=lambda timing: timing[1])
+        print("{}: {} frames planned in {:.0f} ms, slowest {} with {:.1f} ms".format(
+            planner or "recorded planners", len(timings), sum(ms for _, ms in timings), name, slowest))
+        print("  {:<20}{:>10}{:>10}{:>10}".format("", "p50", "p95", "p99"))
+        for key, p50, p95, p99 in profiler.summary():
+            if key != "total_ms":
+                print("  {:<20}{:>10.1f}{:>10.1f}{:>10.1f}".format(key, p50, p95, p99))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    if len(sys.argv) < 3 or sys.argv[1] not in ("record", "replay"):
+        print("Usage: python -m slalom.snapshot record <dataset> <snapshot directory> [planner]\n"
+              "       python -m slalom.snapshot replay <snapshot directory> [planner,...|-] [repeats] [stats.csv]")
+        sys.exit(1)
+    main(sys.argv[1:])
@@ -0,0 +1,297 @@
+"""
+Stage outputs of Pipeline.process kept on disk between runs, addressed by what they were computed from.
+
+Reprocessing a recording after a change in one stage used to run every stage again. With Pipeline.stage_cache set,
+every frame gets one key per cached stage: the hash of the frame for the first one, and for each stage the hash of
+the key of the stage before it and the parameters of the stage itself (STAGE_PARAMETERS). A key thus stands for the
+frame and everything upstream, so changing, say, dist_max keeps the threshold and detect entries and only recomputes
+pairing, grid and plan. The stages are:
+
+- threshold: remap, hsv, morphology and contours, stores the thresholded image and the contours
+- detect: cones and obstacles as rows of floats, the contour of each as an index into the threshold entry
+- pairing: gates as cone index pairs, waypoints and the average cone size
+- grid: geometry, occupancy codes and cell_mm, not cached with Pipeline.cost_layers, callables have no key
+- plan: the ((x, y), heading) cells of every leg and the pose of its last rect, not cached with a planning_deadline or
+  frame_deadline, reuse_path or without pathfinding, what comes out there depends on more than the inputs. leg_workers
+  is not part of the key, a LegPool plans exactly what the planner's test_path() does
+
+Each entry is one np.savez_compressed file named after its key, the thresholded image is mostly black and compresses
+to a few kB. The directory is bounded by max_bytes, the least recently used entries are deleted first; a hit touches
+the file, so the order survives restarts. Entries are written to a temporary file and renamed, processes may share a
+directory.
+
+python -m slalom.stage_cache <dataset> <cache directory> [planner] runs a dataset twice through a cached Pipeline
+and prints the hits of every stage.
+"""
+import hashlib
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+STAGE_PARAMETERS = (
+    ("threshold", lambda p: (calibration_key(p.calibration), p.hMin, p.sMin, p.vMin, p.hMax, p.sMax, p.vMax,
+                             p.detection_scale, p.eroSize, p.dilSize)),
+    ("detect", lambda p: (p.min_size, p.scale)),
+    ("pairing", lambda p: (p.dist_min, p.dist_max, p.DEFAULT_CONE_SIZE, p.scale)),
+    ("grid", lambda p: None if p.cost_layers else (p.draw_grid or p.pathfinding,)),
+    ("plan", lambda p: None if p.planning_deadline is not None or p.frame_deadline is not None or p.reuse_path or
+        not p.pathfinding else (p.planner, p.max_legs)),
+)
+
+
+def calibration_key(calibration):
+    """
+    :return: hash of what a calibration.Calibration maps frames with, None without one
+    """
+    if calibration is None:
+        return None
+    digest = hashlib.sha1()
+    for array in (calibration.camera_matrix, calibration.dist_coeffs, calibration.homography):
+        digest.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+    digest.update(repr((calibration.image_size, calibration.output_size, calibration.mm_per_pixel)).encode())
+    return digest.hexdigest()
+
+
+def frame_key(frame):
+    digest = hashlib.sha1(repr((frame.shape, frame.dtype.str)).encode())
+    digest.update(np.ascontiguousarray(frame).data)
+    return digest.hexdigest()
+
+
+def encode_contours(contours):
+    lengths = np.array([len(c) for c in contours], dtype=np.int32)
+    points = np.concatenate(contours).reshape(-1, 2) if contours else np.zeros((0, 2))
+    return {"contour_lengths": lengths, "contour_points": points.astype(np.int32)}
+
+
+def decode_contours(entry):
+    points = entry["contour_points"].reshape(-1, 1, 2)
+    return np.split(points, np.cumsum(entry["contour_lengths"])[:-1]) if len(entry["contour_lengths"]) else []
+
+
+def encode_rects(rects, contours=None):
+    """
+    :param contours: the list the rects' contours are in, stored as indices into it
+    :return: (n, 6) x, y, width, height, rotation, contour index (-1 for none)
+    """
+    index = {id(c): i for i, c in enumerate(contours or [])}
+    return np.array([[r.x, r.y, r.width, r.height, r.rotation, index.get(id(r.contour), -1)] for r in rects],
+                    dtype=np.float64).reshape(-1, 6)
+
+
+def decode_rects(rows, contours=None):
+    from .geometry import Rectangle
+    return [Rectangle(x, y, width, height, rotation, contours[int(i)] if i >= 0 else None)
+            for x, y, width, height, rotation, i in rows.tolist()]
+
+
+def encode_pairs(pairs, cones):
+    index = {id(c): i for i, c in enumerate(cones)}
+    return np.array([[index[id(a)], index[id(b)]] for a, b in pairs], dtype=np.int32).reshape(-1, 2)
+
+
+def decode_pairs(rows, cones):
+    return [(cones[a], cones[b]) for a, b in rows.tolist()]
+
+
+def encode_grid(grid, cell_mm):
+    return {"geometry": np.array([grid.x, grid.y, grid.width, grid.height, grid.grid_size, grid.spacing]),
+            "cells": np.frombuffer(grid.cells, dtype=np.uint8), "cell_mm": np.float64(cell_mm)}
+
+
+def fill_grid(grid, cells):
+    """
+    Set the occupied codes of a freshly built or cleared grid
+    """
+    rows = grid.rows
+    for i in np.flatnonzero(cells).tolist():
+        grid.set_occupied(grid.grid[i // rows][i % rows], int(cells[i]))
+
+
+def encode_paths(paths):
+    """
+    :param paths: what Pathfinding.test_path() returned
+    """
+    from .planner import Pathfinding
+    if paths == (None, None):
+        return {"legs": np.zeros((0, 3), dtype=np.int32), "leg_lengths": np.zeros(0, dtype=np.int32),
+                "poses": np.zeros((0, 3)), "no_legs": np.bool_(True)}
+    legs, lengths, poses = [], [], []
+    for came_from, finish in paths:
+        rects = Pathfinding.reconstruct(came_from, finish)
+        legs.extend(r.coordinates + (-1 if r.direction is None else r.direction,) for r in rects)
+        lengths.append(len(rects))
+        poses.append(getattr(finish, "pose", None) or (np.nan, np.nan, np.nan))
+    return {"legs": np.array(legs, dtype=np.int32).reshape(-1, 3), "leg_lengths": np.array(lengths, dtype=np.int32),
+            "poses": np.array(poses, dtype=np.float64).reshape(-1, 3), "no_legs": np.bool_(False)}
+
+
+def decode_paths(entry, grid):
+    """
+    :return: test_path()'s list of (came_from, finish) on grid, built like parallel_legs.stitch() does
+    """
+    import copy
+    if entry["no_legs"]:
+        return None, None
+    paths = []
+    cells = entry["legs"].tolist()
+    start = 0
+    for length, pose in zip(entry["leg_lengths"].tolist(), entry["poses"].tolist()):
+        rects = []
+        for x, y, direction in cells[start:start + length]:
+            rect = copy.copy(grid.grid[y][x])
+            rect.direction = None if direction < 0 else direction
+            rects.append(rect)
+        start += length
+        if not np.isnan(pose[0]):
+            rects[-1].pose = (pose[0], pose[1], int(pose[2]))
+        came_from = {rects[0]: None}
+        for previous, rect in zip(rects, rects[1:]):
+            came_from[rect] = previous
+        paths.append((came_from, rects[-1]))
+    return paths
+
+
+class StageCache:
+    """
+    Directory of stage entries with LRU eviction by size, see the module docstring
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        :param directory: created when missing, entries already in it are kept
+        :param max_bytes: size of the entries on disk before the least recently used ones are deleted
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.hits = {stage: 0 for stage, _ in STAGE_PARAMETERS}
+        self.misses = {stage: 0 for stage, _ in STAGE_PARAMETERS}
+        self.nbytes = 0
+        self._entries = OrderedDict()  # key -> bytes on disk, least recently used first
+        found = []
+        for name in os.listdir(directory):
+            if name.endswith(".npz"):
+                stat = os.stat(os.path.join(directory, name))
+                found.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self.nbytes += size
+        self._evict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def keys(self, pipeline, frame):
+        """
+        :return: {stage: key} for the stages of frame that can be cached with the pipeline's parameters, from the first
+                 one up to the first that cannot
+        """
+        key = frame_key(frame)
+        keys = {}
+        for stage, parameters in STAGE_PARAMETERS:
+            values = parameters(pipeline)
+            if values is None:
+                break
+            key = hashlib.sha1(repr((key, stage, values)).encode()).hexdigest()
+            keys[stage] = key
+        return keys
+
+    def get(self, stage, keys):
+        """
+        :return: dict of the arrays stored for the stage, None when it is not cached
+        """
+        key = keys.get(stage)
+        if key is None:
+            return None
+        if key in self._entries:
+            path = self._path(key)
+            try:
+                with np.load(path) as data:
+                    entry = {name: data[name] for name in data.files}
+                os.utime(path)
+            except (IOError, OSError, ValueError):
+                # deleted by another process sharing the directory, or cut short
+                self.nbytes -= self._entries.pop(key)
+            else:
+                self._entries.move_to_end(key)
+                self.hits[stage] += 1
+                return entry
+        self.misses[stage] += 1
+        return None
+
+    def put(self, stage, keys, arrays):
+        """
+        :param arrays: dict of numpy arrays, what get() hands back
+        """
+        key = keys.get(stage)
+        if key is None:
+            return
+        fd, temporary = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        size = os.path.getsize(temporary)
+        os.replace(temporary, self._path(key))
+        self.nbytes += size - self._entries.pop(key, 0)
+        self._entries[key] = size
+        self._evict()
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self.nbytes -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        for key in list(self._entries):
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+        self._entries.clear()
+        self.nbytes = 0
+
+
+def main(argv):
+    from .detector import Pipeline
+    from .regression import load_corpus
+    frames = load_corpus(argv[0])
+    cache = StageCache(argv[1])
+    pipeline = Pipeline()
+    if len(argv) > 2:
+        pipeline.planner = argv[2]
+    pipeline.stage_cache = cache
+    for run in ("first", "second"):
+        began = time.perf_counter()
+        for _, frame in frames:
+            pipeline.process(frame)
+        elapsed = time.perf_counter() - began
+        print("{} run: {} frames in {:.0f} ms, {} entries, {:.1f} MB".format(
+            run, len(frames), elapsed * 1000, len(cache), cache.nbytes / 1024.0 / 1024.0))
+        print("  " + ", ".join("{} {}/{}".format(stage, cache.hits[stage], cache.hits[stage] + cache.misses[stage])
+                               for stage, _ in STAGE_PARAMETERS))
+        for stage, _ in STAGE_PARAMETERS:
+            cache.hits[stage] = cache.misses[stage] = 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    if len(sys.argv) < 3:
+        print("Usage: python -m slalom.stage_cache <dataset> <cache directory> [planner]")
+        sys.exit(1)
+    main(sys.argv[1:])
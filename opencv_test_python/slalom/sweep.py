@@ -0,0 +1,311 @@
+"""
+Detection parameter sweep over a labelled dataset, in a process pool.
+
+Tuning Erode, Dilate, NoiseFilter, DistMin, DistMax and the HSV bounds on the trackbars only ever shows one frame.
+sweep() scores every configuration of a grid (grid_configs) or random search (random_configs) on every frame of a
+dataset against its ground truth and ranks them.
+
+Frames are decoded once, in the parent, into one shared memory block every worker maps; a recorded run is not even
+decoded, the workers map its chunk files. Configurations are sorted by their stages from the first on and handed out
+in groups sharing the HSV bounds, and every worker keeps per frame what each stage produced for the upstream
+parameters it was last asked for:
+
+    hsv          cv2.cvtColor, the same for every configuration
+    threshold    inRange + morphology + findContours, per HSV bounds, Erode and Dilate
+    detect       cones and obstacles, per NoiseFilter on top
+    pairing      gates and waypoints, per DistMin and DistMax on top
+
+so a configuration that only changes DistMax runs the pairing and nothing else. The stages do what Pipeline.process
+does, only on the one channel the contours are searched in. Planning is not part of the sweep.
+
+A configuration scores the mean F1 of its cones, obstacles and waypoints over all frames, a detection matching a truth
+position within half a cone size. Truth is ArenaTruth.to_dict() per frame name, generated for the synthetic corpus.
+
+python -m slalom.sweep [synthetic|<dataset> <truth.json>] [grid|random <n>] [workers] prints the best configurations
+and the throughput in frame-configurations per second.
+"""
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from math import hypot
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from .detector import Pipeline
+from .recording import INDEX_FILE, RunReader
+from .regression import SYNTHETIC_CORPUS, load_corpus
+from .synthetic_arena import generate_arena
+
+log = logging.getLogger(__name__)
+
+# Pipeline attributes a configuration sets, grouped by the stage that first reads them
+HSV_PARAMETERS = ("hMin", "sMin", "vMin", "hMax", "sMax", "vMax")
+MORPHOLOGY_PARAMETERS = ("eroSize", "dilSize")
+DETECT_PARAMETERS = ("min_size",)
+PAIRING_PARAMETERS = ("dist_min", "dist_max")
+PARAMETERS = HSV_PARAMETERS + MORPHOLOGY_PARAMETERS + DETECT_PARAMETERS + PAIRING_PARAMETERS
+
+# trackbar ranges, what random_configs draws from
+RANGES = {"hMin": (0, 179), "sMin": (0, 255), "vMin": (0, 255), "hMax": (0, 179), "sMax": (0, 255), "vMax": (0, 255),
+          "eroSize": (0, 24), "dilSize": (0, 24), "min_size": (0, 50), "dist_min": (1, 20), "dist_max": (1, 20)}
+
+# around the trackbar defaults, what python -m slalom.sweep grid runs
+DEFAULT_GRID = {"sMin": [61, 81, 101], "vMin": [75, 95, 115], "eroSize": [0, 2], "dilSize": [0, 2],
+                "min_size": [3, 5, 10], "dist_min": [3, 4], "dist_max": [6, 7, 8]}
+
+DEFAULT_TOLERANCE = 8.0  # px, when the truth has no cone size
+
+
+def default_config():
+    pipeline = Pipeline()
+    return {name: getattr(pipeline, name) for name in PARAMETERS}
+
+
+def grid_configs(values):
+    """
+    :param values: parameter -> list of values, parameters left out keep the Pipeline default
+    :return: every combination as a config dict
+    """
+    base = default_config()
+    names = sorted(values)
+    configs = []
+    for combination in itertools.product(*(values[name] for name in names)):
+        config = dict(base)
+        config.update(zip(names, combination))
+        configs.append(config)
+    return configs
+
+
+def random_configs(n, ranges=RANGES, seed=0):
+    """
+    :return: n configs drawn uniformly from ranges, min and max bounds in order
+    """
+    rng = random.Random(seed)
+    configs = []
+    for _ in range(n):
+        config = default_config()
+        for name, (low, high) in ranges.items():
+            config[name] = rng.randint(low, high)
+        for low, high in (("hMin", "hMax"), ("sMin", "sMax"), ("vMin", "vMax"), ("dist_min", "dist_max")):
+            if config[low] > config[high]:
+                config[low], config[high] = config[high], config[low]
+        configs.append(config)
+    return configs
+
+
+def load_dataset(path):
+    """
+    :param path: "synthetic", a recorded run or a directory of images
+    :return: (names, frames, truth by name), truth only for "synthetic"
+    """
+    if path == "synthetic":
+        truth = {}
+        for i, scene in enumerate(SYNTHETIC_CORPUS):
+            truth["arena_{}".format(i)] = generate_arena(**scene)[1].to_dict()
+        frames = load_corpus(path)
+        return [name for name, _ in frames], [frame for _, frame in frames], truth
+    frames = load_corpus(path)
+    return [name for name, _ in frames], [frame for _, frame in frames], {}
+
+
+def match(found, truth, tolerance):
+    """
+    :param found: (x, y) detections
+    :param truth: (x, y) true positions
+    :return: F1 of a greedy nearest first matching within tolerance, 1 when both are empty
+    """
+    if not found and not truth:
+        return 1.0
+    pairs = sorted((hypot(f[0] - t[0], f[1] - t[1]), i, j) for i, f in enumerate(found) for j, t in enumerate(truth))
+    used_found, used_truth = set(), set()
+    for distance, i, j in pairs:
+        if distance > tolerance:
+            break
+        if i not in used_found and j not in used_truth:
+            used_found.add(i)
+            used_truth.add(j)
+    matched = len(used_found)
+    return 2.0 * matched / (len(found) + len(truth))
+
+
+def score_frame(cones, obstacles, waypoints, truth):
+    """
+    :return: (mean F1, cone F1, obstacle F1, waypoint F1) of one frame
+    """
+    tolerance = truth["cone_size"] / 2.0 if truth.get("cone_size") else DEFAULT_TOLERANCE
+    scores = (match([(c.x, c.y) for c in cones], truth["cones"], tolerance),
+              match([(o.x, o.y) for o in obstacles], [o[0] for o in truth["obstacles"]], tolerance),
+              match([(w.x, w.y) for w in waypoints], truth["waypoints"], tolerance))
+    return (sum(scores) / len(scores),) + scores
+
+
+# worker side: the frames of the sweep and the stage outputs of the last upstream parameters per frame
+_frames = None
+_block = None
+_stages = {}
+
+
+def _init_worker(source):
+    """
+    Map the frames: ("shared", block name, [(offset, shape), ...]) or ("run", run path)
+    """
+    global _frames, _block
+    if source[0] == "run":
+        run = RunReader(source[1])
+        _frames = [run[i] for i in range(len(run))]
+        return
+    _, name, layout = source
+    _block = shared_memory.SharedMemory(name=name)
+    _frames = [np.ndarray(shape, dtype=np.uint8, buffer=_block.buf, offset=offset) for offset, shape in layout]
+
+
+def _cached(stage, i, key, compute):
+    """
+    :return: what compute() gave for frame i and the stage under key, computed again only when key changed
+    """
+    slot = (stage, i)
+    entry = _stages.get(slot)
+    if entry is None or entry[0] != key:
+        entry = _stages[slot] = (key, compute())
+    return entry[1]
+
+
+def _threshold(i, hsv_key, morphology_key):
+    """
+    Pipeline.process from inRange to findContours on the one channel findContours sees, the red channel of the masked
+    image
+    """
+    frame = _frames[i]
+    hsv = _cached("hsv", i, None, lambda: cv2.cvtColor(frame, cv2.COLOR_BGR2HSV))
+    mask = cv2.inRange(hsv, np.array(hsv_key[:3]), np.array(hsv_key[3:]))
+    red = cv2.bitwise_and(frame[:, :, 2], frame[:, :, 2], mask=mask)
+    erode, dilate = morphology_key
+    if erode > 0:
+        red = cv2.erode(red, np.ones((erode, erode), np.uint8), iterations=1)
+    if dilate > 0:
+        red = cv2.dilate(red, np.ones((dilate, dilate), np.uint8), iterations=1)
+    return cv2.findContours(red, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)[-2]
+
+
+def _evaluate(configs, truth):
+    """
+    Runs in a worker: score configs, sorted so neighbours share their upstream stages, on every frame
+    :param truth: truth dict per frame, None where a frame has none
+    :return: [(mean score, cone F1, obstacle F1, waypoint F1, frames scored), ...] per config
+    """
+    pipeline = Pipeline()
+    results = []
+    for config in configs:
+        for name, value in config.items():
+            setattr(pipeline, name, value)
+        hsv_key = tuple(config[name] for name in HSV_PARAMETERS)
+        threshold_key = hsv_key + tuple(config[name] for name in MORPHOLOGY_PARAMETERS)
+        detect_key = threshold_key + (config["min_size"],)
+        pairing_key = detect_key + (config["dist_min"], config["dist_max"])
+        totals = [0.0, 0.0, 0.0, 0.0]
+        scored = 0
+        for i in range(len(_frames)):
+            contours = _cached("threshold", i, threshold_key,
+                               lambda: _threshold(i, hsv_key, threshold_key[len(hsv_key):]))
+            cones, obstacles = _cached("detect", i, detect_key, lambda: pipeline.detect_cones_and_obstacles(contours))
+            _, waypoints, _ = _cached("pairing", i, pairing_key, lambda: pipeline.pair_cones(cones))
+            if truth[i] is None:
+                continue
+            for k, value in enumerate(score_frame(cones, obstacles, waypoints, truth[i])):
+                totals[k] += value
+            scored += 1
+        results.append(tuple(total / max(scored, 1) for total in totals) + (scored,))
+    return results
+
+
+def _group_key(config):
+    return tuple(config[name] for name in HSV_PARAMETERS)
+
+
+def sweep(dataset, configs, truth=None, workers=None):
+    """
+    :param dataset: what load_dataset takes
+    :param configs: config dicts, see grid_configs and random_configs
+    :param truth: truth dict by frame name, None for what load_dataset has
+    :param workers: processes, None for one per CPU
+    :return: (rows sorted best first, each (score, cone F1, obstacle F1, waypoint F1, config),
+              frame-configurations evaluated per second)
+    """
+    began = time.perf_counter()
+    block = None
+    if dataset != "synthetic" and os.path.exists(os.path.join(dataset, INDEX_FILE)):
+        run = RunReader(dataset)
+        names = ["frame_{:05d}".format(i) for i in range(len(run))]
+        source = ("run", dataset)
+        loaded = {}
+    else:
+        names, frames, loaded = load_dataset(dataset)
+        # every frame decoded once, into one block the workers map
+        layout = []
+        offset = 0
+        for frame in frames:
+            layout.append((offset, frame.shape))
+            offset += frame.nbytes
+        block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for (offset, shape), frame in zip(layout, frames):
+            np.ndarray(shape, dtype=np.uint8, buffer=block.buf, offset=offset)[:] = frame
+        source = ("shared", block.name, layout)
+    truth = loaded if truth is None else truth
+    frame_truth = [truth.get(name) for name in names]
+    if not any(t is not None for t in frame_truth):
+        raise ValueError("No ground truth for any frame of {}".format(dataset))
+
+    # configs sharing the HSV bounds go to one worker, in an order that keeps the later stages cached
+    order = sorted(range(len(configs)), key=lambda i: tuple(configs[i][name] for name in PARAMETERS))
+    groups = [list(group) for _, group in itertools.groupby(order, key=lambda i: _group_key(configs[i]))]
+    rows = [None] * len(configs)
+    try:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(source,)) as executor:
+            futures = [(group, executor.submit(_evaluate, [configs[i] for i in group], frame_truth))
+                       for group in groups]
+            for group, future in futures:
+                for i, result in zip(group, future.result()):
+                    rows[i] = result[:4] + (configs[i],)
+    finally:
+        if block is not None:
+            block.close()
+            block.unlink()
+    seconds = time.perf_counter() - began
+    rows.sort(key=lambda row: row[0], reverse=True)
+    return rows, len(configs) * len(names) / seconds
+
+
+def main(argv):
+    dataset = argv[0] if argv else "synthetic"
+    argv = argv[1:]
+    truth = None
+    if dataset != "synthetic":
+        with open(argv[0]) as f:
+            truth = json.load(f)
+        argv = argv[1:]
+    mode = argv[0] if argv else "grid"
+    if mode == "random":
+        configs = random_configs(int(argv[1]) if len(argv) > 1 else 500)
+        argv = argv[2:]
+    else:
+        configs = grid_configs(DEFAULT_GRID)
+        argv = argv[1:]
+    workers = int(argv[0]) if argv else None
+    rows, throughput = sweep(dataset, configs, truth, workers)
+    print("{} configs, {:.0f} frame-configs/s".format(len(configs), throughput))
+    print("{:>7} {:>7} {:>9} {:>9}  config".format("score", "cones", "obstacles", "waypoints"))
+    for score, cones, obstacles, waypoints, config in rows[:10]:
+        print("{:>7.3f} {:>7.3f} {:>9.3f} {:>9.3f}  {}".format(
+            score, cones, obstacles, waypoints, " ".join("{}={}".format(k, config[k]) for k in PARAMETERS)))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main(sys.argv[1:])
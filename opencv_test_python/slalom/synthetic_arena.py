@@ -0,0 +1,171 @@
+import cv2
+import numpy as np
+import json
+import sys
+
+from .measurements import CONE_WIDTH, JENGA_LENGTH, JENGA_WIDTH
+
+# colours the default HSV thresholds (SMin 81, VMin 95) pick up, the floor stays below them
+FLOOR_COLOR = (120, 125, 130)
+CONE_COLOR = (0, 120, 255)
+JENGA_COLOR = (60, 170, 230)
+
+# course layout in cone sizes, chosen so the nearest cone of every cone is its gate partner and the gate width is
+# inside the default DistMin..DistMax (4..7 cone sizes)
+GATE_WIDTH = 5.5
+GATE_SPACING = 9
+ROW_SPACING = GATE_WIDTH + 9
+MARGIN = 4
+
+
+class ArenaTruth:
+    """
+    Ground truth of a generated arena, all positions in image pixels
+    """
+
+    def __init__(self, cone_size, mm_per_px):
+        self.cone_size = cone_size
+        self.mm_per_px = mm_per_px
+        self.cones = []  # (center_x, center_y)
+        self.gates = []  # (cone index, cone index) in driving order
+        self.waypoints = []  # gate centers in driving order
+        self.obstacles = []  # ((center_x, center_y), (length, width), angle) like cv2.minAreaRect
+
+    def to_dict(self):
+        return {
+            "cone_size": self.cone_size,
+            "mm_per_px": self.mm_per_px,
+            "cones": self.cones,
+            "gates": self.gates,
+            "waypoints": self.waypoints,
+            "obstacles": self.obstacles,
+        }
+
+
+def course_spacing(spacing=1.0):
+    """
+    :param spacing: factor on the free space between gates and between rows
+    :return: (gate spacing, row spacing) in cone sizes
+    """
+    return GATE_SPACING * spacing, GATE_WIDTH + (ROW_SPACING - GATE_WIDTH) * spacing
+
+
+def course_capacity(resolution, cone_size, spacing=1.0):
+    """
+    :return: (gates per row, rows) that fit into the resolution
+    """
+    width, height = resolution
+    gate_spacing, row_spacing = course_spacing(spacing)
+    per_row = int((width / cone_size - 2 * MARGIN) // gate_spacing) + 1
+    rows = int((height / cone_size - 2 * MARGIN - GATE_WIDTH) // row_spacing) + 1
+    return max(per_row, 0), max(rows, 0)
+
+
+def generate_arena(n_gates=4, resolution=(640, 480), n_obstacles=None, noise=0.0, cone_size=None, seed=None,
+                   spacing=1.0):
+    """
+    Render a top-down slalom arena: n_gates cone pairs laid out in serpentine rows plus Jenga block obstacles between
+    the gates.
+
+    :param n_gates: number of cone pairs
+    :param resolution: (width, height) in pixels
+    :param n_obstacles: number of Jenga blocks, defaults to one between every two gates
+    :param noise: standard deviation of the gaussian pixel noise, plus a matching amount of small speckles
+    :param cone_size: cone side in pixels, defaults to the largest size that fits all gates
+    :param seed: random seed
+    :param spacing: factor on the free space between gates and between rows, larger spreads the course out
+    :return: (BGR image, ArenaTruth)
+    """
+    rng = np.random.RandomState(seed)
+    width, height = resolution
+    if cone_size is None:
+        cone_size = 64
+        while cone_size > 8:
+            per_row, rows = course_capacity(resolution, cone_size, spacing)
+            if per_row * rows >= n_gates:
+                break
+            cone_size -= 1
+    per_row, rows = course_capacity(resolution, cone_size, spacing)
+    gate_spacing, row_spacing = course_spacing(spacing)
+    if per_row * rows < n_gates:
+        raise ValueError("{} gates do not fit into {}x{} with cone size {}".format(n_gates, width, height, cone_size))
+    if n_obstacles is None:
+        n_obstacles = max(n_gates - 1, 0)
+
+    truth = ArenaTruth(cone_size, CONE_WIDTH / float(cone_size))
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[:] = FLOOR_COLOR
+
+    c = float(cone_size)
+    for i in range(n_gates):
+        row, index = divmod(i, per_row)
+        if row % 2 == 1:
+            index = per_row - 1 - index  # serpentine
+        x = (MARGIN + 0.5 + index * gate_spacing) * c
+        y_center = (MARGIN + GATE_WIDTH / 2 + row * row_spacing) * c
+        # alternate the gates up and down for a slalom
+        y_center += (1 if i % 2 else -1) * c
+        y_center = min(max(y_center, (MARGIN + GATE_WIDTH / 2) * c), height - (MARGIN + GATE_WIDTH / 2) * c)
+        pair = []
+        for side in (-1, 1):
+            cx, cy = x, y_center + side * GATE_WIDTH * c / 2
+            cv2.rectangle(img, (int(round(cx - c / 2)), int(round(cy - c / 2))),
+                          (int(round(cx + c / 2)) - 1, int(round(cy + c / 2)) - 1), CONE_COLOR, -1)
+            pair.append(len(truth.cones))
+            truth.cones.append((cx, cy))
+        truth.gates.append(tuple(pair))
+        truth.waypoints.append((x, y_center))
+
+    length = JENGA_LENGTH / truth.mm_per_px
+    block_width = JENGA_WIDTH / truth.mm_per_px
+    attempts = 0
+    while len(truth.obstacles) < n_obstacles and attempts < 100 * (n_obstacles + 1):
+        attempts += 1
+        if n_gates > 1:
+            # somewhere between two consecutive gates, off the direct line
+            a = rng.randint(n_gates - 1)
+            (x1, y1), (x2, y2) = truth.waypoints[a], truth.waypoints[a + 1]
+            t = rng.uniform(0.3, 0.7)
+            cx = x1 + t * (x2 - x1) + rng.uniform(-1, 1) * c
+            cy = y1 + t * (y2 - y1) + rng.choice((-1, 1)) * rng.uniform(2, 4) * c
+        else:
+            cx, cy = rng.uniform(0, width), rng.uniform(0, height)
+        angle = float(rng.choice((0, 90)) + rng.uniform(-20, 20))
+        rect = ((cx, cy), (length, block_width), angle)
+        box = cv2.boxPoints(rect)
+        if box[:, 0].min() < 0 or box[:, 1].min() < 0 or box[:, 0].max() >= width or box[:, 1].max() >= height:
+            continue
+        # keep clear of cones, other blocks and the gates themselves
+        clearance = length / 2 + 1.5 * c
+        if any(np.hypot(cx - x, cy - y) < clearance for x, y in truth.cones + truth.waypoints):
+            continue
+        if any(np.hypot(cx - o[0][0], cy - o[0][1]) < length + c for o in truth.obstacles):
+            continue
+        cv2.fillConvexPoly(img, np.intp(np.round(box)), JENGA_COLOR)
+        truth.obstacles.append(((cx, cy), (length, block_width), angle))
+
+    if noise > 0:
+        noisy = img.astype(np.float32) + rng.normal(0, noise, img.shape).astype(np.float32)
+        img = np.clip(noisy, 0, 255).astype(np.uint8)
+        # speckles a little larger than single pixels, most of them below the NoiseFilter size
+        speckles = int(noise * width * height / 20000)
+        for _ in range(speckles):
+            x, y = rng.randint(width), rng.randint(height)
+            r = rng.randint(1, 3)
+            cv2.circle(img, (x, y), r, tuple(int(v) for v in rng.randint(0, 256, 3)), -1)
+
+    return img, truth
+
+
+if __name__ == "__main__":
+    if len(sys.argv) <= 1:
+        print("Usage: python -m slalom.synthetic_arena <OutputImagePath> [gates] [width] [height] [noise] [seed]")
+        exit()
+    gates = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    resolution = (int(sys.argv[3]) if len(sys.argv) > 3 else 640, int(sys.argv[4]) if len(sys.argv) > 4 else 480)
+    noise = float(sys.argv[5]) if len(sys.argv) > 5 else 0.0
+    seed = int(sys.argv[6]) if len(sys.argv) > 6 else None
+    image, arena = generate_arena(gates, resolution, noise=noise, seed=seed)
+    cv2.imwrite(sys.argv[1], image)
+    with open(sys.argv[1] + ".json", "w") as f:
+        json.dump(arena.to_dict(), f, indent=2)
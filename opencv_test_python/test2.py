@@ -1,8 +1,9 @@
 import cv2
 import numpy as np
+from slalom.mjpeg_stream import MJPEGStream
 
 #cap = cv2.VideoCapture(0)
-cap = cv2.VideoCapture("http://192.168.0.101:4747/mjpegfeed")
+cap = MJPEGStream("http://192.168.0.101:4747/mjpegfeed").start()
 
 def nothing(x):
     pass
@@ -31,7 +32,9 @@ phMin = psMin = pvMin = phMax = psMax = pvMax = 0
 
 while (1):
 
-    _, frame = cap.read()
+    ret, frame = cap.read()
+    if not ret:
+        continue
 
     # converting to HSV
     hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
@@ -223,14 +223,6 @@ class Grid:
                                                                                      slot.top_left_y + slot.height),
                                   (255, 255, 255), bWidth)
 
-# Check if filename is passed
-if len(sys.argv) <= 1:
-    print("Usage: python hsvThresholder.py <ImageFilePath>")
-    exit()
-
-# Create a black image, a window
-img = cv2.imread(sys.argv[1])
-
 
 def create_windows():
     cv2.namedWindow('image')
@@ -265,11 +257,6 @@ def create_windows():
     cv2.setTrackbarPos('SMin', 'controls', 81)
     cv2.setTrackbarPos('VMin', 'controls', 95)
 
-create_windows()
-# Initialize to check if HSV min/max value changes
-hMin = sMin = vMin = hMax = sMax = vMax = 0
-phMin = psMin = pvMin = phMax = psMax = pvMax = 0
-
 
 def detect_cones_and_obstacles(contours):
     min_size = cv2.getTrackbarPos('NoiseFilter', 'controls')
@@ -327,157 +314,177 @@ def get_cone_pairs(cones, min, max):
                 pairs.append((cone, best_cone))
     return pairs
 
-# Output Image to display
-output = img
-while 1:
-    temp = img.copy()
-
-    # get current positions of all trackbars
-    hMin = cv2.getTrackbarPos('HMin', 'controls')
-    sMin = cv2.getTrackbarPos('SMin', 'controls')
-    vMin = cv2.getTrackbarPos('VMin', 'controls')
-
-    hMax = cv2.getTrackbarPos('HMax', 'controls')
-    sMax = cv2.getTrackbarPos('SMax', 'controls')
-    vMax = cv2.getTrackbarPos('VMax', 'controls')
-
-    dilSize = cv2.getTrackbarPos('Dilate', 'controls')
-    eroSize = cv2.getTrackbarPos('Erode', 'controls')
-    bWidth = cv2.getTrackbarPos('Border_Width', 'controls')
-    dist_max = cv2.getTrackbarPos('DistMax', 'controls')
-    dist_min = cv2.getTrackbarPos('DistMin', 'controls')
-    draw_grid = cv2.getTrackbarPos('DrawGrid', 'controls') == 1
-    border_mode = cv2.getTrackbarPos('Border_Mode', 'controls')
-
-    # Set minimum and max HSV values to display
-    lower = np.array([hMin, sMin, vMin])
-    upper = np.array([hMax, sMax, vMax])
-
-    # Create HSV Image and threshold into a range.
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-    mask = cv2.inRange(hsv, lower, upper)
-    output = cv2.bitwise_and(img, img, mask=mask)
-
-    dil_kernel = np.ones((dilSize, dilSize), np.uint8)
-    ero_kernel = np.ones((eroSize, eroSize), np.uint8)
-
-    if eroSize > 0:
-        output = cv2.erode(output, dil_kernel, iterations=1)
-    if dilSize > 0:
-        output = cv2.dilate(output, ero_kernel, iterations=1)
-
-    h, s, v = cv2.split(output)
-    im2, contours, hierarchy = cv2.findContours(v, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
-
-    cones, obstacles = detect_cones_and_obstacles(contours)
-
-    # calculate average poller size
-    average_cone_size = 0
-    if len(cones) > 0:
-        for cone in cones:
-            cone_rect = cv2.minAreaRect(cone.contour)
-            average_cone_size += (cone.width + cone.height) / 2
-        average_cone_size = average_cone_size / len(cones)
-
-    MAX_POLLER_DIST = dist_max*average_cone_size
-    MIN_POLLER_DIST = dist_min*average_cone_size
-
-
-    def sort_contours(cnts, method="left-to-right"):
-        # initialize the reverse flag and sort index
-        reverse = False
-        i = 0
 
-        # handle if we need to sort in reverse
-        if method == "right-to-left" or method == "bottom-to-top":
-            reverse = True
-
-        # handle if we are sorting against the y-coordinate rather than
-        # the x-coordinate of the bounding box
-        if method == "top-to-bottom" or method == "bottom-to-top":
-            i = 1
-
-        # construct the list of bounding boxes and sort them from top to
-        # bottom
-        boundingBoxes = [cv2.boundingRect(c.contour) for c in cnts]
-        (cnts, boundingBoxes) = zip(*sorted(zip(cnts, boundingBoxes),
-                                            key=lambda b: b[1][i], reverse=reverse))
+def main():
+    global bWidth
+    # Check if filename is passed
+    if len(sys.argv) <= 1:
+        print("Usage: python hsvThresholder.py <ImageFilePath>")
+        exit()
+
+    # Create a black image, a window
+    img = cv2.imread(sys.argv[1])
+
+    create_windows()
+    # Initialize to check if HSV min/max value changes
+    hMin = sMin = vMin = hMax = sMax = vMax = 0
+    phMin = psMin = pvMin = phMax = psMax = pvMax = 0
+
+    # Output Image to display
+    output = img
+    while 1:
+        temp = img.copy()
+
+        # get current positions of all trackbars
+        hMin = cv2.getTrackbarPos('HMin', 'controls')
+        sMin = cv2.getTrackbarPos('SMin', 'controls')
+        vMin = cv2.getTrackbarPos('VMin', 'controls')
+
+        hMax = cv2.getTrackbarPos('HMax', 'controls')
+        sMax = cv2.getTrackbarPos('SMax', 'controls')
+        vMax = cv2.getTrackbarPos('VMax', 'controls')
+
+        dilSize = cv2.getTrackbarPos('Dilate', 'controls')
+        eroSize = cv2.getTrackbarPos('Erode', 'controls')
+        bWidth = cv2.getTrackbarPos('Border_Width', 'controls')
+        dist_max = cv2.getTrackbarPos('DistMax', 'controls')
+        dist_min = cv2.getTrackbarPos('DistMin', 'controls')
+        draw_grid = cv2.getTrackbarPos('DrawGrid', 'controls') == 1
+        border_mode = cv2.getTrackbarPos('Border_Mode', 'controls')
+
+        # Set minimum and max HSV values to display
+        lower = np.array([hMin, sMin, vMin])
+        upper = np.array([hMax, sMax, vMax])
+
+        # Create HSV Image and threshold into a range.
+        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+        mask = cv2.inRange(hsv, lower, upper)
+        output = cv2.bitwise_and(img, img, mask=mask)
+
+        dil_kernel = np.ones((dilSize, dilSize), np.uint8)
+        ero_kernel = np.ones((eroSize, eroSize), np.uint8)
+
+        if eroSize > 0:
+            output = cv2.erode(output, dil_kernel, iterations=1)
+        if dilSize > 0:
+            output = cv2.dilate(output, ero_kernel, iterations=1)
+
+        h, s, v = cv2.split(output)
+        im2, contours, hierarchy = cv2.findContours(v, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+
+        cones, obstacles = detect_cones_and_obstacles(contours)
+
+        # calculate average poller size
+        average_cone_size = 0
+        if len(cones) > 0:
+            for cone in cones:
+                cone_rect = cv2.minAreaRect(cone.contour)
+                average_cone_size += (cone.width + cone.height) / 2
+            average_cone_size = average_cone_size / len(cones)
 
-        # return the list of sorted contours and bounding boxes
-        return cnts, boundingBoxes
+        MAX_POLLER_DIST = dist_max*average_cone_size
+        MIN_POLLER_DIST = dist_min*average_cone_size
 
 
+        def sort_contours(cnts, method="left-to-right"):
+            # initialize the reverse flag and sort index
+            reverse = False
+            i = 0
 
-    # compare every unused cone with every other unused cone for gates
-    pairs = get_cone_pairs(cones, MIN_POLLER_DIST, MAX_POLLER_DIST)
+            # handle if we need to sort in reverse
+            if method == "right-to-left" or method == "bottom-to-top":
+                reverse = True
 
-    def draw_border(rectangle, color):
-        x, y = rectangle.get_center_int()
-        box = cv2.boxPoints(((x, y), (rectangle.width, rectangle.height), rectangle.rotation))
-        box = np.int0(box)
-        im = cv2.drawContours(temp, [box], 0, color, bWidth)
+            # handle if we are sorting against the y-coordinate rather than
+            # the x-coordinate of the bounding box
+            if method == "top-to-bottom" or method == "bottom-to-top":
+                i = 1
 
-    # draw all the things!
-    for cone in cones:
-        draw_border(cone, (0, 255, 0))
+            # construct the list of bounding boxes and sort them from top to
+            # bottom
+            boundingBoxes = [cv2.boundingRect(c.contour) for c in cnts]
+            (cnts, boundingBoxes) = zip(*sorted(zip(cnts, boundingBoxes),
+                                                key=lambda b: b[1][i], reverse=reverse))
 
-    for obstacle in obstacles:
-        draw_border(obstacle, (0, 0, 255))
+            # return the list of sorted contours and bounding boxes
+            return cnts, boundingBoxes
 
-    for pair in pairs:
-        draw_border(pair[0], (255, 255, 0))
-        draw_border(pair[1], (255, 255, 0))
-        cv2.line(temp, pair[0].get_center_int(), pair[1].get_center_int(), (255, 255, 0), bWidth)
 
-    if len(cones) > 0 or len(obstacles) > 0:
-        objects = cones + obstacles
-        contours, boxes = sort_contours(cones)
-        box_left = boxes[0]
-        box_right = boxes[len(boxes)-1]
-        contours, boxes = sort_contours(objects, "top-to-bottom")
-        box_top = boxes[0]
-        box_bottom = boxes[len(boxes)-1]
 
-        left = box_left[0]
-        right = box_right[0] + box_right[2]
-        top = box_top[1]
-        bottom = box_bottom[1] + box_bottom[3]
+        # compare every unused cone with every other unused cone for gates
+        pairs = get_cone_pairs(cones, MIN_POLLER_DIST, MAX_POLLER_DIST)
 
-        if draw_grid:
+        def draw_border(rectangle, color):
+            x, y = rectangle.get_center_int()
+            box = cv2.boxPoints(((x, y), (rectangle.width, rectangle.height), rectangle.rotation))
+            box = np.int0(box)
+            im = cv2.drawContours(temp, [box], 0, color, bWidth)
 
-            grid = Grid(left, top, right-left, bottom-top, int(average_cone_size / 2))
-
-            for cone in cones:
-                grid.add_cone(cone)
-
-            for obstacle in obstacles:
-                grid.add_obstacle(obstacle)
-            # for poller in poller_contours:
-            #     bound = cv2.boundingRect(poller)
-            #     new_rect = Rectangle(bound[0], bound[1], bound[2], bound[3])
-            #     grid.add_obstacle(new_rect)
-
-            # grid.print_grid()
-            grid.draw_grid(temp)
-
-    # Print if there is a change in HSV value
-    if (phMin != hMin) | (psMin != sMin) | (pvMin != vMin) | (phMax != hMax) | (psMax != sMax) | (pvMax != vMax):
-        print("(hMin = %d , sMin = %d, vMin = %d), (hMax = %d , sMax = %d, vMax = %d)" % (hMin, sMin, vMin, hMax, sMax,
-                                                                                          vMax))
-        phMin = hMin
-        psMin = sMin
-        pvMin = vMin
-        phMax = hMax
-        psMax = sMax
-        pvMax = vMax
-
-    # Display output image
-    cv2.imshow('image', temp)
-    cv2.imshow('hsv_image', output)
-
-    WAIT = 200
-    # Wait for 33 milliseconds: 30FPS
-    k = cv2.waitKey(WAIT) & 0xFF
-    if k == 27:
-        break
-cv2.destroyAllWindows()
+        # draw all the things!
+        for cone in cones:
+            draw_border(cone, (0, 255, 0))
+
+        for obstacle in obstacles:
+            draw_border(obstacle, (0, 0, 255))
+
+        for pair in pairs:
+            draw_border(pair[0], (255, 255, 0))
+            draw_border(pair[1], (255, 255, 0))
+            cv2.line(temp, pair[0].get_center_int(), pair[1].get_center_int(), (255, 255, 0), bWidth)
+
+        if len(cones) > 0 or len(obstacles) > 0:
+            objects = cones + obstacles
+            contours, boxes = sort_contours(cones)
+            box_left = boxes[0]
+            box_right = boxes[len(boxes)-1]
+            contours, boxes = sort_contours(objects, "top-to-bottom")
+            box_top = boxes[0]
+            box_bottom = boxes[len(boxes)-1]
+
+            left = box_left[0]
+            right = box_right[0] + box_right[2]
+            top = box_top[1]
+            bottom = box_bottom[1] + box_bottom[3]
+
+            if draw_grid:
+
+                grid = Grid(left, top, right-left, bottom-top, int(average_cone_size / 2))
+
+                for cone in cones:
+                    grid.add_cone(cone)
+
+                for obstacle in obstacles:
+                    grid.add_obstacle(obstacle)
+                # for poller in poller_contours:
+                #     bound = cv2.boundingRect(poller)
+                #     new_rect = Rectangle(bound[0], bound[1], bound[2], bound[3])
+                #     grid.add_obstacle(new_rect)
+
+                # grid.print_grid()
+                grid.draw_grid(temp)
+
+        # Print if there is a change in HSV value
+        if (phMin != hMin) | (psMin != sMin) | (pvMin != vMin) | (phMax != hMax) | (psMax != sMax) | (pvMax != vMax):
+            print("(hMin = %d , sMin = %d, vMin = %d), (hMax = %d , sMax = %d, vMax = %d)" % (hMin, sMin, vMin, hMax, sMax,
+                                                                                              vMax))
+            phMin = hMin
+            psMin = sMin
+            pvMin = vMin
+            phMax = hMax
+            psMax = sMax
+            pvMax = vMax
+
+        # Display output image
+        cv2.imshow('image', temp)
+        cv2.imshow('hsv_image', output)
+
+        WAIT = 200
+        # Wait for 33 milliseconds: 30FPS
+        k = cv2.waitKey(WAIT) & 0xFF
+        if k == 27:
+            break
+    cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import subprocess
+import sys
+
+import numpy as np
+
+from slalom.frame_bus import FrameBus
+
+# a standalone consumer: own interpreter, own resource tracker
+CONSUMER = """
+import sys
+from slalom.frame_bus import FrameBus
+bus = FrameBus.attach(sys.argv[1])
+seq, _, frame = bus.latest()
+assert seq == 1 and frame[0, 0, 0] == 7
+del frame
+bus.close()
+"""
+
+
+def run_consumer(name):
+    return subprocess.run([sys.executable, "-c", CONSUMER, name], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          universal_newlines=True, timeout=60)
+
+
+def test_bus_survives_consumer_exit():
+    bus = FrameBus.create((4, 4, 3), slots=2)
+    try:
+        bus.publish(np.full((4, 4, 3), 7, np.uint8))
+        first = run_consumer(bus.name)
+        assert first.returncode == 0, first.stderr
+        assert "leaked" not in first.stderr
+        # the first consumer's tracker has exited, the segment must still be there
+        second = run_consumer(bus.name)
+        assert second.returncode == 0, second.stderr
+        assert "leaked" not in second.stderr
+    finally:
+        bus.close()
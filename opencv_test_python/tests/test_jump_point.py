@@ -0,0 +1,33 @@
+from slalom.grid import Grid, GridRectangle
+from slalom.jump_point import JumpPointPathfinding
+from slalom.planner import Pathfinding
+
+
+class Counts:
+    def __init__(self):
+        self.counts = {}
+
+    def count(self, name, value):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+
+def plan(planner_class, avoid):
+    grid = Grid(0, 0, 400, 300, 10)
+    for y in range(3, 30):
+        grid.set_occupied(grid.grid[y][20], GridRectangle.OBSTACLE)
+        if avoid:
+            for x in (18, 19, 21, 22):
+                grid.set_occupied(grid.grid[y][x], GridRectangle.AVOID)
+    counts = Counts()
+    planner = planner_class(grid, [], counts)
+    _, cost, finish = planner.search(grid.grid[20][3], grid.grid[20][40])
+    return cost[finish], counts.counts["heap_pushes"], planner
+
+
+def test_jumps_on_uniform_grids_only():
+    cost, pushes, planner = plan(JumpPointPathfinding, avoid=False)
+    astar_cost, astar_pushes, _ = plan(Pathfinding, avoid=False)
+    assert planner.jumps and cost == astar_cost and pushes < astar_pushes / 4
+    # AVOID margins grade the costs, the plain search takes over
+    cost, pushes, planner = plan(JumpPointPathfinding, avoid=True)
+    assert not planner.jumps and (cost, pushes) == plan(Pathfinding, avoid=True)[:2]
@@ -0,0 +1,15 @@
+from slalom.geometry import Rectangle
+from slalom.grid import Grid, GridRectangle
+from slalom.kinematic import KinematicPathfinding
+
+
+def test_legs_end_on_their_waypoint_cells():
+    grid = Grid(0, 0, 300, 200, 10)
+    # a wall to drive around, the second leg has to turn the car around
+    for y in range(4, 14):
+        grid.set_occupied(grid.grid[y][16], GridRectangle.OBSTACLE)
+    waypoints = [Rectangle(x, y, 10, 10) for x, y in ((35, 95), (255, 95), (45, 35), (205, 165), (95, 155), (265, 25))]
+    paths = KinematicPathfinding(grid, waypoints, cell_mm=10).test_path()
+    for (came_from, finish), waypoint in zip(paths, waypoints[1:]):
+        assert finish.coordinates == grid.get_index_from_position(waypoint.x, waypoint.y)
+        assert all(rect.passable() for rect in came_from)
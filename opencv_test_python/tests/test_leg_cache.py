@@ -0,0 +1,42 @@
+from slalom.grid import Grid, GridRectangle
+from slalom.leg_cache import LegCache, cached_search
+from slalom.planner import Pathfinding
+
+START, GOAL = (2, 5), (10, 5)
+
+
+def plan(cache, wall=False, layer=None):
+    grid = Grid(0, 0, 100, 80, 10)
+    if wall:
+        for y in range(grid.columns):
+            grid.set_occupied(grid.grid[y][8], GridRectangle.OBSTACLE)
+    if layer is not None:
+        grid.add_cost_layer(layer)
+    planner = Pathfinding(grid, [], cache={"legs": cache})
+    (sx, sy), (gx, gy) = START, GOAL
+    came_from, _, finish = cached_search(planner, grid.grid[sy][sx], grid.grid[gy][gx])
+    return [rect.coordinates for rect in Pathfinding.reconstruct(came_from, finish)]
+
+
+def test_blocked_leg_is_not_cached():
+    cache = LegCache()
+    blocked = plan(cache, wall=True)
+    assert blocked[-1] != GOAL
+    assert len(cache) == 0
+    # the wall is gone, the next frame has to find the goal
+    assert plan(cache)[-1] == GOAL
+    assert cache.hits == 0
+
+
+def test_cost_layers_are_part_of_the_key():
+    cache = LegCache()
+    straight = plan(cache)
+    assert plan(cache) == straight and cache.hits == 1
+    # expensive row along the straight line, the cached leg must not come back
+    grid = Grid(0, 0, 100, 80, 10)
+    layer = [0] * (grid.rows * grid.columns)
+    for x in range(START[0] + 1, GOAL[0]):
+        layer[GOAL[1] * grid.rows + x] = 1000
+    detour = plan(cache, layer=layer)
+    assert cache.hits == 1
+    assert detour[-1] == GOAL and detour != straight
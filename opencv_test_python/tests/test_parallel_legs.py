@@ -0,0 +1,34 @@
+from slalom.geometry import Rectangle
+from slalom.grid import Grid, GridRectangle
+from slalom.parallel_legs import LegPool
+from slalom.planner import Pathfinding
+from slalom.planners import create_planner
+
+# zigzag through a wall with two gaps, the legs turn at every waypoint
+WAYPOINTS = [(15, 15), (185, 25), (25, 135), (175, 125), (95, 75)]
+
+
+def scene():
+    grid = Grid(0, 0, 200, 150, 10)
+    for y in range(grid.columns):
+        if y not in (3, 12):
+            grid.set_occupied(grid.grid[y][11], GridRectangle.OBSTACLE)
+    return grid, [Rectangle(x, y, 10, 10) for x, y in WAYPOINTS]
+
+
+def legs(paths):
+    return [[(rect.coordinates, rect.direction) for rect in Pathfinding.reconstruct(came_from, finish)]
+            for came_from, finish in paths]
+
+
+def test_parallel_matches_sequential():
+    pool = LegPool(2)
+    try:
+        for name in ("astar", "theta", "quadtree", "kinematic"):
+            grid, waypoints = scene()
+            sequential = create_planner(name, grid, waypoints, cache={}).test_path()
+            grid, waypoints = scene()
+            parallel = pool.test_path(create_planner(name, grid, waypoints, cache={}))
+            assert legs(parallel) == legs(sequential), name
+    finally:
+        pool.close()
@@ -0,0 +1,16 @@
+from slalom.grid import GridRectangle
+from slalom.quadtree import QuadTree
+
+
+def test_merged_blocked_leaves_keep_their_code():
+    rows, columns = 8, 8
+    cells = bytearray(rows * columns)
+    for y in range(4):
+        for x in range(4):
+            cells[y * rows + x] = GridRectangle.CONE
+            cells[y * rows + x + 4] = GridRectangle.CONE if (x, y) != (1, 1) else GridRectangle.OBSTACLE
+    tree = QuadTree(cells, rows, columns)
+    leaves = {(x, y, size): code for x, y, size, code in tree.leaves}
+    assert leaves[(0, 0, 4)] == GridRectangle.CONE
+    assert leaves[(4, 0, 4)] == GridRectangle.OBSTACLE
+    assert leaves[(0, 4, 4)] == leaves[(4, 4, 4)] == GridRectangle.FREE
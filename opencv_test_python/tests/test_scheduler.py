@@ -0,0 +1,17 @@
+from types import SimpleNamespace
+
+from slalom.scheduler import MAX_LEGS, REDUCED_SCALE, FrameScheduler
+
+
+def test_levels_only_touch_what_they_shed():
+    pipeline = SimpleNamespace(draw_grid=True, detection_scale=0.25, max_legs=None, reuse_path=False)
+    scheduler = FrameScheduler()
+    seen = []
+    for level in (0, 3, 4, 1, 0):
+        scheduler.level = level
+        scheduler.apply(pipeline)
+        seen.append((pipeline.draw_grid, pipeline.detection_scale, pipeline.max_legs, pipeline.reuse_path,
+                     pipeline.degradation_level))
+    assert REDUCED_SCALE > 0.25
+    assert seen == [(True, 0.25, None, False, 0), (False, 0.25, MAX_LEGS, False, 3), (False, 0.25, MAX_LEGS, True, 4),
+                    (False, 0.25, None, False, 1), (True, 0.25, None, False, 0)]
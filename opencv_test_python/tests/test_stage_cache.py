@@ -0,0 +1,60 @@
+import numpy as np
+
+from slalom.geometry import Rectangle
+from slalom.grid import Grid, GridRectangle
+from slalom.planner import Pathfinding
+from slalom.planners import create_planner
+from slalom.stage_cache import (StageCache, decode_contours, decode_pairs, decode_paths, decode_rects,
+                                encode_contours, encode_grid, encode_pairs, encode_paths, encode_rects, fill_grid)
+
+
+def scene():
+    grid = Grid(0, 0, 200, 150, 10)
+    for y in range(3, grid.columns):
+        grid.set_occupied(grid.grid[y][11], GridRectangle.OBSTACLE)
+    grid.set_occupied(grid.grid[2][4], GridRectangle.CONE)
+    return grid, [Rectangle(15, 15, 10, 10), Rectangle(185, 125, 10, 10), Rectangle(25, 135, 10, 10)]
+
+
+def stored(cache, arrays):
+    keys = {"plan": "entry"}
+    cache.put("plan", keys, arrays)
+    return cache.get("plan", keys)
+
+
+def legs(paths):
+    return [[(rect.coordinates, rect.direction, getattr(rect, "pose", None))
+             for rect in Pathfinding.reconstruct(came_from, finish)] for came_from, finish in paths]
+
+
+def test_detections_round_trip(tmp_path):
+    cache = StageCache(str(tmp_path))
+    contours = [np.array([[[1, 2]], [[3, 4]], [[5, 6]]], dtype=np.int32), np.array([[[7, 8]]], dtype=np.int32)]
+    cones = [Rectangle(10.5, 20, 4, 5, 30, contours[1]), Rectangle(40, 22.25, 4, 4)]
+    pairs = [(cones[1], cones[0])]
+    entry = stored(cache, dict(encode_contours(contours), rects=encode_rects(cones, contours),
+                               pairs=encode_pairs(pairs, cones)))
+    restored = decode_contours(entry)
+    assert [c.tolist() for c in restored] == [c.tolist() for c in contours]
+    rects = decode_rects(entry["rects"], restored)
+    assert [(r.x, r.y, r.width, r.height, r.rotation) for r in rects] == [
+        (r.x, r.y, r.width, r.height, r.rotation) for r in cones]
+    assert rects[0].contour is restored[1] and rects[1].contour is None
+    assert decode_pairs(entry["pairs"], rects) == [(rects[1], rects[0])]
+    empty = stored(cache, dict(encode_contours([]), rects=encode_rects([])))
+    assert decode_contours(empty) == [] and decode_rects(empty["rects"]) == []
+
+
+def test_grid_and_paths_round_trip(tmp_path):
+    cache = StageCache(str(tmp_path))
+    for name in ("astar", "kinematic"):
+        grid, waypoints = scene()
+        paths = create_planner(name, grid, waypoints, cache={}).test_path()
+        entry = stored(cache, dict(encode_grid(grid, 8.5), **encode_paths(paths)))
+        x, y, width, height, grid_size, spacing = entry["geometry"].tolist()
+        restored = Grid(x, y, width, height, grid_size, spacing)
+        fill_grid(restored, entry["cells"])
+        assert restored.cells == grid.cells and float(entry["cell_mm"]) == 8.5
+        assert legs(decode_paths(entry, restored)) == legs(paths), name
+    entry = stored(cache, encode_paths((None, None)))
+    assert decode_paths(entry, grid) == (None, None)